@@ -12,11 +12,10 @@ import {
   Bookmark,
 } from "lucide-react";
 import {
-  getPostById,
-  getCommentsForPost,
+  getPostPage,
+  getMoreComments,
   createComment,
   createLikedPosts,
-  getLikedPosts,
   UpdateAPIComment,
   // updateComment,
   // deleteComment,
@@ -39,6 +38,9 @@ interface Post {
   image?: string;
   video?: string;
   created_at: string;
+  like_count: number;
+  comment_count: number;
+  liked_by_me: boolean;
 }
 
 interface Comment {
@@ -57,6 +59,7 @@ export default function PostDetail() {
   const [newComment, setNewComment] = useState("");
   const [liked, setLiked] = useState(false);
   const [likeCount, setLikeCount] = useState(0);
+  const [nextComments, setNextComments] = useState<string | null>(null);
   const [loading, setLoading] = useState(true);
   const [submitting, setSubmitting] = useState(false);
 
@@ -81,16 +84,19 @@ export default function PostDetail() {
     setCurrentUser(username);
 
     if (postId) {
-      fetchPostData();
-      fetchComments();
-      fetchLikes();
+      fetchPage();
     }
   }, [postId]);
 
-  const fetchPostData = async () => {
+  // post, like state and first page of comments come from one request
+  const fetchPage = async () => {
     try {
-      const res = await getPostById(postId!);
-      setPost(res.data);
+      const res = await getPostPage(postId!);
+      setPost(res.data.post);
+      setLiked(res.data.post.liked_by_me);
+      setLikeCount(res.data.post.like_count);
+      dispatch(setcomments(res.data.comments.results));
+      setNextComments(res.data.comments.next);
     } catch (error) {
       console.error("Failed to fetch post:", error);
       toast.error("Failed to load post");
@@ -100,35 +106,26 @@ export default function PostDetail() {
     }
   };
 
-  const fetchComments = async () => {
+  const fetchMoreComments = async () => {
+    if (!nextComments) return;
     try {
-      const res = await getCommentsForPost(postId!);
-      dispatch(setcomments(res.data));
+      const res = await getMoreComments(nextComments);
+      dispatch(setcomments([...comments, ...res.data.results]));
+      setNextComments(res.data.next);
     } catch (error) {
       console.error("Failed to fetch comments:", error);
     }
   };
 
-  const fetchLikes = async () => {
-    try {
-      const res = await getLikedPosts(postId!);
-      if (res.data && Array.isArray(res.data)) {
-        setLikeCount(res.data.length);
-        setLiked(res.data.some((like: any) => like.user === currentUser));
-      }
-    } catch (error) {
-      console.error("Failed to fetch likes:", error);
-    }
-  };
-
   const handleToggleLike = async () => {
     const wasLiked = liked;
     setLiked(!liked);
     setLikeCount((prev) => (wasLiked ? prev - 1 : prev + 1));
 
     try {
-      await createLikedPosts(postId!);
-      await fetchLikes();
+      // the toggle answers 201 when it liked and 200 when it unliked
+      const res = await createLikedPosts(postId!);
+      setLiked(res.status === 201);
     } catch (error) {
       setLiked(wasLiked);
       setLikeCount((prev) => (wasLiked ? prev + 1 : prev - 1));
@@ -144,7 +141,7 @@ export default function PostDetail() {
     try {
       await createComment({ message: newComment, post: postId });
       setNewComment("");
-      await fetchComments();
+      await fetchPage();
       toast.success("Comment added successfully");
     } catch (error) {
       console.error("Failed to add comment:", error);
@@ -186,7 +183,7 @@ export default function PostDetail() {
     if (!deletingCommentId) return;
     try {
       // await deleteComment(deletingCommentId);
-      await fetchComments();
+      await fetchPage();
       toast.success("Comment deleted successfully");
       setIsDeleteModalOpen(false);
       setDeletingCommentId(null);
@@ -343,7 +340,7 @@ export default function PostDetail() {
 
             <div className="flex items-center gap-2 text-neutral-400">
               <MessageCircle className="w-5 h-5" />
-              <span className="text-sm font-medium">{comments.length}</span>
+              <span className="text-sm font-medium">{post.comment_count}</span>
             </div>
 
             <button className="p-2 text-neutral-400 hover:bg-neutral-800 hover:text-white rounded-full transition-colors">
@@ -359,7 +356,7 @@ export default function PostDetail() {
         {/* Comments Section */}
         <div className="p-4">
           <h2 className="text-lg font-bold mb-4 text-white">
-            Comments ({comments.length})
+            Comments ({post.comment_count})
           </h2>
 
           {/* Add Comment Form */}
@@ -449,6 +446,15 @@ export default function PostDetail() {
               ))
             )}
           </div>
+
+          {nextComments && (
+            <button
+              onClick={fetchMoreComments}
+              className="w-full mt-4 py-2 text-sky-500 hover:text-sky-400 text-sm font-medium transition-colors"
+            >
+              Load more comments
+            </button>
+          )}
         </div>
 
         {/* Edit Comment Modal */}
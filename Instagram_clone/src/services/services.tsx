@@ -163,9 +163,20 @@ export const createLikedPosts = async (id: any) => {
 
 // Add these functions to your existing services
 
-export const getPostById = async (id: string) => {
+// the post with the viewer's like state and its first page of comments, in one request
+export const getPostPage = async (id: string) => {
   try {
-    const res = await API.get(`/post/${id}/`);
+    const res = await API.get(`/post/${id}/page/`);
+    return res;
+  } catch (err) {
+    throw err;
+  }
+};
+
+// follows the `next` link of a post page's comments
+export const getMoreComments = async (next: string) => {
+  try {
+    const res = await API.get(next);
     return res;
   } catch (err) {
     throw err;
@@ -1,9 +1,44 @@
 from django.contrib import admin
-from .models import Post,Comment,Likes,CustomUser,Follow
+from . import deletion
+from .models import Post,Comment,Likes,CustomUser,Follow,Deletion
 # Register your models here.
-admin.site.register(Post)
+
+
+class SoftDeleteAdmin(admin.ModelAdmin):
+    """Deletes through api/deletion.py: hidden at once, the related rows are reaped in the background"""
+
+    # the api/deletion.py function for this model, set by each subclass
+    soft_delete = None
+
+    def get_deleted_objects(self, objs, request):
+        # the stock confirmation page collects every related row into memory to list it
+        return [str(obj) for obj in objs], {}, set(), []
+
+    def delete_model(self, request, obj):
+        self.soft_delete(obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            self.soft_delete(obj)
+
+
+class PostAdmin(SoftDeleteAdmin):
+    soft_delete = staticmethod(deletion.delete_post)
+
+
+class CustomUserAdmin(SoftDeleteAdmin):
+    soft_delete = staticmethod(deletion.delete_user)
+
+
+class DeletionAdmin(admin.ModelAdmin):
+    list_display = ("target", "target_id", "requested_at", "step", "deleted_rows", "finished_at")
+    list_filter = ("target",)
+    readonly_fields = list_display
+
+
+admin.site.register(Post, PostAdmin)
 admin.site.register(Comment)
 admin.site.register(Likes)
-admin.site.register(CustomUser)
+admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(Follow)
-
+admin.site.register(Deletion, DeletionAdmin)
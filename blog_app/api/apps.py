@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # registers the timeline, search index and detail cache receivers
+        from . import signals  # noqa: F401
+        from . import metrics
+
+        # times serializer .data for the per-request metrics
+        metrics.install()
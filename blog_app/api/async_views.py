@@ -0,0 +1,165 @@
+"""
+Native async GET handlers for the hot read endpoints, served under ASGI.
+
+Under ASGI every DRF APIView runs in a worker thread through sync_to_async.
+blog_app/urls_async.py, the URLconf asgi.py selects, routes the GETs of the
+post list, post detail, comment threads, likes and feed here instead. The
+user comes from api.authentication and rows from the async ORM. The page-wide
+lookups (viewer state, comment previews) are fetched up front and lists are
+built by api/fastpath.py like the sync views do, so rendering never touches
+the database. Bodies and headers match the sync views byte for byte.
+
+Everything else still goes to the sync view in a thread: other methods,
+?page=N (page-number mode needs a COUNT) and browsers asking for the
+browsable API. Media URLs are built in-process (api/media.py: string work
+behind an LRU) and uploads run on the ingest pool, so no read waits on
+outbound HTTP.
+"""
+from asgiref.sync import sync_to_async
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
+from django.shortcuts import aget_object_or_404
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAuthenticated
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import exception_handler
+
+from . import comments, fastpath, feed
+from .authentication import CachedJWTAuthentication, aauthenticate
+from .caching import PostListCache, PostValidators
+from .models import Likes, Post
+from .pagination import KeysetPagination, decode_cursor, encode_cursor, use_page_numbers
+from .renderers import FastJSONRenderer
+from .serializers import PostSerializer
+from .viewer import ViewerState, aviewer_state, aviewer_state_for_rows
+
+
+def _json(data, status=200, headers=None):
+    return HttpResponse(FastJSONRenderer().render(data), status=status, headers=headers,
+                        content_type="application/json")
+
+
+def _error(exc, request):
+    """The response DRF's exception handling would give for exc"""
+    if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+        exc.auth_header = CachedJWTAuthentication().authenticate_header(request)
+    response = exception_handler(exc, {})
+    headers = {"WWW-Authenticate": response["WWW-Authenticate"]} if response.has_header("WWW-Authenticate") else None
+    return _json(response.data, response.status_code, headers)
+
+
+def _wants_browsable_api(request):
+    return "text/html" in request.headers.get("Accept", "") or request.GET.get("format") == "api"
+
+
+def read_view(sync_view, handler):
+    """A view answering GET with the async handler and anything else with the DRF sync_view"""
+    instance = sync_view.cls(**sync_view.initkwargs)
+    # setup() is what adds HEAD
+    instance.setup(None)
+    allow = ", ".join(instance.allowed_methods)
+    fallback = sync_to_async(sync_view)
+
+    @csrf_exempt
+    async def view(request, *args, **kwargs):
+        drf_request = Request(request)
+        if request.method != "GET" or use_page_numbers(drf_request) or _wants_browsable_api(request):
+            return await fallback(request, *args, **kwargs)
+        try:
+            drf_request.user, drf_request.auth = await aauthenticate(request)
+            response = await handler(drf_request, *args, **kwargs)
+        except (APIException, Http404, PermissionDenied) as exc:
+            response = _error(exc, request)
+        # what APIView.finalize_response adds
+        response["Allow"] = allow
+        patch_vary_headers(response, ("Accept",))
+        return response
+
+    return view
+
+
+async def _post_data(request, rows, viewer=None):
+    """fastpath.post_data with everything it needs fetched on the async ORM"""
+    if viewer is None:
+        viewer = await aviewer_state_for_rows(request.user, rows)
+    return fastpath.post_data(rows, viewer, await fastpath.apreview_rows(rows, comments.preview_count(request)))
+
+
+async def post_list(request):
+    posts = fastpath.post_rows(Post.objects.order_by("-created_at", "-id"))
+    author = request.query_params.get("author")
+    if author:
+        posts = posts.filter(author__username=author)
+    paginator = KeysetPagination()
+    if not PostListCache.cacheable(request):
+        rows = await paginator.apaginate_queryset(posts, request)
+        return _json(await _post_data(request, rows), headers=paginator.get_link_header())
+    listing = await PostListCache.acreate(author, comments.preview_count(request))
+
+    async def render():
+        stamps = await listing.astamp(await KeysetPagination().apaginate_queryset(posts.values("id", "author_id"), request))
+        rows = await paginator.apaginate_queryset(posts, request)
+        return listing.entry(rows, await _post_data(request, rows, ViewerState()), paginator, stamps)
+
+    entry = await listing.aget_or_render(render)
+    viewer = await aviewer_state(request.user, [post["id"] for post in entry["data"]], entry["authors"])
+    return _json(listing.with_viewer(entry, viewer), headers=listing.link_header(entry, request))
+
+
+async def post_detail(request, pk):
+    meta = await Post.objects.filter(pk=pk).values("author_id", "updated_at").afirst()
+    if meta is None:
+        raise Http404
+    validators = await PostValidators.acreate(pk, meta["author_id"], meta["updated_at"], request.user.id)
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+
+    async def render():
+        post = await aget_object_or_404(Post.objects.select_related("author"), pk=pk)
+        return PostSerializer(post, context={"viewer_state": ViewerState()}).data
+
+    data = dict(await validators.aget_or_render(render))
+    viewer = await aviewer_state(request.user, [pk], [meta["author_id"]])
+    data["liked_by_me"] = viewer.liked(pk)
+    data["author_followed_by_me"] = viewer.follows(meta["author_id"])
+    return validators.add_headers(_json(data))
+
+
+async def post_comments(request, pk):
+    paginator = KeysetPagination()
+    rows = await paginator.apaginate_queryset(fastpath.comment_rows(comments.thread(pk)), request)
+    if not rows and not request.query_params.get("cursor") and not await Post.objects.filter(pk=pk).aexists():
+        raise Http404
+    return _json({"next": paginator.get_next_link(), "previous": None, "results": fastpath.comment_data(rows)})
+
+
+async def comment_list(request):
+    post_id = request.query_params.get("post")
+    data = comments.thread(post_id) if post_id else comments.recent()
+    paginator = KeysetPagination()
+    rows = await paginator.apaginate_queryset(fastpath.comment_rows(data), request)
+    return _json(fastpath.comment_data(rows), headers=paginator.get_link_header())
+
+
+async def post_likes(request, pk):
+    post = await aget_object_or_404(Post.objects.select_related("author").only("id", "content", "author__username"), pk=pk)
+    likes = fastpath.like_rows(
+        Likes.objects.filter(post=post, user__deleted_at__isnull=True).order_by("-created_at", "-id")
+    )
+    return _json(fastpath.like_data([like async for like in likes], post))
+
+
+async def home_feed(request):
+    if not request.user.is_authenticated:
+        raise NotAuthenticated()
+    cursor = request.query_params.get("cursor")
+    cursor = decode_cursor(cursor) if cursor else None
+    rows, last, has_more = await feed.aread_feed(request.user, cursor, api_settings.PAGE_SIZE, fastpath.post_rows)
+    next_url = None
+    if has_more:
+        next_url = replace_query_param(request.build_absolute_uri(), "cursor", encode_cursor(*last))
+    return _json({"next": next_url, "results": await _post_data(request, rows)})
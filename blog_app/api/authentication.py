@@ -0,0 +1,180 @@
+"""
+JWT authentication with a cached user row, for the DRF views and the async
+read views (api/async_views.py).
+
+simplejwt's JWTAuthentication loads the token's user by primary key on every
+request. CachedJWTAuthentication keeps the user in the default cache for
+AUTH_USER_CACHE_SECONDS instead, next to a per-user version stamp that
+signals bump whenever the row changes (password, is_active, profile) and
+relations bumps when follow counts move. An entry is used only while its
+stamp is current; a missing stamp (never set, or evicted) is seeded with
+the time, so no older entry matches it. Fills read the stamp before the row
+and bumps happen after commit, so a change racing a fill can't leave a
+stale user behind. Misses read the primary, never a lagging replica.
+
+The cache holds CACHED_FIELDS, not the pickled row: never the password
+hash, only its digest when CHECK_REVOKE_TOKEN compares tokens against it.
+A hit rebuilds the user with the other fields deferred, so code that reads
+one of them loads it from the database as with .only().
+
+DRF authenticates inside APIView, which is sync only. aauthenticate resolves
+the same users as REST_FRAMEWORK's authentication classes through the async
+cache and ORM, and raises the same exceptions so error bodies match the sync
+views.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .routers import PRIMARY, primary_reads
+
+
+def user_cache_seconds():
+    return getattr(settings, "AUTH_USER_CACHE_SECONDS", 60)
+
+
+def _user_key(user_id):
+    return f"auth-user:{user_id}"
+
+
+def _stamp_key(user_id):
+    return f"auth-user-stamp:{user_id}"
+
+
+# what requests read off request.user: permission checks, UserSerializers
+# on user/ and the viewer state; anything else is loaded when read
+CACHED_FIELDS = (
+    "id", "username", "email", "is_active", "is_staff", "is_superuser", "follower_count", "following_count",
+)
+
+
+def _field_names(model):
+    # from_db wants them in concrete field order
+    return [field.attname for field in model._meta.concrete_fields if field.attname in CACHED_FIELDS]
+
+
+def _password_digest(user):
+    return user.__dict__.get("_password_digest") or get_md5_hash_password(user.password)
+
+
+def _entry(user, stamp):
+    digest = get_md5_hash_password(user.password) if api_settings.CHECK_REVOKE_TOKEN else None
+    return stamp, [getattr(user, name) for name in _field_names(type(user))], digest
+
+
+def touch_user(user_id):
+    """The user's row changed, cached copies are no longer used"""
+    # after commit: a fill that read the old row in between must not carry the new stamp
+    transaction.on_commit(lambda: cache.set(_stamp_key(user_id), time.time(), None))
+
+
+def touch_users(user_ids):
+    """touch_user for many users, one cache round trip"""
+    transaction.on_commit(lambda: cache.set_many(dict.fromkeys(map(_stamp_key, user_ids), time.time()), None))
+
+
+def _seed(user_id):
+    now = time.time()
+    # add: a bump racing the seed wins, and is what the entry is stored under
+    if cache.add(_stamp_key(user_id), now, None):
+        return now
+    return cache.get(_stamp_key(user_id), now)
+
+
+async def _aseed(user_id):
+    now = time.time()
+    if await cache.aadd(_stamp_key(user_id), now, None):
+        return now
+    return await cache.aget(_stamp_key(user_id), now)
+
+
+def _cached(model, user_id, values):
+    """(cached user or None, current stamp or None if it is missing) from a get_many of both keys"""
+    stamp = values.get(_stamp_key(user_id))
+    entry = values.get(_user_key(user_id))
+    if stamp is None or entry is None or entry[0] != stamp:
+        return None, stamp
+    _, fields, digest = entry
+    # as a miss would have loaded it; asking the router would count as a write and pin the request
+    user = model.from_db(PRIMARY, _field_names(model), fields)
+    user._password_digest = digest
+    return user, stamp
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        user_id = self.user_id(validated_token)
+        user, stamp = _cached(self.user_model, user_id, cache.get_many([_user_key(user_id), _stamp_key(user_id)]))
+        if user is None:
+            if stamp is None:
+                stamp = _seed(user_id)
+            with primary_reads():
+                user = self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+            if user is not None:
+                cache.set(_user_key(user_id), _entry(user, stamp), user_cache_seconds())
+        return self.check_user(user, validated_token)
+
+    async def aauthenticate(self, request):
+        """(user, validated token), or None when the request carries no bearer token"""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        """get_user on the async cache API and ORM"""
+        user_id = self.user_id(validated_token)
+        user, stamp = _cached(
+            self.user_model, user_id, await cache.aget_many([_user_key(user_id), _stamp_key(user_id)])
+        )
+        if user is None:
+            if stamp is None:
+                stamp = await _aseed(user_id)
+            with primary_reads():
+                user = await self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).afirst()
+            if user is not None:
+                await cache.aset(_user_key(user_id), _entry(user, stamp), user_cache_seconds())
+        return self.check_user(user, validated_token)
+
+    @staticmethod
+    def user_id(validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+    @staticmethod
+    def check_user(user, validated_token):
+        """JWTAuthentication.get_user's checks on the loaded row"""
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != _password_digest(user):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
+
+
+async def aauthenticate(request):
+    """(user, auth) the way the DRF views would see them: bearer token first, then the session"""
+    result = await CachedJWTAuthentication().aauthenticate(request)
+    if result is not None:
+        return result
+    # reads are safe methods, so SessionAuthentication's CSRF check always passes
+    user = await request.auser()
+    if user is not None and user.is_active:
+        return user, None
+    return AnonymousUser(), None
@@ -0,0 +1,362 @@
+"""
+Rendered-representation caches: PostDetailApi and the first page of posts/.
+
+A post's representation depends on the post row (covered by updated_at), on
+its like/comment counts and on its author's username/profile picture. The
+last two don't touch updated_at, so signals record an invalidation stamp in
+the cache whenever they change, once the change has committed. Follows also
+bump the author stamp, since they flip the viewer's author_followed_by_me.
+The ETag and cache key are built from (post id, updated_at, post stamp,
+author stamp): any change produces a new key, and stale entries simply age
+out. The cached body is rendered without a
+viewer; views overlay the viewer's flags on top.
+
+The first page of posts/ and of each posts/?author=<username> profile is
+cached under a version that creating or deleting a post bumps. The entry
+also records the stamps of the posts and authors on it and is dropped when
+any of them moved on, so likes, comments and edits show up as they do on
+the detail endpoint. ?page=1 (what the web client sends) is the same first
+page and shares the entry.
+
+Stamps and versions never expire, but a culling cache can still evict
+them. A missing one is seeded with the current time rather than read as 0,
+so an eviction can't bring an entry rendered under an older value back.
+
+A miss on a hot key is recomputed once: concurrent misses in the same
+process wait for the first one (single_flight), and other processes wait on
+a lock taken with cache.add, which is atomic on Redis/Memcached. Entries
+are always rendered from the primary database, never a lagging replica.
+"""
+import asyncio
+import hashlib
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.utils.urls import replace_query_param
+
+from .pagination import KeysetPagination, use_page_numbers
+from .routers import primary_reads
+
+DETAIL_TIMEOUT = 60 * 5
+LIST_TIMEOUT = 60
+# longest a process waits for another one to fill a key before computing it itself
+FILL_LOCK_TIMEOUT = 10
+FILL_POLL_SECONDS = 0.05
+
+
+def _post_stamp_key(post_id):
+    return f"post-stamp:{post_id}"
+
+
+def _author_stamp_key(user_id):
+    return f"author-stamp:{user_id}"
+
+
+def _stamps(keys):
+    """Current stamps of keys, seeding missing (never set or evicted) ones"""
+    values = cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        now = time.time()
+        # add: a seed or bump racing this one wins, and is read back instead
+        raced = [key for key in missing if not cache.add(key, now, None)]
+        values.update(dict.fromkeys(missing, now))
+        values.update(cache.get_many(raced) if raced else {})
+    return values
+
+
+async def _astamps(keys):
+    values = await cache.aget_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        now = time.time()
+        raced = [key for key in missing if not await cache.aadd(key, now, None)]
+        values.update(dict.fromkeys(missing, now))
+        values.update(await cache.aget_many(raced) if raced else {})
+    return values
+
+
+def _stamp_after_commit(keys):
+    # after commit, like authentication.touch_user: a fill that read the old
+    # rows in between must not be stored under the new stamp
+    transaction.on_commit(lambda: cache.set_many(dict.fromkeys(keys, time.time()), None))
+
+
+def touch_post(post_id):
+    """Something outside the post row (likes, comments) changed its representation"""
+    _stamp_after_commit([_post_stamp_key(post_id)])
+
+
+def touch_posts(post_ids):
+    """touch_post for many posts, one cache round trip"""
+    _stamp_after_commit([_post_stamp_key(pk) for pk in post_ids])
+
+
+def touch_author(user_id):
+    """Author's username or profile picture may have changed"""
+    _stamp_after_commit([_author_stamp_key(user_id)])
+
+
+def touch_authors(user_ids):
+    """touch_author for many users, one cache round trip"""
+    _stamp_after_commit([_author_stamp_key(pk) for pk in user_ids])
+
+
+def _list_version_key(scope):
+    return f"post-list-version:{scope}"
+
+
+def touch_post_list(author_username=None):
+    """A post was created or deleted: new versions for posts/ and the author's profile listing"""
+    scopes = ["all"] + ([f"author:{author_username}"] if author_username is not None else [])
+    _stamp_after_commit([_list_version_key(scope) for scope in scopes])
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+# (event loop, key) -> task computing it
+_async_flights = {}
+
+
+def _fill(key, compute, timeout, fresh):
+    lock_key = f"fill-lock:{key}"
+    if not cache.add(lock_key, 1, FILL_LOCK_TIMEOUT):
+        # another process is computing it
+        deadline = time.monotonic() + FILL_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(FILL_POLL_SECONDS)
+            value = cache.get(key)
+            if value is not None and fresh(value):
+                return value
+    try:
+        # a lagging replica would otherwise be cached for everyone
+        with primary_reads():
+            value = compute()
+        cache.set(key, value, timeout)
+        return value
+    finally:
+        cache.delete(lock_key)
+
+
+async def _afill(key, acompute, timeout, fresh):
+    lock_key = f"fill-lock:{key}"
+    if not await cache.aadd(lock_key, 1, FILL_LOCK_TIMEOUT):
+        deadline = time.monotonic() + FILL_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(FILL_POLL_SECONDS)
+            value = await cache.aget(key)
+            if value is not None and await fresh(value):
+                return value
+    try:
+        with primary_reads():
+            value = await acompute()
+        await cache.aset(key, value, timeout)
+        return value
+    finally:
+        await cache.adelete(lock_key)
+
+
+def single_flight(key, compute, timeout, fresh=lambda value: True):
+    """
+    The cached value of key, computed by compute() on a miss (or when
+    fresh(value) says it is stale) with at most one computation in flight
+    """
+    value = cache.get(key)
+    if value is not None and fresh(value):
+        return value
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+    try:
+        flight.result = _fill(key, compute, timeout, fresh)
+        return flight.result
+    except BaseException as exc:
+        flight.error = exc
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+async def asingle_flight(key, acompute, timeout, afresh=None):
+    """single_flight for coroutines; afresh is awaited, misses are shared per event loop"""
+    async def fresh(value):
+        return afresh is None or await afresh(value)
+
+    value = await cache.aget(key)
+    if value is not None and await fresh(value):
+        return value
+    flight_key = (asyncio.get_running_loop(), key)
+    task = _async_flights.get(flight_key)
+    if task is None:
+        task = _async_flights[flight_key] = asyncio.ensure_future(_afill(key, acompute, timeout, fresh))
+        task.add_done_callback(lambda done: _async_flights.pop(flight_key, None))
+    # one waiter going away must not cancel the computation for the others
+    return await asyncio.shield(task)
+
+
+class PostValidators:
+    """ETag / Last-Modified for one post, from its cheap metadata row"""
+
+    def __init__(self, post_id, author_id, updated_at, viewer_id=None, stamps=None):
+        if stamps is None:
+            stamps = _stamps([_post_stamp_key(post_id), _author_stamp_key(author_id)])
+        post_stamp = stamps[_post_stamp_key(post_id)]
+        author_stamp = stamps[_author_stamp_key(author_id)]
+        version = f"{post_id}:{updated_at.timestamp()}:{post_stamp}:{author_stamp}"
+        # the cached body is shared, the ETag also covers the viewer's like/follow flags
+        self.cache_key = f"post-detail:{post_id}:{hashlib.md5(version.encode()).hexdigest()}"
+        self.etag = f'"{hashlib.md5(f"{version}:{viewer_id}".encode()).hexdigest()}"'
+        self.last_modified = int(max(updated_at.timestamp(), post_stamp, author_stamp))
+
+    @classmethod
+    async def acreate(cls, post_id, author_id, updated_at, viewer_id=None):
+        """Same as the constructor, reading the stamps through the async cache API"""
+        stamps = await _astamps([_post_stamp_key(post_id), _author_stamp_key(author_id)])
+        return cls(post_id, author_id, updated_at, viewer_id, stamps)
+
+    def not_modified(self, request):
+        """A 304 if the client's copy is current, else None"""
+        response = get_conditional_response(request, etag=self.etag, last_modified=self.last_modified)
+        if response is not None:
+            self.add_headers(response)
+        return response
+
+    def add_headers(self, response):
+        response["ETag"] = self.etag
+        response["Last-Modified"] = http_date(self.last_modified)
+        patch_vary_headers(response, ("Authorization", "Cookie"))
+        return response
+
+    def get_or_render(self, render):
+        return single_flight(self.cache_key, render, DETAIL_TIMEOUT)
+
+    async def aget_or_render(self, arender):
+        return await asingle_flight(self.cache_key, arender, DETAIL_TIMEOUT)
+
+
+def _stamp_keys(post_ids, author_ids):
+    return [_post_stamp_key(pk) for pk in post_ids] + [_author_stamp_key(pk) for pk in sorted(set(author_ids))]
+
+
+def _stamps_digest(keys, stamps):
+    return hashlib.md5(repr([stamps[key] for key in keys]).encode()).hexdigest()
+
+
+class PostListCache:
+    """
+    The first page of posts/ (optionally ?author=<username>), rendered without
+    a viewer. Entries are {"data", "authors", "cursor", "stamps"}: the
+    serialized posts, their author ids (for the viewer overlay), the next
+    page's cursor (the Link header is rebuilt per request, it carries the
+    host) and the digest of the post and author stamps when it was rendered.
+    """
+
+    def __init__(self, author, previews, versions=None):
+        version_key = self._version_key(author)
+        if versions is None:
+            versions = _stamps([version_key])
+        version = f"{version_key}:{versions[version_key]}:{previews}"
+        self.cache_key = f"post-list:{hashlib.md5(version.encode()).hexdigest()}"
+
+    @staticmethod
+    def cacheable(request):
+        """Only the first page is shared, with or without ?page=1; cursors and later pages go to the database"""
+        params = request.query_params
+        return not params.get(KeysetPagination.cursor_query_param) and params.get("page", "1") == "1"
+
+    @staticmethod
+    def _version_key(author):
+        return _list_version_key(f"author:{author}" if author else "all")
+
+    @classmethod
+    async def acreate(cls, author, previews):
+        """Same as the constructor, reading the version through the async cache API"""
+        return cls(author, previews, await _astamps([cls._version_key(author)]))
+
+    @staticmethod
+    def stamp(rows):
+        """
+        Digest of the stamps of a page's posts and authors. Take it from the
+        page's ids before reading the rows that are cached: a like committed
+        after the rows were read but before the stamps would otherwise store
+        the old counts under the new digest, and fresh() would keep serving
+        them. If the page changed in between, the digest covers other keys
+        than the entry and the entry is simply never fresh.
+        """
+        keys = _stamp_keys([row["id"] for row in rows], [row["author_id"] for row in rows])
+        return _stamps_digest(keys, _stamps(keys))
+
+    @staticmethod
+    async def astamp(rows):
+        keys = _stamp_keys([row["id"] for row in rows], [row["author_id"] for row in rows])
+        return _stamps_digest(keys, await _astamps(keys))
+
+    @staticmethod
+    def entry(rows, data, paginator, stamps):
+        return {
+            "data": data, "authors": [row["author_id"] for row in rows],
+            "cursor": paginator.next_cursor(), "stamps": stamps,
+        }
+
+    @staticmethod
+    def _entry_keys(entry):
+        return _stamp_keys([post["id"] for post in entry["data"]], entry["authors"])
+
+    def fresh(self, entry):
+        keys = self._entry_keys(entry)
+        return _stamps_digest(keys, _stamps(keys)) == entry["stamps"]
+
+    async def afresh(self, entry):
+        keys = self._entry_keys(entry)
+        return _stamps_digest(keys, await _astamps(keys)) == entry["stamps"]
+
+    def get_or_render(self, render):
+        return single_flight(self.cache_key, render, LIST_TIMEOUT, self.fresh)
+
+    async def aget_or_render(self, arender):
+        return await asingle_flight(self.cache_key, arender, LIST_TIMEOUT, self.afresh)
+
+    @staticmethod
+    def with_viewer(entry, state):
+        """The cached posts with the viewer's like/follow flags"""
+        data = []
+        for post, author_id in zip(entry["data"], entry["authors"]):
+            post = dict(post)
+            post["liked_by_me"] = state.liked(post["id"])
+            post["author_followed_by_me"] = state.follows(author_id)
+            data.append(post)
+        return data
+
+    @staticmethod
+    def link_header(entry, request):
+        """KeysetPagination.get_link_header for the cached page"""
+        if entry["cursor"] is None:
+            return {}
+        if use_page_numbers(request):
+            # what PageNumberPagination would have linked to
+            next_link = replace_query_param(request.build_absolute_uri(), "page", 2)
+        else:
+            next_link = replace_query_param(
+                request.build_absolute_uri(), KeysetPagination.cursor_query_param, entry["cursor"]
+            )
+        return {"Link": f'<{next_link}>; rel="next"'}
@@ -0,0 +1,84 @@
+"""
+Comment threads and feed-card previews.
+
+Comments are mostly read per post: a thread page is a range scan over the
+(post, created_at, id) index, newest first, and previews for a page of posts
+come from one query over the latest N rows of each post. The global listing
+(GET /comments/ without ?post=) walks the (created_at, id) index the same
+way. Comments on soft-deleted posts and by soft-deleted users
+(api/deletion.py) are left out until the reaper removes them.
+"""
+from asgiref.sync import sync_to_async
+from django.db.models.expressions import RawSQL
+
+from .models import Comment
+
+PREVIEW_MAX = 5
+
+
+def thread(post_id):
+    """One post's comments, ready for KeysetPagination"""
+    return Comment.objects.filter(
+        post_id=post_id, post__deleted_at__isnull=True, user__deleted_at__isnull=True
+    ).select_related("user")
+
+
+def recent():
+    """Every post's comments, ready for KeysetPagination"""
+    return Comment.objects.filter(post__deleted_at__isnull=True, user__deleted_at__isnull=True).select_related("user")
+
+
+def preview_count(request):
+    """How many latest comments to embed per post, from ?comments=N (0 to PREVIEW_MAX)"""
+    try:
+        count = int(request.query_params.get("comments", 0))
+    except ValueError:
+        return 0
+    return min(max(count, 0), PREVIEW_MAX)
+
+
+def _latest(post_ids, count):
+    """
+    The newest count comments of each post: a UNION ALL of one
+    WHERE post_id = ? ORDER BY created_at DESC, id DESC LIMIT count slice per
+    post, each a short range scan of comment_post_recent_idx, so a page costs
+    posts x count rows however long its threads are. The union sits in a
+    derived table since MySQL refuses LIMIT directly inside IN (...).
+    """
+    if not post_ids:
+        return Comment.objects.none()
+    part = (
+        Comment.objects.filter(post_id=post_ids[0], user__deleted_at__isnull=True)
+        .order_by("-created_at", "-id")
+        .values("id")[:count]
+    )
+    # compiled once, every slice is the same statement for another post id
+    sql, part_params = part.query.get_compiler(using=part.db).as_sql()
+    slices, params = [], []
+    for post_id in post_ids:
+        slices.append(f"SELECT * FROM ({sql}) AS slice_{len(slices)}")
+        params.extend(post_id if param == post_ids[0] else param for param in part_params)
+    ids = RawSQL(f"SELECT id FROM ({' UNION ALL '.join(slices)}) AS latest", params)
+    return Comment.objects.filter(id__in=ids).select_related("user")
+
+
+def _group(post_ids, rows):
+    previews = {post_id: [] for post_id in post_ids}
+    for comment in rows:
+        previews[comment.post_id].append(comment)
+    # at most count rows per post, cheaper to order here than to sort the whole result in SQL
+    for comments in previews.values():
+        comments.sort(key=lambda comment: (comment.created_at, comment.id), reverse=True)
+    return previews
+
+
+def latest_for_posts(post_ids, count):
+    """{post_id: [newest comments, at most count]} in a single query"""
+    return _group(post_ids, _latest(post_ids, count))
+
+
+async def alatest_for_posts(post_ids, count):
+    """latest_for_posts on the async ORM"""
+    # the slices are compiled off the event loop, like the queries themselves
+    latest = await sync_to_async(_latest)(post_ids, count)
+    return _group(post_ids, [comment async for comment in latest])
@@ -0,0 +1,45 @@
+"""
+Atomic updates for the denormalized counter columns.
+
+Callers run these inside the same transaction as the row they add or remove
+so a count never commits without its like/comment/follow. Anything that
+bypasses the views (admin, shell, bulk scripts) can drift; the
+reconcile_counters command repairs that.
+"""
+from django.db.models import F
+
+from .models import CustomUser, Post
+
+
+def bump(model, pk, field, delta):
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        # never drive an unsigned column below zero, reconcile fixes real drift
+        queryset = queryset.filter(**{f"{field}__gte": -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def like_added(post_id):
+    bump(Post, post_id, "like_count", 1)
+
+
+def like_removed(post_id):
+    bump(Post, post_id, "like_count", -1)
+
+
+def comment_added(post_id):
+    bump(Post, post_id, "comment_count", 1)
+
+
+def comment_removed(post_id):
+    bump(Post, post_id, "comment_count", -1)
+
+
+def follow_added(follower_id, followed_id):
+    bump(CustomUser, follower_id, "following_count", 1)
+    bump(CustomUser, followed_id, "follower_count", 1)
+
+
+def follow_removed(follower_id, followed_id):
+    bump(CustomUser, follower_id, "following_count", -1)
+    bump(CustomUser, followed_id, "follower_count", -1)
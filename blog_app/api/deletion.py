@@ -0,0 +1,244 @@
+"""
+Soft delete of posts and accounts, with their rows reaped in the background.
+
+post.delete() and deleting a user in admin used to cascade in the caller's
+transaction: Django collects every dependent row into memory first (the
+likes, comments, timeline entries and search postings of a post, and for a
+user all of that for each of their posts plus their own likes, comments and
+follows), then deletes it all under one set of locks. A post with a million
+likes could hold tables for minutes or run a worker out of memory.
+
+delete_post and delete_user only stamp deleted_at (and is_active=False for
+an account) and bump the caches, so the content is gone at once: the
+default Post manager skips deleted posts, and the listings that show users
+(directory, suggestions, comment threads, like lists) skip deleted accounts.
+A Deletion row then records the job. After commit the reaper works through
+its steps, deleting DELETION_BATCH_SIZE rows per short transaction that
+also saves the job's step and deleted_rows. A crash or restart picks up
+where it stopped. Likes, comments, follows and the index rows have no
+dependents, so a batch of them is one plain DELETE by primary key; the work
+the post_delete receivers of likes, comments and follows would do row by
+row (counters of the posts the user liked, follower counts, /explore/
+scores, cache stamps) is done once per batch by the step's callback
+instead, and the DELETE skips those receivers.
+
+The reaper is a single background thread like api/ingest.py's pool;
+DELETION_REAPER_EAGER runs it inline on commit instead, which is what tests
+use. The reap_deletions command finishes jobs a stopped process left behind.
+"""
+import logging
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, pre_delete
+from django.utils import timezone
+
+from . import authentication, caching, suggestions, trending
+from .models import (
+    Comment, CustomUser, Deletion, Follow, Likes, Post, SearchTerm, SuggestionCandidate, TimelineEntry, TrendingPost,
+)
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def batch_size():
+    return getattr(settings, "DELETION_BATCH_SIZE", 1000)
+
+
+def batch_pause():
+    return getattr(settings, "DELETION_BATCH_PAUSE", 0.0)
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        # one reaper; parallel batches would only queue on the same locks
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="deletion-reaper")
+    return _executor
+
+
+def _decrement(model, field, counts):
+    """field -= n for each {pk: n}, one UPDATE per distinct n"""
+    by_amount = defaultdict(list)
+    for pk, amount in counts.items():
+        by_amount[amount].append(pk)
+    for amount, pks in by_amount.items():
+        # never below zero, as counters.bump
+        model._base_manager.filter(pk__in=pks, **{f"{field}__gte": amount}).update(**{field: F(field) - amount})
+
+
+def _posts_touched(rows):
+    caching.touch_posts({row["post_id"] for row in rows})
+
+
+def _likes_removed(rows):
+    _decrement(Post, "like_count", Counter(row["post_id"] for row in rows))
+    trending.likes_removed((row["post_id"], row["created_at"]) for row in rows)
+    _posts_touched(rows)
+
+
+def _comments_removed(rows):
+    _decrement(Post, "comment_count", Counter(row["post_id"] for row in rows))
+    trending.comments_removed((row["post_id"], row["created_at"]) for row in rows)
+    _posts_touched(rows)
+
+
+def _follows_removed(rows):
+    # feed.prune is left to the timeline steps, which drop both sides of the user's timeline entries
+    for row in rows:
+        suggestions.follow_removed(row["follower_id"], row["followed_id"])
+    _decrement(CustomUser, "following_count", Counter(row["follower_id"] for row in rows))
+    _decrement(CustomUser, "follower_count", Counter(row["followed_id"] for row in rows))
+    # author_followed_by_me changed for the follower
+    caching.touch_authors({row["followed_id"] for row in rows})
+    # and a cached request.user would still show the old counts
+    authentication.touch_users({row[column] for row in rows for column in ("follower_id", "followed_id")})
+
+
+# (step, model, field holding the target's id, columns the callback reads, callback for each deleted batch);
+# dependents go before what they point at, so every batch only cascades to rows already gone
+POST_STEPS = [
+    ("timeline", TimelineEntry, "post_id", (), None),
+    ("search", SearchTerm, "post_id", (), None),
+    ("likes", Likes, "post_id", ("post_id",), _posts_touched),
+    ("comments", Comment, "post_id", ("post_id",), _posts_touched),
+    ("trending", TrendingPost, "post_id", (), None),
+    ("post", Post, "id", (), None),
+]
+USER_STEPS = [
+    ("post timelines", TimelineEntry, "author_id", (), None),
+    ("post search", SearchTerm, "post__author_id", (), None),
+    ("post likes", Likes, "post__author_id", ("post_id",), _posts_touched),
+    ("post comments", Comment, "post__author_id", ("post_id",), _posts_touched),
+    ("post trending", TrendingPost, "post__author_id", (), None),
+    ("posts", Post, "author_id", (), None),
+    ("likes", Likes, "user_id", ("post_id", "created_at"), _likes_removed),
+    ("comments", Comment, "user_id", ("post_id", "created_at"), _comments_removed),
+    ("following", Follow, "follower_id", ("follower_id", "followed_id"), _follows_removed),
+    ("followers", Follow, "followed_id", ("follower_id", "followed_id"), _follows_removed),
+    ("timeline", TimelineEntry, "user_id", (), None),
+    ("suggestions", SuggestionCandidate, "user_id", (), None),
+    ("suggested to others", SuggestionCandidate, "candidate_id", (), None),
+    ("user", CustomUser, "id", (), None),
+]
+
+
+def _has_delete_receivers(model):
+    return pre_delete.has_listeners(model) or post_delete.has_listeners(model)
+
+
+def steps(target):
+    return POST_STEPS if target == Deletion.POST else USER_STEPS
+
+
+def _queue(target, target_id):
+    Deletion.objects.get_or_create(target=target, target_id=target_id)
+
+    def enqueue():
+        if getattr(settings, "DELETION_REAPER_EAGER", False):
+            reap()
+        else:
+            _pool().submit(_run_in_worker)
+
+    transaction.on_commit(enqueue)
+
+
+def delete_post(post):
+    """Hide post at once and queue the removal of it and its likes, comments and index rows"""
+    with transaction.atomic():
+        if not Post.objects.filter(pk=post.pk).update(deleted_at=timezone.now()):
+            return False
+        # a single row, and /explore/ pages shouldn't come up short until the reaper gets there
+        TrendingPost.objects.filter(post_id=post.pk).delete()
+        _queue(Deletion.POST, post.pk)
+    username = CustomUser.objects.filter(pk=post.author_id).values_list("username", flat=True).first()
+    caching.touch_post_list(username)
+    caching.touch_post(post.pk)
+    return True
+
+
+def delete_user(user):
+    """Deactivate user, hide everything they posted, commented and liked at once and queue its removal"""
+    with transaction.atomic():
+        now = timezone.now()
+        if not CustomUser.objects.filter(pk=user.pk, deleted_at__isnull=True).update(deleted_at=now, is_active=False):
+            return False
+        # one UPDATE over the author index; the rows themselves are the reaper's
+        Post.objects.filter(author_id=user.pk).update(deleted_at=now)
+        _queue(Deletion.USER, user.pk)
+    caching.touch_post_list(user.username)
+    caching.touch_author(user.pk)
+    authentication.touch_user(user.pk)
+    # cached first pages embed the latest comments of the posts they commented on
+    commented = list(Comment.objects.filter(user_id=user.pk).values_list("post_id", flat=True).distinct())
+    for start in range(0, len(commented), batch_size()):
+        caching.touch_posts(commented[start:start + batch_size()])
+    return True
+
+
+def _batch(job_id, size):
+    """Delete the next batch of one job; False once it is finished, or when another reaper holds it"""
+    with transaction.atomic():
+        # skip_locked: a second reaper (the command next to the pool) moves on instead of waiting
+        job = Deletion.objects.select_for_update(skip_locked=True).filter(pk=job_id, finished_at__isnull=True).first()
+        if job is None:
+            return False
+        plan = steps(job.target)
+        index = next((i for i, step in enumerate(plan) if step[0] == job.step), 0)
+        label, model, field, columns, removed = plan[index]
+        job.step = label
+        rows = list(model._base_manager.filter(**{field: job.target_id}).values("pk", *columns)[:size])
+        if rows:
+            batch = model._base_manager.filter(pk__in=[row["pk"] for row in rows])
+            if model._meta.related_objects or not _has_delete_receivers(model):
+                # posts and users: the collector cascades to anything added since their steps ran;
+                # index rows have no receivers, so the collector already fast-deletes them in one statement
+                deleted, _ = batch.delete()
+            else:
+                # likes, comments and follows: delete() would send their post_delete receivers row by row on
+                # top of the callback doing that work for the whole batch (trending scores and suggestion
+                # counts would move twice). _raw_delete is the collector's own fast path, one DELETE and no
+                # signals; it is private API, so DeletionTests pins it
+                deleted = batch._raw_delete(batch.db)
+            if removed is not None:
+                removed(rows)
+            job.deleted_rows += deleted
+        if len(rows) < size:
+            # anything added to this step since is cascaded by the final step's delete
+            if index + 1 < len(plan):
+                job.step = plan[index + 1][0]
+            else:
+                job.finished_at = timezone.now()
+            logger.info("deletion of %s %s: %s done, %s rows so far", job.target, job.target_id, label, job.deleted_rows)
+        job.save(update_fields=["step", "deleted_rows", "finished_at"])
+        return job.finished_at is None
+
+
+def reap(size=None, pause=None):
+    """Run every pending deletion to the end, oldest first; the jobs it worked on"""
+    size = size or batch_size()
+    pause = batch_pause() if pause is None else pause
+    pending = list(Deletion.objects.filter(finished_at__isnull=True).order_by("requested_at", "id"))
+    for job in pending:
+        while _batch(job.pk, size):
+            if pause:
+                # let replication and other writers catch up between batches
+                time.sleep(pause)
+        job.refresh_from_db()
+    return pending
+
+
+def _run_in_worker():
+    try:
+        reap()
+    except Exception:  # the next deletion or reap_deletions picks the job up again
+        logger.exception("deletion reaper failed")
+    finally:
+        # worker threads get their own connections, don't leak them
+        connections.close_all()
@@ -0,0 +1,68 @@
+"""
+User directory and @-mention autocomplete.
+
+Lookups are case-insensitive prefix matches on username, or on email once the
+query contains an "@" and the request is authenticated: an anonymous email
+lookup would tell anyone whether an address is registered and to whom. A
+prefix is turned into a range on the lowercased column, lower(username) >=
+"ali" AND < "alj", which the functional indexes on CustomUser serve as one
+short range scan however many users there are (a LIKE/ILIKE would fall back to
+a table scan on most backends). Pages seek past the last (lowercased name, id)
+returned, so case variants such as "Ali" and "ali" on either side of a page
+boundary are not skipped; email matches are not paged so addresses never end
+up in a cursor. New registrations are visible immediately, nothing to warm.
+"""
+import base64
+
+from django.db.models import Q
+from django.db.models.functions import Lower
+from rest_framework.exceptions import NotFound
+
+from .models import CustomUser
+
+MAX_LIMIT = 50
+# what UserDirectorySerializer reads
+USER_FIELDS = ("id", "username", "profile_pic", "follower_count")
+
+
+def parse_query(raw, emails=False):
+    """Strip the mention sigil, pick the column to match (email only if emails); None for an empty query"""
+    query = (raw or "").strip().lower()
+    if query.startswith("@"):
+        query = query[1:]
+    if not query:
+        return None
+    return ("email" if emails and "@" in query else "username"), query
+
+
+def encode_after(key, pk):
+    """Opaque ?after= for the position of a (lowercased username, id) row"""
+    return base64.urlsafe_b64encode(f"{key}|{pk}".encode()).decode()
+
+
+def decode_after(token):
+    """Inverse of encode_after, raises NotFound on anything we didn't issue"""
+    try:
+        key, pk = base64.urlsafe_b64decode(token.encode()).decode().rsplit("|", 1)
+        return key, int(pk)
+    except (TypeError, ValueError, UnicodeError):
+        raise NotFound("Invalid cursor")
+
+
+def _successor(prefix):
+    """Smallest string greater than every string starting with prefix"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def lookup(field, query, after=None, limit=10):
+    """Users whose field starts with query, alphabetically, after the given (lowercased value, id)"""
+    users = (
+        CustomUser.objects.only(*USER_FIELDS, field)
+        .filter(deleted_at__isnull=True)
+        .annotate(key=Lower(field))
+        .filter(key__gte=query, key__lt=_successor(query))
+    )
+    if after:
+        key, pk = after
+        users = users.filter(Q(key__gt=key) | Q(key=key, id__gt=pk))
+    return list(users.order_by("key", "id")[:limit])
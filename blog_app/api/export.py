@@ -0,0 +1,194 @@
+"""
+Streaming export of one user's history: posts, comments, likes and follows.
+
+Sections are read one after another, each in id order and in chunks of
+EXPORT_CHUNK_SIZE rows (WHERE user = ? AND id > ? ORDER BY id LIMIT n, a
+range scan on the foreign key index). Memory stays at one chunk however long
+the history is; .iterator() alone would not bound it on MySQL, whose client
+buffers the whole result set. Every chunk is followed by a checkpoint line,
+
+    {"type": "checkpoint", "after": "<token>"}
+
+and passing the token back as `after` continues right behind that chunk.
+
+A response stops at the first checkpoint past EXPORT_RECORDS_PER_RESPONSE
+records, so a multi-GB history comes down over several bounded requests
+instead of holding one worker for the whole download, and an interrupted
+download resumes from its last checkpoint instead of from zero. The last
+line is {"type": "done"} once nothing is left, otherwise that checkpoint.
+
+Output is NDJSON, one record per line, or a zip streamed without seeking
+with a <section>.ndjson member per section and the last line in
+status.json.
+"""
+import base64
+import io
+import zipfile
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.exceptions import NotFound
+
+from .fastpath import datetime_formatter
+from .media import resource_url
+from .models import Comment, Follow, Likes, Post
+from .renderers import FastJSONRenderer
+
+
+def chunk_size():
+    return getattr(settings, "EXPORT_CHUNK_SIZE", 1000)
+
+
+def records_per_response():
+    return getattr(settings, "EXPORT_RECORDS_PER_RESPONSE", 100000)
+
+
+def _post(row, datetime):
+    return {
+        "type": "post", "id": row["id"], "content": row["content"],
+        "created_at": datetime(row["created_at"]), "updated_at": datetime(row["updated_at"]),
+        "image": resource_url(row["image"]), "video": resource_url(row["video"]), "status": row["status"],
+        "like_count": row["like_count"], "comment_count": row["comment_count"],
+    }
+
+
+def _comment(row, datetime):
+    return {
+        "type": "comment", "id": row["id"], "post": row["post_id"], "message": row["message"],
+        "created_at": datetime(row["created_at"]),
+    }
+
+
+def _like(row, datetime):
+    return {"type": "like", "id": row["id"], "post": row["post_id"], "created_at": datetime(row["created_at"])}
+
+
+def _following(row, datetime):
+    # Follow.created_at is a date
+    return {
+        "type": "following", "id": row["id"], "user": row["followed_id"], "username": row["followed__username"],
+        "created_at": row["created_at"].isoformat(),
+    }
+
+
+def _follower(row, datetime):
+    return {
+        "type": "follower", "id": row["id"], "user": row["follower_id"], "username": row["follower__username"],
+        "created_at": row["created_at"].isoformat(),
+    }
+
+
+# (name, model, user field, fields read, record); exported in this order
+SECTIONS = [
+    ("posts", Post, "author_id",
+     ("id", "content", "created_at", "updated_at", "image", "video", "status", "like_count", "comment_count"), _post),
+    ("comments", Comment, "user_id", ("id", "post_id", "message", "created_at"), _comment),
+    ("likes", Likes, "user_id", ("id", "post_id", "created_at"), _like),
+    ("following", Follow, "follower_id", ("id", "followed_id", "followed__username", "created_at"), _following),
+    ("followers", Follow, "followed_id", ("id", "follower_id", "follower__username", "created_at"), _follower),
+]
+_SECTION_NAMES = [name for name, *_ in SECTIONS]
+
+
+def encode_checkpoint(section, last_id):
+    return base64.urlsafe_b64encode(f"{section}|{last_id}".encode()).decode()
+
+
+def decode_checkpoint(token):
+    """Inverse of encode_checkpoint, raises NotFound on anything we didn't issue"""
+    try:
+        section, last_id = base64.urlsafe_b64decode(token.encode()).decode().rsplit("|", 1)
+        if section in _SECTION_NAMES:
+            return section, int(last_id)
+    except (TypeError, ValueError, UnicodeError):
+        pass
+    raise NotFound("Invalid checkpoint")
+
+
+def _line(record):
+    return FastJSONRenderer().render(record) + b"\n"
+
+
+def chunks(user_id, after=None, limit=None):
+    """
+    (section, lines) for each chunk of user_id's history after the checkpoint
+    after, the lines ending with the chunk's checkpoint, then (None, [done])
+    at the end. With limit, it stops at the first checkpoint past that many
+    records instead.
+    """
+    start, last_id = decode_checkpoint(after) if after else (_SECTION_NAMES[0], 0)
+    size = chunk_size()
+    datetime = datetime_formatter()
+    sent = 0
+    for name, model, user_field, fields, record in SECTIONS[_SECTION_NAMES.index(start):]:
+        rows = model.objects.filter(**{user_field: user_id}).order_by("id").values(*fields)
+        while True:
+            chunk = list(rows.filter(id__gt=last_id)[:size])
+            if not chunk:
+                break
+            last_id = chunk[-1]["id"]
+            lines = [_line(record(row, datetime)) for row in chunk]
+            lines.append(_line({"type": "checkpoint", "after": encode_checkpoint(name, last_id)}))
+            yield name, lines
+            sent += len(chunk)
+            if limit is not None and sent >= limit:
+                return
+            if len(chunk) < size:
+                break
+        last_id = 0
+    yield None, [_line({"type": "done"})]
+
+
+def ndjson(user_id, after=None, limit=None):
+    """The export as NDJSON, one bytes block per chunk"""
+    for _, lines in chunks(user_id, after, limit):
+        yield b"".join(lines)
+
+
+class _Sink(io.RawIOBase):
+    """Write-only, unseekable stream collecting what ZipFile writes"""
+
+    def __init__(self):
+        self.parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def zip_archive(user_id, after=None, limit=None):
+    """The export as a zip, one bytes block per chunk (without seeking, ZipFile writes data descriptors)"""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as archive:
+        current, member, last = None, None, b""
+        for section, lines in chunks(user_id, after, limit):
+            last = lines[-1]
+            if section is None:
+                break
+            if section != current:
+                if member is not None:
+                    member.close()
+                current, member = section, archive.open(f"{section}.ndjson", "w", force_zip64=True)
+            member.writelines(lines)
+            yield sink.drain()
+        if member is not None:
+            member.close()
+        archive.writestr("status.json", last)
+    yield sink.drain()
+
+
+async def aiterate(blocks):
+    """blocks as an async iterator, each step run in the request's sync thread like a sync view"""
+    blocks = iter(blocks)
+    step = sync_to_async(next)
+    end = object()
+    while (block := await step(blocks, end)) is not end:
+        yield block
@@ -0,0 +1,241 @@
+"""
+Home timeline built from the Follow graph.
+
+Regular authors are fanned out on write: a new post is pushed into the
+TimelineEntry rows of every follower. Authors with more than
+FEED_FANOUT_LIMIT followers are skipped at write time and pulled in at read
+time instead, so one post never turns into millions of inserts.
+
+The author's own entry is written with the post; the followers' entries
+are written after commit by a small thread pool like api/ingest.py's, so
+creating a post doesn't wait for thousands of inserts. A follow's backfill
+and an unfollow's prune (with their suggestion updates) are queued the same
+way, on a single thread so they land in the order they were committed.
+FEED_FANOUT_EAGER runs all of these inline on commit instead, which is what
+tests use. A restart can drop queued work; rebuild_timelines and
+rebuild_suggestions restore it.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from . import suggestions
+from .models import CustomUser, Follow, Post, TimelineEntry
+from .pagination import before_cursor
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+_executor = None
+_follows_executor = None
+
+
+def fanout_limit():
+    return getattr(settings, "FEED_FANOUT_LIMIT", 5000)
+
+
+def backfill_size():
+    return getattr(settings, "FEED_BACKFILL_SIZE", 50)
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, "FEED_FANOUT_WORKERS", 2), thread_name_prefix="feed-fanout"
+        )
+    return _executor
+
+
+def _follows_pool():
+    global _follows_executor
+    if _follows_executor is None:
+        # one thread: a follow's backfill must not land after the unfollow that followed it
+        _follows_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="feed-follows")
+    return _follows_executor
+
+
+def _eager():
+    return getattr(settings, "FEED_FANOUT_EAGER", False)
+
+
+def is_high_follower(user_id):
+    return CustomUser.objects.filter(pk=user_id, follower_count__gt=fanout_limit()).exists()
+
+
+def _bulk_insert(entries):
+    for start in range(0, len(entries), BATCH_SIZE):
+        TimelineEntry.objects.bulk_create(entries[start:start + BATCH_SIZE], ignore_conflicts=True)
+
+
+def _entry(user_id, post):
+    return TimelineEntry(user_id=user_id, post_id=post.id, author_id=post.author_id, created_at=post.created_at)
+
+
+def _fan_out_to_followers(post):
+    if is_high_follower(post.author_id):
+        return
+    entries = []
+    follower_ids = Follow.objects.filter(followed_id=post.author_id).values_list("follower_id", flat=True)
+    for follower_id in follower_ids.iterator(chunk_size=BATCH_SIZE):
+        entries.append(_entry(follower_id, post))
+        if len(entries) >= BATCH_SIZE:
+            _bulk_insert(entries)
+            entries = []
+    _bulk_insert(entries)
+
+
+def push_post(post):
+    """Put a new post in its author's timeline now and queue the followers' fan-out for after commit"""
+    _bulk_insert([_entry(post.author_id, post)])
+    post_id = post.id
+
+    def enqueue():
+        if _eager():
+            fan_out_followers(post_id)
+        else:
+            _pool().submit(_run_in_worker, post_id)
+
+    transaction.on_commit(enqueue)
+
+
+def fan_out_followers(post_id):
+    """The deferred half of push_post; a post deleted in the meantime is skipped"""
+    post = Post.objects.filter(pk=post_id).only("id", "author_id", "created_at").first()
+    if post is not None:
+        _fan_out_to_followers(post)
+
+
+def _run_in_worker(post_id):
+    try:
+        fan_out_followers(post_id)
+    except Exception:  # rebuild_timelines repairs what a failed fan-out missed
+        logger.exception("timeline fan-out of post %s failed", post_id)
+    finally:
+        # worker threads get their own connections, don't leak them
+        connections.close_all()
+
+
+def backfill(follower_id, followed_id):
+    """Copy the newest posts of a just-followed user into the follower's timeline"""
+    if follower_id != followed_id and is_high_follower(followed_id):
+        # these are pulled at read time anyway
+        return
+    posts = Post.objects.filter(author_id=followed_id).only("id", "author_id", "created_at")
+    posts = posts.order_by("-created_at", "-id")[:backfill_size()]
+    _bulk_insert([_entry(follower_id, post) for post in posts])
+
+
+def prune(follower_id, followed_id):
+    """Drop everything an unfollowed user contributed to the follower's timeline"""
+    TimelineEntry.objects.filter(user_id=follower_id, author_id=followed_id).delete()
+
+
+def follow_changed(follower_id, followed_id, following):
+    """Queue the timeline and suggestion updates of a follow (or unfollow) for after commit"""
+
+    def enqueue():
+        if _eager():
+            apply_follow_change(follower_id, followed_id, following)
+        else:
+            _follows_pool().submit(_run_follow_change, follower_id, followed_id, following)
+
+    transaction.on_commit(enqueue)
+
+
+def apply_follow_change(follower_id, followed_id, following):
+    """The deferred half of relations.follow/unfollow"""
+    with transaction.atomic():
+        if following:
+            backfill(follower_id, followed_id)
+            suggestions.follow_added(follower_id, followed_id)
+        else:
+            prune(follower_id, followed_id)
+            suggestions.follow_removed(follower_id, followed_id)
+
+
+def _run_follow_change(follower_id, followed_id, following):
+    try:
+        apply_follow_change(follower_id, followed_id, following)
+    except Exception:  # rebuild_timelines/rebuild_suggestions repair what a failed update missed
+        logger.exception("follow update %s -> %s failed", follower_id, followed_id)
+    finally:
+        connections.close_all()
+
+
+def _high_followers(user):
+    return (
+        Follow.objects.filter(follower=user, followed__follower_count__gt=fanout_limit())
+        .values_list("followed_id", flat=True)
+    )
+
+
+def high_follower_ids(user):
+    """Followed accounts whose posts were not fanned out and must be pulled"""
+    return list(_high_followers(user))
+
+
+def _pushed(user, cursor, limit):
+    pushed = TimelineEntry.objects.filter(user=user)
+    if cursor:
+        pushed = pushed.filter(before_cursor(*cursor, pk_field="post_id"))
+    return pushed.order_by("-created_at", "-post_id").values_list("created_at", "post_id")[:limit + 1]
+
+
+def _pulled(author_ids, cursor, limit):
+    pulled = Post.objects.filter(author_id__in=author_ids)
+    if cursor:
+        pulled = pulled.filter(before_cursor(*cursor))
+    return pulled.order_by("-created_at", "-id").values_list("created_at", "id")[:limit + 1]
+
+
+def _page(rows, pulled_rows, limit):
+    if pulled_rows:
+        # a post can be in both streams if its author crossed the limit
+        rows = sorted(set(rows) | set(pulled_rows), reverse=True)
+    return rows[:limit], len(rows) > limit
+
+
+def _posts(rows, posts_by_id):
+    posts = [posts_by_id[post_id] for _, post_id in rows if post_id in posts_by_id]
+    return posts, (rows[-1] if rows else None)
+
+
+def _load(posts, post_ids):
+    if posts is None:
+        return Post.objects.select_related("author").filter(id__in=post_ids)
+    # .values() rows (api/fastpath.py) rather than instances
+    return posts(Post.objects.filter(id__in=post_ids))
+
+
+def _by_id(post):
+    return post["id"] if isinstance(post, dict) else post.id
+
+
+def read_feed(user, cursor=None, limit=10, posts=None):
+    """
+    Return (posts, last_position, has_more) for one page of the user's feed.
+
+    cursor is a decoded (created_at, post_id) tuple or None for the first page.
+    posts, if given, turns a Post queryset into the rows to return, e.g.
+    fastpath.post_rows; by default they are Post instances with their author.
+    """
+    rows = list(_pushed(user, cursor, limit))
+    pulled_authors = high_follower_ids(user)
+    pulled_rows = list(_pulled(pulled_authors, cursor, limit)) if pulled_authors else []
+    rows, has_more = _page(rows, pulled_rows, limit)
+    posts_by_id = {_by_id(post): post for post in _load(posts, [post_id for _, post_id in rows])}
+    return (*_posts(rows, posts_by_id), has_more)
+
+
+async def aread_feed(user, cursor=None, limit=10, posts=None):
+    """read_feed on the async ORM"""
+    rows = [row async for row in _pushed(user, cursor, limit)]
+    pulled_authors = [pk async for pk in _high_followers(user)]
+    pulled_rows = [row async for row in _pulled(pulled_authors, cursor, limit)] if pulled_authors else []
+    rows, has_more = _page(rows, pulled_rows, limit)
+    posts_by_id = {_by_id(post): post async for post in _load(posts, [post_id for _, post_id in rows])}
+    return (*_posts(rows, posts_by_id), has_more)
@@ -0,0 +1,162 @@
+"""
+Background media ingestion for new posts.
+
+PostCreateSerializer no longer uploads inside the request. Uploaded files
+are spooled to MEDIA_INGEST_STAGING_DIR and the post is saved with status
+"processing". After the transaction commits, a worker from a small thread
+pool pushes the files to the storage backend, retrying with exponential
+backoff. It then flips the post to "ready", or to "failed" with the last
+error. Clients poll /post/<pk>/status/.
+
+Uploads Django already streamed to a temporary file are moved into the
+staging directory rather than copied. Staged files are named after their
+post and field, so the jobs can be rebuilt from disk: the pool lives only
+in this process, and after a restart the recover_media_ingest command
+re-runs every "processing" post whose files are still staged and marks the
+rest failed.
+
+MEDIA_INGEST_EAGER runs the job inline on commit instead of on the pool,
+which is what tests use.
+"""
+import logging
+import os
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.db import connections, transaction
+
+from . import caching
+from .models import Post
+from .storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+# model field -> resource type it is uploaded as
+MEDIA_FIELDS = {"image": "image", "video": "video"}
+
+_executor = None
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, "MEDIA_INGEST_WORKERS", 4), thread_name_prefix="media-ingest"
+        )
+    return _executor
+
+
+def staging_dir():
+    path = getattr(settings, "MEDIA_INGEST_STAGING_DIR", None) or os.path.join(tempfile.gettempdir(), "post-media")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def stage(uploaded_file, post_id, field):
+    """Spool an upload to local disk so the request can return before it is stored"""
+    extension = os.path.splitext(uploaded_file.name or "")[1]
+    path = os.path.join(staging_dir(), f"{post_id}-{field}{extension}")
+    if hasattr(uploaded_file, "temporary_file_path"):
+        # already on disk (over FILE_UPLOAD_MAX_MEMORY_SIZE): a rename, not a second copy
+        file_move_safe(uploaded_file.temporary_file_path(), path, allow_overwrite=True)
+        return path
+    with open(path, "wb") as out:
+        for chunk in uploaded_file.chunks():
+            out.write(chunk)
+    return path
+
+
+def staged_files():
+    """{post id: {field: path}} of everything in the staging directory"""
+    found = defaultdict(dict)
+    directory = staging_dir()
+    for name in os.listdir(directory):
+        post_id, _, field = os.path.splitext(name)[0].partition("-")
+        if post_id.isdigit() and field in MEDIA_FIELDS:
+            found[int(post_id)][field] = os.path.join(directory, name)
+    return found
+
+
+def submit(post_id, staged):
+    """Queue the upload of {field: staged path} once the post row is committed"""
+    def enqueue():
+        if getattr(settings, "MEDIA_INGEST_EAGER", False):
+            process(post_id, staged)
+        else:
+            _pool().submit(_run_in_worker, post_id, staged)
+
+    transaction.on_commit(enqueue)
+
+
+def _run_in_worker(post_id, staged):
+    try:
+        process(post_id, staged)
+    except Exception as exc:  # nobody reads the Future, don't leave the post processing
+        logger.exception("media ingestion of post %s failed", post_id)
+        try:
+            Post.objects.filter(pk=post_id).update(status=Post.FAILED, media_error=str(exc)[:1000])
+            caching.touch_post(post_id)
+        except Exception:  # the database is what failed; recover_media_ingest marks it later
+            logger.exception("could not mark post %s failed", post_id)
+    finally:
+        # worker threads get their own connections, don't leak them
+        connections.close_all()
+
+
+def process(post_id, staged):
+    retries = getattr(settings, "MEDIA_INGEST_RETRIES", 3)
+    delay = getattr(settings, "MEDIA_INGEST_RETRY_DELAY", 1.0)
+    storage = get_storage()
+    stored, error = {}, None
+    try:
+        for attempt in range(retries + 1):
+            try:
+                for field, path in staged.items():
+                    if field not in stored:
+                        stored[field] = storage.upload(path, MEDIA_FIELDS[field])
+                error = None
+                break
+            except Exception as exc:  # storage backends raise anything from IO to HTTP errors
+                error = exc
+                logger.warning("media upload for post %s failed (attempt %s): %s", post_id, attempt + 1, exc)
+                if attempt < retries:
+                    time.sleep(delay * 2 ** attempt)
+        if error is None:
+            # update() keeps updated_at as the author's edit time
+            Post.objects.filter(pk=post_id).update(status=Post.READY, media_error="", **stored)
+        else:
+            Post.objects.filter(pk=post_id).update(status=Post.FAILED, media_error=str(error)[:1000])
+        caching.touch_post(post_id)
+    finally:
+        for path in staged.values():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def recover():
+    """
+    Finish the jobs of posts a stopped process left "processing": run the
+    ones whose files are still staged, mark the others failed and remove
+    staged files no post is waiting for. (resumed, failed) post ids.
+    """
+    staged = staged_files()
+    pending = set(Post.objects.filter(status=Post.PROCESSING).values_list("id", flat=True))
+    resumed, failed = sorted(pending & staged.keys()), sorted(pending - staged.keys())
+    if failed:
+        Post.objects.filter(pk__in=failed).update(status=Post.FAILED, media_error="staged media was lost")
+        caching.touch_posts(failed)
+    for post_id in staged.keys() - pending:
+        for path in staged[post_id].values():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    for post_id in resumed:
+        process(post_id, staged[post_id])
+    return resumed, failed
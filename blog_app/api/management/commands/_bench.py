@@ -0,0 +1,153 @@
+"""Shared helpers for the bench_*, seed and load-test commands (not a command itself)"""
+import bisect
+import itertools
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from api import search
+from api.models import Comment, CustomUser, Follow, Likes, Post
+
+BATCH_SIZE = 1000
+# password of every seeded account, so load tests can log in as any of them
+SEED_PASSWORD = "seed-password"
+WORDS = "sunset beach coffee city night morning dog cat travel food mountain river friends music art".split()
+
+
+@contextmanager
+def scratch_database():
+    """Run against a throwaway test database so benchmarks never touch real data"""
+    old_name = connection.settings_dict["NAME"]
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def summarize(samples):
+    """Latency stats in milliseconds for a list of samples in milliseconds"""
+    samples = sorted(samples)
+
+    def percentile(p):
+        return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+    return {
+        "p50": statistics.median(samples),
+        "p95": percentile(0.95),
+        "p99": percentile(0.99),
+        "mean": statistics.fmean(samples),
+    }
+
+
+def timed(fn, repeat=20):
+    """Run fn repeatedly, return latency stats in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def _flush(model, rows, batch_size, **kwargs):
+    if rows:
+        model.objects.bulk_create(rows, batch_size=batch_size, **kwargs)
+    return []
+
+
+def seed_dataset(users=200, posts_per_user=10, follows_per_user=20, likes_per_post=5, comments_per_post=3,
+                 alpha=1.1, seed=0, prefix="user", batch_size=BATCH_SIZE, progress=None):
+    """
+    Fill the current database with a synthetic social graph and return the new user ids.
+
+    Popularity is Zipf-distributed (the account of rank r is followed with
+    weight 1 / r**alpha) and out-degrees are Pareto-distributed around
+    follows_per_user, so a few accounts have most of the followers and most
+    accounts follow a handful. Rows are generated lazily and written with
+    bulk_create in batches; the derived tables (counters, timelines, search
+    index, suggestions, trending scores) are rebuilt by their commands afterwards.
+    """
+    rng = random.Random(seed)
+    report = progress or (lambda message: None)
+    now = timezone.now()
+    password = make_password(SEED_PASSWORD)
+
+    report(f"users: {users}")
+    CustomUser.objects.bulk_create(
+        (CustomUser(username=f"{prefix}{i}", email=f"{prefix}{i}@example.com", password=password)
+         for i in range(users)),
+        batch_size=batch_size,
+    )
+    user_ids = list(
+        CustomUser.objects.filter(username__startswith=prefix).order_by("id").values_list("id", flat=True)
+    )
+    # shuffled so popularity isn't simply the oldest accounts
+    by_popularity = rng.sample(user_ids, len(user_ids))
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) ** alpha for rank in range(len(by_popularity))))
+
+    def popular_user():
+        return by_popularity[bisect.bisect(cum_weights, rng.random() * cum_weights[-1])]
+
+    report(f"posts: ~{users * posts_per_user}")
+    Post.objects.bulk_create(
+        (Post(author_id=author_id, content=" ".join(rng.choices(WORDS, k=6)))
+         for author_id in user_ids for _ in range(posts_per_user)),
+        batch_size=batch_size,
+    )
+    # auto_now_add gave every row the same timestamp, spread them over the last month
+    posts = Post.objects.filter(author__username__startswith=prefix)
+    post_ids = list(posts.order_by("id").values_list("id", flat=True))
+    for start in range(0, len(post_ids), batch_size):
+        chunk = [
+            Post(id=pk, created_at=now - timedelta(seconds=rng.randint(0, 30 * 24 * 3600)))
+            for pk in post_ids[start:start + batch_size]
+        ]
+        Post.objects.bulk_update(chunk, ["created_at"])
+
+    report(f"follows: ~{users * follows_per_user}")
+    rows = []
+    for follower_id in user_ids:
+        # Pareto(2) has mean 2, scale it to the requested average out-degree
+        degree = min(len(user_ids) - 1, int(follows_per_user / 2 * rng.paretovariate(2)))
+        followed = {popular_user() for _ in range(degree)}
+        followed.discard(follower_id)
+        rows.extend(Follow(follower_id=follower_id, followed_id=pk) for pk in followed)
+        if len(rows) >= batch_size:
+            rows = _flush(Follow, rows, batch_size, ignore_conflicts=True)
+    _flush(Follow, rows, batch_size, ignore_conflicts=True)
+
+    report(f"likes and comments: ~{len(post_ids) * (likes_per_post + comments_per_post)}")
+    likes, comments = [], []
+    for post_id in post_ids:
+        likes.extend(Likes(post_id=post_id, user_id=pk) for pk in {popular_user() for _ in range(likes_per_post)})
+        comments.extend(
+            Comment(post_id=post_id, user_id=rng.choice(user_ids), message=" ".join(rng.choices(WORDS, k=4)))
+            for _ in range(comments_per_post)
+        )
+        if len(likes) >= batch_size:
+            likes = _flush(Likes, likes, batch_size, ignore_conflicts=True)
+        if len(comments) >= batch_size:
+            comments = _flush(Comment, comments, batch_size)
+    _flush(Likes, likes, batch_size, ignore_conflicts=True)
+    _flush(Comment, comments, batch_size)
+
+    commands = ["reconcile_counters", "rebuild_timelines", "rebuild_suggestions", "rebuild_trending"]
+    if search.backend() == "index":
+        # MySQL FULLTEXT maintains itself
+        commands.append("rebuild_search_index")
+    for command in commands:
+        report(f"running {command}")
+        call_command(command, stdout=StringIO())
+    return user_ids
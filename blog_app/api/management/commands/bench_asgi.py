@@ -0,0 +1,193 @@
+import asyncio
+import io
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.models import CustomUser, Post
+
+from ._bench import scratch_database, seed_dataset, summarize
+
+PATHS = ["/posts/", "/post/{post_id}/", "/post/{post_id}/comments/", "/postlikes/{post_id}/", "/feed/"]
+# scratch_database sets up the test environment, which only allows this host
+HOST = "testserver"
+# (label, entry point, URLconf)
+MODES = [
+    ("wsgi", "wsgi", "blog_app.urls"),
+    ("asgi, sync views", "asgi", "blog_app.urls"),
+    ("asgi, async views", "asgi", "blog_app.urls_async"),
+]
+
+
+def database_latency(seconds):
+    """Execute wrapper standing in for the network round trip to a database server"""
+    def wrapper(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+    return wrapper
+
+
+def wsgi_get(app, path, token):
+    parts = urlsplit(path)
+    environ = {
+        "REQUEST_METHOD": "GET", "PATH_INFO": parts.path, "QUERY_STRING": parts.query,
+        "SERVER_NAME": HOST, "SERVER_PORT": "80", "HTTP_HOST": HOST,
+        "HTTP_AUTHORIZATION": f"Bearer {token}", "HTTP_ACCEPT": "application/json",
+        "wsgi.input": io.BytesIO(), "wsgi.errors": sys.stderr, "wsgi.url_scheme": "http", "wsgi.version": (1, 0),
+        "wsgi.multithread": True, "wsgi.multiprocess": False, "wsgi.run_once": False,
+    }
+    statuses = []
+    body = app(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    try:
+        b"".join(body)
+    finally:
+        body.close()
+    return int(statuses[0].split()[0])
+
+
+async def asgi_get(app, path, token):
+    parts = urlsplit(path)
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": parts.path, "raw_path": parts.path.encode(), "query_string": parts.query.encode(), "root_path": "",
+        "headers": [(b"host", HOST.encode()), (b"authorization", f"Bearer {token}".encode()),
+                    (b"accept", b"application/json")],
+        "client": ("127.0.0.1", 50000), "server": (HOST, 80),
+    }
+    statuses = []
+    done = asyncio.Event()
+    body_sent = False
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # the client stays connected until the response is out
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+        elif message["type"] == "http.response.body" and not message.get("more_body"):
+            done.set()
+
+    await app(scope, receive, send)
+    done.set()
+    return statuses[0]
+
+
+def _result(mode, path, outcomes, wall):
+    statuses = [status for status, _ in outcomes]
+    return {
+        "mode": mode,
+        "path": path,
+        "requests": len(outcomes),
+        "errors": sum(status != 200 for status in statuses),
+        "throughput_rps": len(outcomes) / wall if wall else 0.0,
+        **summarize([elapsed for _, elapsed in outcomes]),
+    }
+
+
+def run_wsgi(mode, path, token, connections_count, threads):
+    """connections_count requests at once, queued for a pool of threads like a threaded WSGI worker"""
+    app = get_wsgi_application()
+
+    def one(submitted):
+        status = wsgi_get(app, path, token)
+        return status, (time.perf_counter() - submitted) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        futures = [pool.submit(one, time.perf_counter()) for _ in range(connections_count)]
+        outcomes = [future.result() for future in futures]
+    return _result(mode, path, outcomes, time.perf_counter() - started)
+
+
+def run_asgi(mode, path, token, connections_count):
+    """connections_count requests at once, each its own task on one event loop"""
+    app = get_asgi_application()
+
+    async def one():
+        start = time.perf_counter()
+        status = await asgi_get(app, path, token)
+        return status, (time.perf_counter() - start) * 1000
+
+    async def main():
+        return await asyncio.gather(*(one() for _ in range(connections_count)))
+
+    started = time.perf_counter()
+    outcomes = asyncio.run(main())
+    return _result(mode, path, outcomes, time.perf_counter() - started)
+
+
+class Command(BaseCommand):
+    help = (
+        "WSGI vs ASGI (with and without the async read views) at N simultaneous requests per endpoint, "
+        "driving the handlers in-process against a seeded scratch database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--connections", type=int, default=1000, help="simultaneous requests per endpoint")
+        parser.add_argument("--wsgi-threads", type=int, default=32, help="worker threads of the WSGI server")
+        parser.add_argument(
+            "--db-latency-ms", type=float, default=2.0,
+            help="added to every query to stand in for a networked database (0 for the raw local database); "
+                 "note that ASGI holds one connection per in-flight request, so a real server needs "
+                 "max_connections above --connections",
+        )
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--only", action="append", help="run just these paths (templates as in PATHS)")
+        parser.add_argument("--json", help="also write the results to this file")
+
+    def handle(self, *args, **options):
+        paths = [path for path in PATHS if not options["only"] or path in options["only"]]
+        with scratch_database():
+            seed_dataset(users=options["users"])
+            viewer = CustomUser.objects.order_by("-following_count").first()
+            post = Post.objects.order_by("-comment_count", "-like_count").first()
+            token = str(AccessToken.for_user(viewer))
+
+            latency = database_latency(options["db_latency_ms"] / 1000)
+
+            def add_latency(sender=None, connection=None, **kwargs):
+                # connection_created fires again on every reconnect of the same wrapper
+                if latency not in connection.execute_wrappers:
+                    connection.execute_wrappers.append(latency)
+
+            if options["db_latency_ms"]:
+                for connection in connections.all(initialized_only=True):
+                    add_latency(connection=connection)
+                connection_created.connect(add_latency, dispatch_uid="bench_asgi.latency")
+            results = []
+            for template in paths:
+                path = template.format(post_id=post.id)
+                for mode, entry_point, urlconf in MODES:
+                    with override_settings(ROOT_URLCONF=urlconf):
+                        if entry_point == "wsgi":
+                            result = run_wsgi(mode, path, token, options["connections"], options["wsgi_threads"])
+                        else:
+                            result = run_asgi(mode, path, token, options["connections"])
+                    results.append(result)
+                    self.stdout.write(
+                        f"{path:24} {mode:18} {result['throughput_rps']:8.1f} req/s  "
+                        f"p50 {result['p50']:8.1f}  p95 {result['p95']:8.1f}  p99 {result['p99']:8.1f} ms  "
+                        f"{result['errors']} errors"
+                    )
+            connection_created.disconnect(dispatch_uid="bench_asgi.latency")
+
+        if options["json"]:
+            with open(options["json"], "w") as fh:
+                json.dump({"options": {key: options[key] for key in (
+                    "connections", "wsgi_threads", "db_latency_ms", "users")}, "results": results}, fh, indent=2)
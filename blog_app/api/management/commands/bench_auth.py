@@ -0,0 +1,83 @@
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.authentication import CachedJWTAuthentication
+from api.models import CustomUser, Post
+
+from ._bench import scratch_database, seed_dataset, summarize
+
+MODES = [("JWTAuthentication", JWTAuthentication), ("CachedJWTAuthentication", CachedJWTAuthentication)]
+# (label, method, path, body); each like is undone by the next request
+REQUESTS = [
+    ("like", "put", "/postlikes/{post_id}/", None),
+    ("unlike", "delete", "/postlikes/{post_id}/", None),
+    ("comment", "post", "/post/{post_id}/comments/", {"message": "bench"}),
+    ("current user", "get", "/user/", None),
+]
+
+
+def counting(queries):
+    def wrapper(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+    return wrapper
+
+
+@contextmanager
+def authenticating_with(authentication_class):
+    # the views read APIView's class attribute, fixed from settings at import time
+    previous = APIView.authentication_classes
+    APIView.authentication_classes = [authentication_class]
+    try:
+        yield
+    finally:
+        APIView.authentication_classes = previous
+
+
+class Command(BaseCommand):
+    help = "Queries and latency per authenticated request with simplejwt's JWTAuthentication vs the cached user"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=200, help="rounds of every request per mode")
+        parser.add_argument("--users", type=int, default=200)
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            seed_dataset(users=options["users"])
+            user = CustomUser.objects.order_by("id").first()
+            post = Post.objects.exclude(likes__user=user).order_by("-like_count", "-id").first()
+            client = Client(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+            results = {}
+            for mode, authentication_class in MODES:
+                cache.clear()
+                samples = {label: ([], []) for label, *_ in REQUESTS}
+                with authenticating_with(authentication_class):
+                    for _ in range(options["repeat"]):
+                        for label, method, path, body in REQUESTS:
+                            queries = []
+                            with connection.execute_wrapper(counting(queries)):
+                                start = time.perf_counter()
+                                response = getattr(client, method)(path.format(post_id=post.id), body)
+                                elapsed = (time.perf_counter() - start) * 1000
+                            assert response.status_code < 300, f"{mode} {label}: {response.status_code}"
+                            samples[label][0].append(len(queries))
+                            samples[label][1].append(elapsed)
+                results[mode] = samples
+
+        for label, *_ in REQUESTS:
+            for mode, _ in MODES:
+                counts, latencies = results[mode][label]
+                # the first round fills the cache, steady state is the median
+                stats = summarize(latencies)
+                self.stdout.write(
+                    f"{label:13} {mode:24} {sorted(counts)[len(counts) // 2]:3} queries  "
+                    f"p50 {stats['p50']:7.2f} ms  p99 {stats['p99']:7.2f} ms"
+                )
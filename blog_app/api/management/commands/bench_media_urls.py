@@ -0,0 +1,52 @@
+import time
+from unittest import mock
+
+from cloudinary import CloudinaryResource
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api import media
+from api.models import CustomUser, Post
+from api.serializers import PostSerializer
+
+
+class Command(BaseCommand):
+    help = "Serialize in-memory posts with and without the media URL cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=10000)
+        parser.add_argument("--authors", type=int, default=500, help="distinct profile pictures")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        authors = [
+            CustomUser(id=i, username=f"user{i}", profile_pic=CloudinaryResource(f"avatars/{i}", format="jpg"))
+            for i in range(options["authors"])
+        ]
+        posts = []
+        for i in range(options["posts"]):
+            post = Post(
+                id=i, content="bench", created_at=now, updated_at=now,
+                image=CloudinaryResource(f"posts/{i}", format="jpg", version="1700000000"),
+                video=CloudinaryResource(f"clips/{i}", format="mov", resource_type="video") if i % 10 == 0 else None,
+            )
+            post.author = authors[i % len(authors)]
+            posts.append(post)
+
+        def serialize():
+            start = time.perf_counter()
+            PostSerializer(posts, many=True).data
+            return time.perf_counter() - start
+
+        # lru_cache keeps the undecorated function around, use it for the baseline
+        with mock.patch.object(media, "_cached_url", media._cached_url.__wrapped__):
+            uncached = serialize()
+        media.clear_url_cache()
+        cold = serialize()
+        warm = serialize()
+
+        count = len(posts)
+        self.stdout.write(f"{count} posts, {options['authors']} authors")
+        for label, seconds in (("uncached", uncached), ("cache cold", cold), ("cache warm", warm)):
+            self.stdout.write(f"{label:11} {seconds * 1000:9.1f} ms  {count / seconds:10.0f} rows/s")
+        self.stdout.write(f"url cache: {media.url_cache_stats()}")
@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.settings import api_settings
+from rest_framework.test import APIClient
+
+from api.models import CustomUser, Post
+from api.pagination import encode_cursor
+
+from ._bench import scratch_database, timed
+
+
+class Command(BaseCommand):
+    help = "Compare page-number and keyset latency for GET /posts/ at a deep page"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--page", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        page = options["page"]
+        page_size = api_settings.PAGE_SIZE
+        total = (page + 1) * page_size
+        with scratch_database():
+            author = CustomUser.objects.create_user(username="bench", email="bench@example.com", password="x")
+            now = timezone.now()
+            Post.objects.bulk_create(
+                [Post(author=author, content=f"post {i}") for i in range(total)], batch_size=1000
+            )
+            # bulk_create skips auto_now_add spreading, give every row its own timestamp
+            for post in Post.objects.only("id").iterator():
+                Post.objects.filter(pk=post.pk).update(created_at=now - timedelta(seconds=post.pk))
+
+            # the row just before the requested page, i.e. where a client walking cursors would be
+            anchor = Post.objects.order_by("-created_at", "-id")[(page - 1) * page_size - 1]
+            cursor = encode_cursor(anchor.created_at, anchor.id)
+            client = APIClient()
+            results = {
+                "page_number": timed(lambda: client.get(f"/posts/?page={page}"), options["repeat"]),
+                "keyset": timed(lambda: client.get(f"/posts/?cursor={cursor}"), options["repeat"]),
+            }
+            # both modes must return the same rows
+            legacy_ids = [p["id"] for p in client.get(f"/posts/?page={page}").json()]
+            keyset_ids = [p["id"] for p in client.get(f"/posts/?cursor={cursor}").json()]
+            assert legacy_ids == keyset_ids, "page-number and keyset pages disagree"
+
+        self.stdout.write(f"{total} posts, page {page} (page size {page_size})")
+        for mode, stats in results.items():
+            self.stdout.write(
+                f"{mode:12} p50 {stats['p50']:8.2f} ms  p99 {stats['p99']:8.2f} ms  mean {stats['mean']:8.2f} ms"
+            )
@@ -0,0 +1,118 @@
+import statistics
+import time
+
+from cloudinary import CloudinaryResource
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from api import comments, fastpath
+from api.models import Comment, CustomUser, Post
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import CommentSerializer, PostSerializer
+from api.viewer import viewer_state_for_posts, viewer_state_for_rows
+
+from ._bench import scratch_database, seed_dataset
+
+PHASES = ("fetch", "build", "render")
+
+
+def add_media(batch_size=1000):
+    """Seeded posts have no media; give half of them an image and every tenth a video, like real cards"""
+    posts = list(Post.objects.only("id"))
+    for post in posts:
+        if post.id % 2:
+            post.image = CloudinaryResource(f"posts/{post.id}", format="jpg", version="1700000000")
+        if post.id % 10 == 0:
+            post.video = CloudinaryResource(f"clips/{post.id}", format="mov", resource_type="video")
+    Post.objects.bulk_update(posts, ["image", "video"], batch_size=batch_size)
+
+
+def serializer_posts(viewer, limit, previews):
+    posts = list(Post.objects.select_related("author").order_by("-created_at", "-id")[:limit])
+    context = {"viewer_state": viewer_state_for_posts(viewer, posts), "comment_previews": previews}
+    if previews:
+        context["comment_preview_rows"] = comments.latest_for_posts([post.id for post in posts], previews)
+    yield len(posts)
+    data = PostSerializer(posts, many=True, context=context).data
+    yield
+    yield JSONRenderer().render(data)
+
+
+def fast_posts(viewer, limit, previews):
+    rows = list(fastpath.post_rows(Post.objects.order_by("-created_at", "-id"))[:limit])
+    state, preview_rows = viewer_state_for_rows(viewer, rows), fastpath.preview_rows(rows, previews)
+    yield len(rows)
+    data = fastpath.post_data(rows, state, preview_rows)
+    yield
+    yield FastJSONRenderer().render(data)
+
+
+def serializer_comments(viewer, limit, previews):
+    rows = list(Comment.objects.select_related("user").order_by("-created_at", "-id")[:limit])
+    yield len(rows)
+    data = CommentSerializer(rows, many=True).data
+    yield
+    yield JSONRenderer().render(data)
+
+
+def fast_comments(viewer, limit, previews):
+    rows = list(fastpath.comment_rows(Comment.objects.order_by("-created_at", "-id"))[:limit])
+    yield len(rows)
+    data = fastpath.comment_data(rows)
+    yield
+    yield FastJSONRenderer().render(data)
+
+
+# (list, [(mode, steps)]); steps yield the row count once fetched, then once built, then the body
+CASES = [
+    ("posts", [("serializers", serializer_posts), ("fastpath", fast_posts)]),
+    ("comments", [("serializers", serializer_comments), ("fastpath", fast_comments)]),
+]
+
+
+def run(steps, *args):
+    """(row count, body, seconds per phase) for one pass of steps"""
+    values, seconds = [], []
+    start = time.perf_counter()
+    for value in steps(*args):
+        now = time.perf_counter()
+        values.append(value)
+        seconds.append(now - start)
+        start = now
+    return values[0], values[-1], seconds
+
+
+class Command(BaseCommand):
+    help = (
+        "Rows per second of the post and comment lists through the serializers and JSONRenderer vs "
+        "api/fastpath.py and FastJSONRenderer, on a seeded scratch database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200, help="seeded users, ten posts each")
+        parser.add_argument("--rows", type=int, default=1000, help="rows per list")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--comments", type=int, default=0, help="latest_comments per post, as ?comments=N")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"encoder: {'orjson ' + orjson.__version__ if orjson else 'json (orjson not installed)'}")
+        with scratch_database():
+            seed_dataset(users=options["users"])
+            add_media()
+            viewer = CustomUser.objects.order_by("-following_count").first()
+            arguments = (viewer, options["rows"], options["comments"])
+            for label, modes in CASES:
+                bodies = {}
+                for mode, steps in modes:
+                    # warm the media URL cache and the query plans
+                    rows, bodies[mode], _ = run(steps, *arguments)
+                    passes = [run(steps, *arguments)[2] for _ in range(options["repeat"])]
+                    phases = [statistics.median(seconds) for seconds in zip(*passes)]
+                    cpu = phases[1] + phases[2]
+                    self.stdout.write(
+                        f"{label:9} {mode:12} "
+                        + "  ".join(f"{phase} {seconds * 1000:7.2f} ms" for phase, seconds in zip(PHASES, phases))
+                        + f"  {rows / cpu:10.0f} rows/s build+render  {rows / sum(phases):9.0f} rows/s total"
+                    )
+                same = len(set(bodies.values())) == 1
+                self.stdout.write(f"{label:9} bodies {'identical' if same else 'DIFFER'} ({len(bodies['fastpath'])} bytes)")
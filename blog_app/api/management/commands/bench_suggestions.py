@@ -0,0 +1,97 @@
+import itertools
+import random
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from api import relations, suggestions
+from api.models import CustomUser, Follow
+
+from ._bench import scratch_database, timed
+
+BATCH_SIZE = 5000
+
+
+def two_hop(user_id, window):
+    """What a per-request suggestion query costs without the candidate table"""
+    following = Follow.objects.filter(follower_id=user_id).values("followed_id")
+    rows = (
+        Follow.objects.filter(follower_id__in=following)
+        .exclude(followed_id=user_id)
+        .exclude(followed_id__in=following)
+        .values("followed_id")
+        .annotate(mutual=Count("id"))
+        .order_by("-mutual", "-followed_id")[:window]
+    )
+    return [(row["followed_id"], row["mutual"]) for row in rows]
+
+
+def two_hop_users(user_id, window):
+    """The two-hop join plus loading the suggested users, as an endpoint would"""
+    ranked = two_hop(user_id, window)
+    users = CustomUser.objects.only(*suggestions.USER_FIELDS).in_bulk([pk for pk, _ in ranked])
+    return [users[pk] for pk, _ in ranked]
+
+
+class Command(BaseCommand):
+    help = "Two-hop join vs precomputed candidates for GET /users/suggested/ on a synthetic follow graph"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000)
+        parser.add_argument("--following", type=int, default=20, help="average accounts followed per user")
+        parser.add_argument("--samples", type=int, default=20, help="readers to time")
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        user_count, following = options["users"], options["following"]
+        with scratch_database():
+            self.stdout.write(f"building {user_count} users / ~{user_count * following} follows...")
+            CustomUser.objects.bulk_create(
+                (CustomUser(username=f"u{i}", email=f"u{i}@example.com", password="!") for i in range(user_count)),
+                batch_size=BATCH_SIZE,
+            )
+            ids = list(CustomUser.objects.order_by("id").values_list("id", flat=True))
+            edges = []
+            for follower_id in ids:
+                # squaring skews follows towards low ids, a few accounts end up very popular
+                targets = {ids[int(len(ids) * rng.random() ** 2)] for _ in range(following)}
+                targets.discard(follower_id)
+                edges.extend(Follow(follower_id=follower_id, followed_id=target) for target in targets)
+                if len(edges) >= BATCH_SIZE:
+                    Follow.objects.bulk_create(edges, ignore_conflicts=True)
+                    edges = []
+            Follow.objects.bulk_create(edges, ignore_conflicts=True)
+            call_command("reconcile_counters", chunk_size=BATCH_SIZE, stdout=self.stdout)
+
+            readers = rng.sample(ids, min(options["samples"], len(ids)))
+            for user_id in readers:
+                suggestions.rebuild(user_id)
+            window = suggestions.window_size()
+            users = {user.id: user for user in CustomUser.objects.filter(id__in=readers)}
+            for user_id in readers:
+                expected = two_hop(user_id, window)
+                got = [(user.id, user.mutual_count) for user in suggestions.ranked(users[user_id])]
+                assert got[:len(expected)] == expected, "precomputed candidates disagree with the two-hop join"
+
+            cycle = itertools.cycle(readers)
+            pairs = itertools.cycle([(rng.choice(ids), rng.choice(ids)) for _ in range(options["repeat"])])
+
+            def follow_and_unfollow():
+                follower_id, followed_id = next(pairs)
+                if follower_id != followed_id and relations.follow(follower_id, followed_id):
+                    relations.unfollow(follower_id, followed_id)
+
+            results = {
+                "two-hop join": timed(lambda: two_hop_users(next(cycle), window), options["repeat"]),
+                "precomputed": timed(lambda: suggestions.ranked(users[next(cycle)]), options["repeat"]),
+                "follow+unfollow": timed(follow_and_unfollow, options["repeat"]),
+            }
+
+        self.stdout.write(f"{user_count} users, {following} follows each, window {window}")
+        for mode, stats in results.items():
+            self.stdout.write(
+                f"{mode:16} p50 {stats['p50']:8.2f} ms  p99 {stats['p99']:8.2f} ms  mean {stats['mean']:8.2f} ms"
+            )
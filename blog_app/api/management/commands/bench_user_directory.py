@@ -0,0 +1,53 @@
+import itertools
+import random
+import string
+
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIClient
+
+from api import directory
+from api.models import CustomUser
+
+from ._bench import scratch_database, timed
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = "Latency of GET /users/directory/ prefix lookups against a substring scan"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200000)
+        parser.add_argument("--repeat", type=int, default=200)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        letters = string.ascii_lowercase
+        with scratch_database():
+            names = set()
+            while len(names) < options["users"]:
+                names.add("".join(rng.choices(letters, k=rng.randint(5, 12))))
+            CustomUser.objects.bulk_create(
+                (CustomUser(username=name, email=f"{name}@example.com", password="!") for name in names),
+                batch_size=BATCH_SIZE,
+            )
+            prefixes = itertools.cycle(
+                ["".join(rng.choices(letters, k=rng.randint(1, 4))) for _ in range(options["repeat"])]
+            )
+            client = APIClient()
+            results = {
+                "endpoint": timed(lambda: client.get(f"/users/directory/?q={next(prefixes)}"), options["repeat"]),
+                "prefix range": timed(lambda: directory.lookup("username", next(prefixes)), options["repeat"]),
+                # what a "contains" search over the user table costs
+                "substring scan": timed(
+                    lambda: list(CustomUser.objects.filter(username__icontains=next(prefixes)).order_by("username")[:10]),
+                    options["repeat"],
+                ),
+            }
+
+        self.stdout.write(f"{options['users']} users")
+        for mode, stats in results.items():
+            self.stdout.write(
+                f"{mode:15} p50 {stats['p50']:8.2f} ms  p99 {stats['p99']:8.2f} ms  mean {stats['mean']:8.2f} ms"
+            )
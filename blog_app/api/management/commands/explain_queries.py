@@ -0,0 +1,172 @@
+import json
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.models import CustomUser, Post
+
+from ._bench import scratch_database, seed_dataset, timed
+
+# (name, url template, warnings that are expected) for every read endpoint;
+# templates are filled from the seeded data
+ENDPOINTS = [
+    ("post list", "/posts/", ()),
+    ("post list by author", "/posts/?author={username}", ()),
+    # legacy page numbers, its COUNT(*) checks deleted_at on every row
+    ("post list, page numbers", "/posts/?page=3", ("full scan",)),
+    ("post detail", "/post/{post_id}/", ()),
+    ("post status", "/post/{post_id}/status/", ()),
+    ("post page", "/post/{post_id}/page/", ()),
+    ("post comments", "/post/{post_id}/comments/", ()),
+    ("comments by post", "/comments/?post={post_id}", ()),
+    ("post likes", "/postlikes/{post_id}/", ()),
+    ("like state", "/postlikes/state/?ids={post_ids}", ()),
+    # relevance is computed per query, ranking the matches always needs a sort
+    ("search", "/posts/search/?q=sunset", ("sort",)),
+    ("explore", "/explore/", ()),
+    ("feed", "/feed/", ()),
+    ("feed with comment previews", "/feed/?comments=3", ()),
+    ("suggested users", "/users/suggested/", ()),
+    ("user directory", "/users/directory/?q={prefix}", ()),
+    # legacy LimitOffsetPagination listing, its COUNT(*) reads the whole table
+    ("users", "/users/", ("full scan",)),
+    ("current user", "/user/", ()),
+    ("account export", "/user/export/", ()),
+]
+
+# plan lines that usually mean a missing or unused index, per backend
+PLAN_WARNINGS = {
+    "sqlite": [
+        # scans of constant rows and of subquery results are not table scans
+        (re.compile(r"\bSCAN (?!CONSTANT|\(|qualify\b)(?!.*\bUSING (COVERING )?INDEX\b)"), "full scan"),
+        (re.compile(r"USE TEMP B-TREE FOR (ORDER|GROUP) BY"), "sort"),
+    ],
+    "mysql": [
+        (re.compile(r"\| ALL \|"), "full scan"),
+        (re.compile(r"Using filesort"), "sort"),
+    ],
+    "postgresql": [
+        (re.compile(r"Seq Scan"), "full scan"),
+        (re.compile(r"^\s*(->\s*)?Sort\b"), "sort"),
+    ],
+}
+
+
+def explain(sql):
+    """EXPLAIN output for one captured statement, one string per plan row"""
+    with connection.cursor() as cursor:
+        cursor.execute(connection.ops.explain_query_prefix() + " " + sql)
+        rows = cursor.fetchall()
+    if connection.vendor == "sqlite":
+        # (id, parent, notused, detail)
+        return [row[-1] for row in rows]
+    return [" | ".join(str(col) for col in row) for row in rows]
+
+
+# SQLite names derived tables it reads row by row ("CO-ROUTINE slice_0", then "SCAN slice_0")
+_SUBQUERY_NAME = re.compile(r"^(?:CO-ROUTINE|MATERIALIZE) (\S+)")
+
+
+def plan_warnings(plan):
+    patterns = PLAN_WARNINGS.get(connection.vendor, [])
+    subqueries = {match.group(1) for line in plan if (match := _SUBQUERY_NAME.match(line))}
+    # reading a subquery's own result isn't a table scan
+    plan = [line for line in plan if line.removeprefix("SCAN ") not in subqueries]
+    return sorted({label for line in plan for pattern, label in patterns if pattern.search(line)})
+
+
+def _read(response):
+    return b"".join(response.streaming_content) if response.streaming else response.content
+
+
+def explain_endpoint(client, url, repeat=10, allowed=()):
+    """Status, latency, and the plan of every SELECT one GET of url runs"""
+    # the capture indexes into a bounded log, which seeding has usually filled
+    connection.queries_log.clear()
+    with CaptureQueriesContext(connection) as captured:
+        # streamed bodies run their queries as they are read
+        response = client.get(url)
+        _read(response)
+    queries = []
+    for query in captured.captured_queries:
+        sql = query["sql"]
+        if not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+            continue
+        plan = explain(sql)
+        warnings = [label for label in plan_warnings(plan) if label not in allowed]
+        queries.append({"sql": sql, "plan": plan, "warnings": warnings})
+    return {
+        "url": url,
+        "status": response.status_code,
+        "query_count": len(captured.captured_queries),
+        "timing": timed(lambda: _read(client.get(url)), repeat),
+        "queries": queries,
+    }
+
+
+def endpoint_urls():
+    """ENDPOINTS filled in from whatever is in the database"""
+    post = Post.objects.order_by("-like_count", "-id").select_related("author").first()
+    if post is None:
+        raise CommandError("no posts to explain, seed the database first")
+    post_ids = ",".join(str(pk) for pk in Post.objects.order_by("-id").values_list("id", flat=True)[:20])
+    values = {
+        "post_id": post.id,
+        "post_ids": post_ids,
+        "username": post.author.username,
+        "prefix": post.author.username[:3],
+    }
+    return [(name, template.format(**values), allowed) for name, template, allowed in ENDPOINTS]
+
+
+class Command(BaseCommand):
+    help = "Seed a scratch database, then capture EXPLAIN plans and timings for every read endpoint's queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=500)
+        parser.add_argument("--posts-per-user", type=int, default=20)
+        parser.add_argument("--follows-per-user", type=int, default=30)
+        parser.add_argument("--repeat", type=int, default=10)
+        parser.add_argument("--json", help="also write the full report to this file")
+        parser.add_argument("--verbose-plans", action="store_true", help="print every plan, not just flagged ones")
+        parser.add_argument("--strict", action="store_true", help="exit non-zero when any plan is flagged")
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            seed_dataset(
+                users=options["users"],
+                posts_per_user=options["posts_per_user"],
+                follows_per_user=options["follows_per_user"],
+            )
+            viewer = CustomUser.objects.order_by("-following_count").first()
+            client = APIClient()
+            client.force_authenticate(viewer)
+            report = [
+                {"name": name, **explain_endpoint(client, url, options["repeat"], allowed)}
+                for name, url, allowed in endpoint_urls()
+            ]
+
+        flagged = 0
+        for entry in report:
+            timing = entry["timing"]
+            self.stdout.write(
+                f"{entry['name']:28} {entry['status']}  {entry['query_count']:2} queries  "
+                f"p50 {timing['p50']:7.2f} ms  p99 {timing['p99']:7.2f} ms"
+            )
+            for query in entry["queries"]:
+                if query["warnings"]:
+                    flagged += 1
+                if query["warnings"] or options["verbose_plans"]:
+                    label = ", ".join(query["warnings"]) or "ok"
+                    self.stdout.write(f"    [{label}] {query['sql'][:160]}")
+                    for line in query["plan"]:
+                        self.stdout.write(f"        {line}")
+        if options["json"]:
+            with open(options["json"], "w") as fh:
+                json.dump({"vendor": connection.vendor, "endpoints": report}, fh, indent=2, default=str)
+        self.stdout.write(f"{flagged} flagged plans on {connection.vendor}")
+        if flagged and options["strict"]:
+            raise CommandError(f"{flagged} query plans need an index")
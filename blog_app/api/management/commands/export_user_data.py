@@ -0,0 +1,69 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+
+from api import export
+from api.models import CustomUser
+
+
+def resume_point(path):
+    """(checkpoint, offset just past its line, done) of a partly written NDJSON export"""
+    after, offset, position = None, 0, 0
+    if not os.path.exists(path):
+        return after, offset, False
+    with open(path, "rb") as fh:
+        # one line at a time, the file can be larger than memory
+        for line in fh:
+            position += len(line)
+            if not line.endswith(b"\n"):
+                break
+            if line.startswith(b'{"type":"checkpoint"'):
+                after, offset = json.loads(line)["after"], position
+            elif line.startswith(b'{"type":"done"'):
+                return after, position, True
+    return after, offset, False
+
+
+class Command(BaseCommand):
+    help = "Write a user's posts, comments, likes and follows to an NDJSON (or --zip) file, resumable"
+
+    def add_arguments(self, parser):
+        parser.add_argument("user", help="email or username")
+        parser.add_argument("output", help="file to write")
+        parser.add_argument("--zip", action="store_true", help="a zip with one NDJSON member per section")
+        parser.add_argument("--after", help="start behind this checkpoint token")
+        parser.add_argument(
+            "--resume", action="store_true",
+            help="continue an interrupted NDJSON export in output from its last checkpoint",
+        )
+
+    def handle(self, *args, **options):
+        user = CustomUser.objects.filter(Q(email=options["user"]) | Q(username=options["user"])).first()
+        if user is None:
+            raise CommandError(f"No user {options['user']!r}")
+        after, offset = options["after"], 0
+        if options["resume"]:
+            if options["zip"]:
+                # a cut-off zip has no central directory to append to
+                raise CommandError("--resume continues NDJSON files; write the rest of a zip with --after")
+            after, offset, done = resume_point(options["output"])
+            if done:
+                self.stdout.write(self.style.SUCCESS(f"{options['output']} is already complete"))
+                return
+        if after:
+            try:
+                export.decode_checkpoint(after)
+            except NotFound:
+                raise CommandError(f"Invalid checkpoint {after!r}")
+
+        write = export.zip_archive if options["zip"] else export.ndjson
+        with open(options["output"], "r+b" if offset else "wb") as fh:
+            fh.seek(offset)
+            fh.truncate()
+            for block in write(user.id, after):
+                fh.write(block)
+            size = fh.tell()
+        self.stdout.write(self.style.SUCCESS(f"Exported {user.username} to {options['output']} ({size} bytes)"))
@@ -0,0 +1,243 @@
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import URLPattern, get_resolver
+from django.views.static import serve
+
+from ._bench import SEED_PASSWORD, summarize
+
+# (name, route pattern in blog_app/urls.py, method, path template, JSON body, expected statuses)
+# templates are filled in by Command.prepare from a logged-in session
+SCENARIOS = [
+    ("admin login redirect", "admin/", "GET", "/admin/", None, (302,)),
+    ("post list", "posts/", "GET", "/posts/", None, (200,)),
+    ("post list + previews", "posts/", "GET", "/posts/?comments=3", None, (200,)),
+    ("create post", "posts/", "POST", "/posts/", {"content": "load test sunset"}, (201,)),
+    ("search", "posts/search/", "GET", "/posts/search/?q=sunset", None, (200,)),
+    ("explore", "explore/", "GET", "/explore/", None, (200,)),
+    ("feed", "feed/", "GET", "/feed/", None, (200,)),
+    ("post detail", "post/<int:pk>/", "GET", "/post/{post_id}/", None, (200,)),
+    ("post status", "post/<int:pk>/status/", "GET", "/post/{post_id}/status/", None, (200,)),
+    ("post page", "post/<int:pk>/page/", "GET", "/post/{post_id}/page/", None, (200,)),
+    ("post comments", "post/<int:pk>/comments/", "GET", "/post/{post_id}/comments/", None, (200,)),
+    ("reply", "post/<int:pk>/comments/", "POST", "/post/{post_id}/comments/", {"message": "nice"}, (201,)),
+    ("comments by post", "comments/", "GET", "/comments/?post={post_id}", None, (200,)),
+    ("edit comment", "comment/<int:pk>", "PUT", "/comment/{comment_id}", {"message": "edited"}, (200,)),
+    ("post likes", "postlikes/<int:pk>/", "GET", "/postlikes/{post_id}/", None, (200,)),
+    ("like", "postlikes/<int:pk>/", "PUT", "/postlikes/{post_id}/", None, (200, 201)),
+    ("unlike", "postlikes/<int:pk>/", "DELETE", "/postlikes/{post_id}/", None, (204,)),
+    ("toggle like", "postlikes/<int:pk>/", "POST", "/postlikes/{post_id}/", None, (200, 201)),
+    ("like state", "postlikes/state/", "GET", "/postlikes/state/?ids={post_ids}", None, (200,)),
+    ("obtain token", "api/token/", "POST", "/api/token/", {"email": "{email}", "password": "{password}"}, (200,)),
+    ("refresh token", "api/token/refresh/", "POST", "/api/token/refresh/", {"refresh": "{refresh}"}, (200,)),
+    ("register", "register/", "POST", "/register/", {
+        "username": "lt{n}", "email": "lt{n}@example.com", "password": "pass12345", "confirmPassword": "pass12345",
+    }, (201,)),
+    ("users", "users/", "GET", "/users/", None, (200,)),
+    ("suggested users", "users/suggested/", "GET", "/users/suggested/", None, (200,)),
+    ("user directory", "users/directory/", "GET", "/users/directory/?q={prefix}1", None, (200,)),
+    ("current user", "user/", "GET", "/user/", None, (200,)),
+    ("account export", "user/export/", "GET", "/user/export/", None, (200,)),
+    ("toggle follow", "follow/", "POST", "/follow/", {"following": "{other_id}"}, (200, 201)),
+    ("follow", "follow/<int:user_id>/", "PUT", "/follow/{other_id}/", None, (200, 201)),
+    ("unfollow", "follow/<int:user_id>/", "DELETE", "/follow/{other_id}/", None, (204,)),
+    ("metrics", "metrics", "GET", "/metrics", None, (200,)),
+    ("swagger", "^swagger/$", "GET", "/swagger/", None, (200,)),
+    ("redoc", "^redoc/$", "GET", "/redoc/", None, (200,)),
+]
+
+
+def route_patterns():
+    """Every route of blog_app/urls.py as written there, minus the DEBUG media server"""
+    return [
+        str(pattern.pattern) for pattern in get_resolver().url_patterns
+        if not (isinstance(pattern, URLPattern) and pattern.callback is serve)
+    ]
+
+
+def _fill(value, context):
+    if isinstance(value, str):
+        return value.format(**context)
+    if isinstance(value, dict):
+        return {key: _fill(item, context) for key, item in value.items()}
+    return value
+
+
+class Client:
+    """One keep-alive connection per worker thread"""
+
+    def __init__(self, base_url, token=None):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self.token = token
+        self.connection = None
+
+    def request(self, method, path, body=None):
+        headers = {"Accept": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        for attempt in (1, 2):
+            if self.connection is None:
+                self.connection = self.connection_class(self.host, self.port, timeout=30)
+            try:
+                self.connection.request(method, path, payload, headers)
+                response = self.connection.getresponse()
+                data = response.read()
+                return response.status, data
+            except (http.client.HTTPException, OSError):
+                # the server dropped the keep-alive connection, reconnect once
+                self.connection.close()
+                self.connection = None
+                if attempt == 2:
+                    raise
+
+    def json(self, method, path, body=None):
+        status, data = self.request(method, path, body)
+        if status >= 400:
+            raise CommandError(f"{method} {path} answered {status}: {data[:200]!r}")
+        return json.loads(data) if data else None
+
+
+class Command(BaseCommand):
+    help = "Drive every route against a running server and report throughput and p50/p95/p99 per endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--email", default="user0@example.com", help="a seeded account (see seed_data)")
+        parser.add_argument("--password", default=SEED_PASSWORD)
+        parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--only", action="append", help="run just these scenario names")
+        parser.add_argument("--output", help="write the results as JSON to this file")
+        parser.add_argument("--compare", help="baseline JSON from an earlier --output to diff p95 against")
+
+    def prepare(self, options):
+        """Log in and collect the ids the scenario templates refer to"""
+        client = Client(options["base_url"])
+        tokens = client.json("POST", "/api/token/", {"email": options["email"], "password": options["password"]})
+        client.token = tokens["access"]
+        me = client.json("GET", "/user/")
+        posts = client.json("GET", "/posts/")
+        if not posts:
+            raise CommandError("the server has no posts, run seed_data first")
+        prefix = options["email"].split("@")[0].rstrip("0123456789")
+        others = [user for user in client.json("GET", f"/users/directory/?q={prefix}&limit=5")["results"]
+                  if user["id"] != me["id"]]
+        if not others:
+            raise CommandError(f"no other {prefix}* accounts to follow, run seed_data first")
+        comment = client.json("POST", f"/post/{posts[0]['id']}/comments/", {"message": "load test"})
+        return tokens["access"], {
+            "post_id": posts[0]["id"],
+            "post_ids": ",".join(str(post["id"]) for post in posts),
+            "comment_id": comment["id"],
+            "other_id": others[0]["id"],
+            "email": options["email"],
+            "password": options["password"],
+            "refresh": tokens["refresh"],
+            "prefix": prefix,
+        }
+
+    def run_scenario(self, scenario, options, token, context):
+        name, _, method, path, body, expected = scenario
+        total, concurrency = options["requests"], max(1, options["concurrency"])
+        counter = iter(range(total))
+        lock = threading.Lock()
+        samples, statuses, errors = [], {}, []
+        # register needs a fresh account per request
+        run_id = int(time.time() * 1000)
+
+        def worker():
+            client = Client(options["base_url"], token)
+            while True:
+                with lock:
+                    n = next(counter, None)
+                if n is None:
+                    return
+                values = {**context, "n": f"{run_id}x{n}"}
+                start = time.perf_counter()
+                try:
+                    status, _ = client.request(method, _fill(path, values), _fill(body, values))
+                except Exception as exc:
+                    with lock:
+                        errors.append(repr(exc))
+                    continue
+                elapsed = (time.perf_counter() - start) * 1000
+                with lock:
+                    samples.append(elapsed)
+                    statuses[status] = statuses.get(status, 0) + 1
+                    if status not in expected:
+                        errors.append(f"unexpected {status}")
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+        result = {
+            "name": name,
+            "method": method,
+            "path": path,
+            "requests": len(samples),
+            "errors": len(errors),
+            "statuses": {str(code): count for code, count in sorted(statuses.items())},
+            "throughput_rps": len(samples) / wall if wall else 0.0,
+        }
+        if samples:
+            result.update(summarize(samples))
+        if errors:
+            result["first_error"] = errors[0]
+        return result
+
+    def handle(self, *args, **options):
+        scenarios = SCENARIOS
+        if options["only"]:
+            scenarios = [scenario for scenario in SCENARIOS if scenario[0] in options["only"]]
+        covered = {scenario[1] for scenario in SCENARIOS}
+        uncovered = [route for route in route_patterns() if route not in covered]
+        if uncovered:
+            self.stderr.write(f"routes without a scenario: {', '.join(uncovered)}")
+
+        token, context = self.prepare(options)
+        results = []
+        for scenario in scenarios:
+            result = self.run_scenario(scenario, options, token, context)
+            results.append(result)
+            self.stdout.write(
+                f"{result['name']:22} {result['requests']:5} req  {result['errors']:3} err  "
+                f"{result['throughput_rps']:8.1f} req/s  p50 {result.get('p50', 0):7.2f}  "
+                f"p95 {result.get('p95', 0):7.2f}  p99 {result.get('p99', 0):7.2f} ms"
+            )
+
+        report = {
+            "base_url": options["base_url"],
+            "requests_per_scenario": options["requests"],
+            "concurrency": options["concurrency"],
+            "uncovered_routes": uncovered,
+            "scenarios": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                json.dump(report, fh, indent=2)
+        if options["compare"]:
+            self.compare(results, options["compare"])
+
+    def compare(self, results, path):
+        with open(path) as fh:
+            baseline = {row["name"]: row for row in json.load(fh)["scenarios"]}
+        self.stdout.write(f"p95 against {path}:")
+        for row in results:
+            before = baseline.get(row["name"], {}).get("p95")
+            if before and "p95" in row:
+                change = (row["p95"] - before) / before * 100
+                self.stdout.write(f"  {row['name']:22} {before:7.2f} -> {row['p95']:7.2f} ms ({change:+.0f}%)")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from api import deletion
+from api.models import Deletion
+
+
+class Command(BaseCommand):
+    help = "Finish pending soft deletions (api/deletion.py) in batches, e.g. after a restart, or --status to list them"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None, help="rows per batch, DELETION_BATCH_SIZE by default")
+        parser.add_argument("--pause", type=float, default=None, help="seconds between batches")
+        parser.add_argument("--status", action="store_true", help="only print the pending deletions")
+
+    def handle(self, *args, **options):
+        if options["status"]:
+            for job in Deletion.objects.filter(finished_at__isnull=True).order_by("requested_at", "id"):
+                self.stdout.write(str(job))
+            return
+        jobs = deletion.reap(options["batch_size"], options["pause"])
+        for job in jobs:
+            self.stdout.write(str(job))
+        done = sum(job.finished_at is not None for job in jobs)
+        self.stdout.write(self.style.SUCCESS(f"{done} of {len(jobs)} pending deletions finished"))
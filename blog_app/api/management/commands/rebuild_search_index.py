@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import search
+from api.models import Post
+
+
+class Command(BaseCommand):
+    help = "Backfill the post search index (SearchTerm) in chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument("--start-id", type=int, default=0, help="resume after this post id")
+
+    def handle(self, *args, **options):
+        if search.backend() != "index":
+            raise CommandError("SEARCH_BACKEND uses MySQL FULLTEXT, which the database maintains itself")
+        last_id, done = options["start_id"], 0
+        while True:
+            posts = list(
+                Post.objects.filter(pk__gt=last_id)
+                .select_related("author")
+                .only("id", "content", "author__username")
+                .order_by("pk")[:options["chunk_size"]]
+            )
+            if not posts:
+                break
+            for post in posts:
+                search.index_post(post)
+            done += len(posts)
+            last_id = posts[-1].pk
+            self.stdout.write(f"indexed {done} posts (last id {last_id})")
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt"))
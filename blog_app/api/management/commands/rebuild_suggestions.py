@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max, OuterRef, Subquery
+
+from api import suggestions
+from api.models import CustomUser, Post
+
+
+class Command(BaseCommand):
+    help = "Recompute friend-of-friend suggestion candidates from the Follow graph"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, help="only rebuild this user id")
+
+    def handle(self, *args, **options):
+        users = CustomUser.objects.order_by("id")
+        if options["user"]:
+            users = users.filter(id=options["user"])
+        # last_posted_at predates the signal that maintains it on older databases
+        newest = Post.objects.filter(author=OuterRef("pk")).values("author").annotate(at=Max("created_at")).values("at")
+        users.update(last_posted_at=Subquery(newest))
+        for user_id in users.values_list("id", flat=True).iterator():
+            suggestions.rebuild(user_id)
+        self.stdout.write(self.style.SUCCESS("Suggestions rebuilt"))
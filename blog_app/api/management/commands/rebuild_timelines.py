@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from api import feed
+from api.models import CustomUser, Follow, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = "Rebuild materialized home timelines from the Follow graph"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, help="only rebuild this user id")
+
+    def handle(self, *args, **options):
+        users = CustomUser.objects.order_by("id").values_list("id", flat=True)
+        if options["user"]:
+            users = users.filter(id=options["user"])
+        for user_id in users.iterator():
+            TimelineEntry.objects.filter(user_id=user_id).delete()
+            # own posts first, then every followed account
+            feed.backfill(user_id, user_id)
+            followed = Follow.objects.filter(follower_id=user_id).values_list("followed_id", flat=True)
+            for followed_id in followed.iterator():
+                feed.backfill(user_id, followed_id)
+        self.stdout.write(self.style.SUCCESS("Timelines rebuilt"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api import trending
+
+
+class Command(BaseCommand):
+    help = "Recompute /explore/ trending scores from recent likes and comments, or --prune decayed rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--prune", action="store_true", help="only delete rows that decayed below MIN_WEIGHT")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options["prune"]:
+            self.stdout.write(self.style.SUCCESS(f"Pruned {trending.prune()} decayed posts"))
+            return
+        kept = trending.rebuild(batch_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Trending rebuilt, {kept} posts ranked"))
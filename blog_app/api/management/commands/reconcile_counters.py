@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from api.models import Comment, CustomUser, Follow, Likes, Post
+
+
+def _counts(model, group_field, ids):
+    rows = model.objects.filter(**{f"{group_field}__in": ids}).values(group_field).annotate(n=Count("id"))
+    return {row[group_field]: row["n"] for row in rows}
+
+
+class Command(BaseCommand):
+    help = "Recompute denormalized like/comment/follower counters in chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        fixed = self.reconcile(
+            Post, chunk_size,
+            like_count=(Likes, "post_id"),
+            comment_count=(Comment, "post_id"),
+        )
+        self.stdout.write(f"posts: {fixed} rows repaired")
+        fixed = self.reconcile(
+            CustomUser, chunk_size,
+            follower_count=(Follow, "followed_id"),
+            following_count=(Follow, "follower_id"),
+        )
+        self.stdout.write(f"users: {fixed} rows repaired")
+        self.stdout.write(self.style.SUCCESS("Counters reconciled"))
+
+    def reconcile(self, model, chunk_size, **counters):
+        """Walk model by primary key, one short transaction per chunk"""
+        fields = list(counters)
+        fixed, last_id = 0, 0
+        while True:
+            with transaction.atomic():
+                rows = list(
+                    model.objects.select_for_update()
+                    .filter(pk__gt=last_id)
+                    .order_by("pk")
+                    .only("pk", *fields)[:chunk_size]
+                )
+                if not rows:
+                    return fixed
+                ids = [row.pk for row in rows]
+                actual = {field: _counts(source, group, ids) for field, (source, group) in counters.items()}
+                stale = []
+                for row in rows:
+                    changed = False
+                    for field in fields:
+                        value = actual[field].get(row.pk, 0)
+                        if getattr(row, field) != value:
+                            setattr(row, field, value)
+                            changed = True
+                    if changed:
+                        stale.append(row)
+                model.objects.bulk_update(stale, fields)
+                fixed += len(stale)
+                last_id = ids[-1]
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api import ingest
+
+
+class Command(BaseCommand):
+    help = (
+        "Finish media ingestion (api/ingest.py) of posts a stopped process left processing; "
+        "run it before the app starts taking uploads again"
+    )
+
+    def handle(self, *args, **options):
+        resumed, failed = ingest.recover()
+        for post_id in failed:
+            self.stdout.write(f"post {post_id}: staged media lost, marked failed")
+        self.stdout.write(self.style.SUCCESS(f"{len(resumed)} resumed, {len(failed)} failed"))
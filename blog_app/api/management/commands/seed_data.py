@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import CustomUser
+
+from ._bench import BATCH_SIZE, SEED_PASSWORD, seed_dataset
+
+
+class Command(BaseCommand):
+    help = "Bulk-generate users, power-law follows, posts, likes and comments for local testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--posts-per-user", type=int, default=10)
+        parser.add_argument("--follows-per-user", type=int, default=30, help="average out-degree")
+        parser.add_argument("--likes-per-post", type=int, default=5)
+        parser.add_argument("--comments-per-post", type=int, default=3)
+        parser.add_argument("--alpha", type=float, default=1.1, help="Zipf exponent of account popularity")
+        parser.add_argument("--prefix", default="user", help="username/email prefix of generated accounts")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        prefix = options["prefix"]
+        if CustomUser.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(f"users named {prefix}* already exist, pick another --prefix")
+        user_ids = seed_dataset(
+            users=options["users"],
+            posts_per_user=options["posts_per_user"],
+            follows_per_user=options["follows_per_user"],
+            likes_per_post=options["likes_per_post"],
+            comments_per_post=options["comments_per_post"],
+            alpha=options["alpha"],
+            seed=options["seed"],
+            prefix=prefix,
+            batch_size=options["batch_size"],
+            progress=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(user_ids)} users; log in as {prefix}0@example.com / {SEED_PASSWORD}"
+        ))
@@ -0,0 +1,55 @@
+"""
+Memoized Cloudinary URL building for serializers.
+
+cloudinary_url() is pure string work, but it runs for every image, video
+and profile picture on every row we serialize. The same avatar shows up on
+every post of its author. Results are kept in a bounded LRU keyed by
+(public_id, resource_type, options), where options holds the format,
+version, delivery type and any transformation.
+"""
+from functools import lru_cache
+
+import cloudinary.utils
+from django.conf import settings
+
+
+@lru_cache(maxsize=getattr(settings, "MEDIA_URL_CACHE_SIZE", 50000))
+def _cached_url(public_id, resource_type, options):
+    return cloudinary.utils.cloudinary_url(public_id, resource_type=resource_type, **dict(options))[0]
+
+
+def build_url(public_id, resource_type="image", **options):
+    """cloudinary_url(public_id, resource_type=..., **options)[0], memoized"""
+    return _cached_url(public_id, resource_type, tuple(sorted(options.items())))
+
+
+def resource_url(resource):
+    """Same URL as CloudinaryResource.url, memoized"""
+    if not resource:
+        return None
+    return build_url(
+        resource.public_id,
+        resource.resource_type or "image",
+        format=resource.format,
+        version=resource.version,
+        type=resource.type,
+    )
+
+
+def video_url(resource):
+    """URL of a post video, transcoded to mp4 unless it already is one (browsers play mp4 everywhere)"""
+    if not resource:
+        return None
+    url = resource_url(resource)
+    if not url.endswith(".mp4"):
+        url = build_url(resource.public_id, resource_type="video", format="mp4", quality="auto")
+    return url
+
+
+def url_cache_stats():
+    info = _cached_url.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxsize": info.maxsize}
+
+
+def clear_url_cache():
+    _cached_url.cache_clear()
@@ -0,0 +1,384 @@
+"""
+Per-request SQL and latency instrumentation, exposed at /metrics.
+
+MetricsMiddleware wraps every request and records, per (method, route):
+
+    api_request_duration_seconds   total time spent in Django
+    api_request_queries            SQL statements run
+    api_request_db_seconds         time spent executing them
+    api_request_serialize_seconds  serializer .data plus response rendering
+
+The route label is the URL pattern as written in urls.py ("post/<int:pk>/"),
+so ids don't explode the label set. Queries are counted by an execute
+wrapper on every database connection; serializer time comes from a
+wrapper around BaseSerializer.data installed in ApiConfig.ready (and from
+serializing() around the serializer-free fast path), and render time from
+a post-render callback.
+
+The scrape needs "Authorization: Bearer <METRICS_TOKEN>"; with no token set
+only INTERNAL_IPS may read it, unless DEBUG is on.
+
+Histograms live in this process. Under several workers every process serves
+its own /metrics, so scrape them per worker (or behind a per-pod target).
+
+With METRICS_SLOW_QUERY_MS set, any statement slower than that is logged on
+the "api.metrics" logger together with the serializer field being rendered
+when it ran (e.g. PostSerializer.author_username, a lazy load) and the
+innermost frame of our own code.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+UNMATCHED = "<unmatched>"
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def enabled():
+    return getattr(settings, "METRICS_ENABLED", True)
+
+
+def slow_query_ms():
+    return getattr(settings, "METRICS_SLOW_QUERY_MS", None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels):
+        self.name, self.help, self.label_names = name, help_text, labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.label_names, labels)} {_number(value)}"
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels, buckets):
+        self.name, self.help, self.label_names = name, help_text, labels
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket (not cumulative), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, labels):
+        entry = self._values.get(labels)
+        return entry[2] if entry else 0
+
+    def total(self, labels):
+        entry = self._values.get(labels)
+        return entry[1] if entry else 0
+
+    def samples(self):
+        with self._lock:
+            values = sorted((labels, ([*entry[0]], entry[1], entry[2])) for labels, entry in self._values.items())
+        for labels, (buckets, total, count) in values:
+            cumulative = 0
+            for bound, hits in zip(self.buckets + (float("inf"),), buckets):
+                cumulative += hits
+                le = (("le", _number(bound)),)
+                yield f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {_number(float(total))}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {count}"
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+REQUESTS = Counter("api_requests_total", "Requests by route and status", ("method", "route", "status"))
+DURATION = Histogram(
+    "api_request_duration_seconds", "Total request latency", ("method", "route"), LATENCY_BUCKETS
+)
+QUERIES = Histogram("api_request_queries", "SQL statements per request", ("method", "route"), QUERY_BUCKETS)
+DB_TIME = Histogram(
+    "api_request_db_seconds", "Time spent executing SQL per request", ("method", "route"), LATENCY_BUCKETS
+)
+SERIALIZE_TIME = Histogram(
+    "api_request_serialize_seconds", "Serializer and renderer time per request", ("method", "route"), LATENCY_BUCKETS
+)
+SLOW_QUERIES = Counter("api_slow_queries_total", "Statements over METRICS_SLOW_QUERY_MS", ("route", "source"))
+REGISTRY = [REQUESTS, DURATION, QUERIES, DB_TIME, SERIALIZE_TIME, SLOW_QUERIES]
+
+
+def render():
+    """Every metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    for metric in REGISTRY:
+        metric.reset()
+
+
+def _route(request):
+    match = getattr(request, "resolver_match", None)
+    return match.route if match is not None and match.route else UNMATCHED
+
+
+class RequestStats:
+    __slots__ = ("request", "queries", "db_seconds", "serialize_seconds", "serializing", "render_started")
+
+    def __init__(self, request):
+        self.request = request
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+        # nesting depth of .data calls, only the outermost one is timed
+        self.serializing = 0
+        self.render_started = None
+
+    @property
+    def route(self):
+        # resolved by the time any view code runs
+        return _route(self.request)
+
+
+# a context variable rather than a thread local: async views run their
+# queries in a worker thread, which sync_to_async copies the context into
+_current = ContextVar("api_request_stats", default=None)
+
+
+def current():
+    """The RequestStats of the request being served, or None outside one"""
+    return _current.get()
+
+
+def serializer_source():
+    """'SerializerName.field' for the innermost serializer field on the stack"""
+    from rest_framework.fields import Field
+
+    frame = sys._getframe(1)
+    while frame is not None:
+        owner = frame.f_locals.get("self")
+        if isinstance(owner, Field) and owner.field_name and owner.parent is not None:
+            # the child of a many=True field is bound without a name, so the
+            # list itself is reported
+            return f"{type(owner.parent).__name__}.{owner.field_name}"
+        frame = frame.f_back
+    return None
+
+
+def app_frame():
+    """'file:line in function' for the innermost frame of the api app itself"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(_APP_DIR) and filename != __file__:
+            return f"{os.path.relpath(filename, os.path.dirname(_APP_DIR))}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper on every connection, adding each statement to the current request's stats"""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        threshold = slow_query_ms()
+        if threshold is not None and elapsed * 1000 >= threshold:
+            _log_slow(stats, context["connection"].alias, sql, elapsed)
+
+
+def _log_slow(stats, alias, sql, elapsed):
+    source = serializer_source()
+    SLOW_QUERIES.inc((stats.route, source or ""))
+    logger.warning(
+        "slow query %.1f ms on %s [%s] field=%s at=%s: %s",
+        elapsed * 1000, stats.route, alias, source or "-", app_frame() or "-", sql,
+    )
+
+
+def _wrap_connection(sender, connection, **kwargs):
+    # connection_created fires again on every reconnect of the same wrapper
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def serializing():
+    """Count the block as serializer time, for payloads built without a serializer (api/fastpath.py)"""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    stats.serializing += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializing -= 1
+        if not stats.serializing:
+            stats.serialize_seconds += time.perf_counter() - start
+
+
+def _timed_data(getter):
+    def data(self):
+        with serializing():
+            return getter(self)
+    data.__wrapped__ = getter
+    return data
+
+
+def install():
+    """
+    Wrap every database connection with record_query and time
+    BaseSerializer.data (Serializer/ListSerializer.data both go through it)
+    """
+    from rest_framework.serializers import BaseSerializer
+
+    connection_created.connect(_wrap_connection, dispatch_uid="api.metrics")
+    for connection in connections.all(initialized_only=True):
+        _wrap_connection(None, connection)
+    getter = BaseSerializer.data.fget
+    if not hasattr(getter, "__wrapped__"):
+        BaseSerializer.data = property(_timed_data(getter))
+
+
+class MetricsMiddleware:
+    """Sync and async capable, so ASGI requests to async views never hop threads here"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not enabled() or request.path == "/metrics":
+            return self.get_response(request)
+        stats = RequestStats(request)
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.observe(stats, response, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        if not enabled() or request.path == "/metrics":
+            return await self.get_response(request)
+        stats = RequestStats(request)
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.observe(stats, response, time.perf_counter() - start)
+        return response
+
+    @staticmethod
+    def observe(stats, response, elapsed):
+        labels = (stats.request.method, stats.route)
+        REQUESTS.inc(labels + (str(response.status_code),))
+        DURATION.observe(labels, elapsed)
+        QUERIES.observe(labels, stats.queries)
+        DB_TIME.observe(labels, stats.db_seconds)
+        SERIALIZE_TIME.observe(labels, stats.serialize_seconds)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the middleware chain hands them back
+        stats = _current.get()
+        if stats is not None:
+            stats.render_started = time.perf_counter()
+            response.add_post_render_callback(lambda rendered: self._rendered(stats))
+        return response
+
+    @staticmethod
+    def _rendered(stats):
+        if stats.render_started is not None:
+            stats.serialize_seconds += time.perf_counter() - stats.render_started
+            stats.render_started = None
+
+
+def metrics_view(request):
+    """Prometheus scrape target: a METRICS_TOKEN bearer token, else INTERNAL_IPS only (anyone under DEBUG)"""
+    token = getattr(settings, "METRICS_TOKEN", None)
+    if token:
+        header = request.headers.get("Authorization", "")
+        if not constant_time_compare(header, f"Bearer {token}"):
+            return HttpResponseForbidden()
+    elif not settings.DEBUG and request.META.get("REMOTE_ADDR") not in settings.INTERNAL_IPS:
+        # fail closed: a deploy that forgot the token doesn't publish its routes and timings
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def add_fulltext_index(apps, schema_editor):
+    # only MySQL has FULLTEXT; other databases use the SearchTerm index alone
+    if schema_editor.connection.vendor == "mysql":
+        schema_editor.execute("ALTER TABLE api_post ADD FULLTEXT INDEX post_content_fulltext (content)")
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "mysql":
+        schema_editor.execute("ALTER TABLE api_post DROP INDEX post_content_fulltext")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_denormalized_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='api.post')),
+            ],
+            options={
+                'unique_together': {('term', 'post')},
+            },
+        ),
+        migrations.RunPython(add_fulltext_index, drop_fulltext_index),
+    ]
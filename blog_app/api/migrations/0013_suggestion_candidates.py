@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_post_media_status'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SuggestionCandidate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mutual_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='last_posted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['-follower_count', '-id'], name='user_popular_idx'),
+        ),
+        migrations.AddField(
+            model_name='suggestioncandidate',
+            name='candidate',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='suggestioncandidate',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='suggestion_candidates', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='suggestioncandidate',
+            index=models.Index(fields=['user', '-mutual_count', '-candidate'], name='suggestion_user_rank_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='suggestioncandidate',
+            unique_together={('user', 'candidate')},
+        ),
+    ]
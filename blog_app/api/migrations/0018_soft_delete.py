@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_trendingpost'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='Deletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target', models.CharField(choices=[('post', 'Post'), ('user', 'User')], max_length=8)),
+                ('target_id', models.BigIntegerField()),
+                ('requested_at', models.DateTimeField(auto_now_add=True)),
+                ('step', models.CharField(blank=True, default='', max_length=32)),
+                ('deleted_rows', models.PositiveBigIntegerField(default=0)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['finished_at', 'requested_at'], name='deletion_pending_idx')],
+                'unique_together': {('target', 'target_id')},
+            },
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.db.models.functions import Lower
 from cloudinary.models import CloudinaryField
 from django.utils import timezone
 
@@ -8,17 +9,65 @@ class CustomUser(AbstractUser):
     email = models.EmailField(unique=True)
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username"]
-    
+    # denormalized, kept in step by the follow toggle (see api/counters.py)
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    # newest post, ranks friend-of-friend suggestions by recent activity
+    last_posted_at = models.DateTimeField(blank=True, null=True)
+    # set by api/deletion.py; the account is deactivated at once and its rows reaped in batches
+    deleted_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # most followed accounts, suggested to users with no friends-of-friends yet
+            models.Index(fields=["-follower_count", "-id"], name="user_popular_idx"),
+            # prefix lookups of the user directory (api/directory.py)
+            models.Index(Lower("username"), name="user_username_lower_idx"),
+            models.Index(Lower("email"), name="user_email_lower_idx"),
+        ]
+
     def __str__(self):
         return self.email
 
+class VisiblePostManager(models.Manager):
+    """Posts that haven't been deleted; soft-deleted ones wait for api/deletion.py's reaper"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Post(models.Model):
+    # media ingestion state, see api/ingest.py
+    PROCESSING = "processing"
+    READY = "ready"
+    FAILED = "failed"
+    STATUS_CHOICES = [(PROCESSING, "Processing"), (READY, "Ready"), (FAILED, "Failed")]
+
     content = models.TextField()
     author = models.ForeignKey(CustomUser, related_name='posts', on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     image = CloudinaryField('image', blank=True, null=True)
     video = CloudinaryField('video', blank=True, null=True, resource_type='video')  # Added resource_type
+    # denormalized, kept in step by the like/comment views (see api/counters.py)
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=READY)
+    media_error = models.TextField(blank=True, default="")
+    # soft delete, see api/deletion.py: Post.objects no longer returns the post,
+    # all_objects does until the reaper has removed it and its dependents
+    deleted_at = models.DateTimeField(blank=True, null=True)
+
+    objects = VisiblePostManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            # newest-first keyset pages of /posts/, overall and per author
+            models.Index(fields=["-created_at", "-id"], name="post_recent_idx"),
+            models.Index(fields=["author", "-created_at", "-id"], name="post_author_recent_idx"),
+        ]
+
     def __str__(self):
         return f"Post by {self.author.username}: {self.content[:20]}..."  # Trimmed to 20 characters
 
@@ -27,6 +76,14 @@ class Comment(models.Model):
     message = models.TextField()
     post = models.ForeignKey(Post, related_name="comments", on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # thread pages and previews (api/comments.py) are range scans on this
+            models.Index(fields=["post", "-created_at", "-id"], name="comment_post_recent_idx"),
+            # and GET /comments/ without ?post= on this
+            models.Index(fields=["-created_at", "-id"], name="comment_recent_idx"),
+        ]
     
     def __str__(self):
         return f"Comment by {self.user} on {self.post}"
@@ -38,6 +95,10 @@ class Likes(models.Model):
     
     class Meta:
         unique_together = ("user", "post")
+        indexes = [
+            # a post's likers, newest first
+            models.Index(fields=["post", "-created_at", "-id"], name="likes_post_recent_idx"),
+        ]
     
     def __str__(self):
         return f"{self.post} liked by {self.user}"
@@ -52,6 +113,108 @@ class Follow(models.Model):
     created_at=models.DateField(auto_now_add=True)
     class Meta:
         unique_together=("follower","followed")
+        indexes = [
+            # followers of an account (fan-out, suggestions); the unique pair covers the other direction
+            models.Index(fields=["followed", "follower"], name="follow_followed_idx"),
+        ]
     def __str__(self):
         """String for representing the Follow object."""
-        return f"{self.follower.username} follows {self.followed.username} "
\ No newline at end of file
+        return f"{self.follower.username} follows {self.followed.username} "
+
+
+# materialized home timeline, one row per (reader, post)
+# rows are pushed on post creation and on follow, so reading a feed page is a
+# range scan over (user, created_at) instead of a Follow x Post join
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(CustomUser, related_name="timeline", on_delete=models.CASCADE)
+    post = models.ForeignKey(Post, related_name="timeline_entries", on_delete=models.CASCADE)
+    # copied from the post so pruning on unfollow and paging never touch api_post
+    author = models.ForeignKey(CustomUser, related_name="+", on_delete=models.CASCADE)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("user", "post")
+        indexes = [
+            models.Index(fields=["user", "-created_at", "-post"], name="timeline_user_recent_idx"),
+            models.Index(fields=["user", "author"], name="timeline_user_author_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id} in timeline of {self.user_id}"
+
+
+# inverted index behind PostSearchView, one posting per (term, post)
+# maintained by api/search.py; the (term, post) unique index serves both exact
+# and prefix (term LIKE 'abc%') lookups
+class SearchTerm(models.Model):
+    term = models.CharField(max_length=64)
+    post = models.ForeignKey(Post, related_name="search_terms", on_delete=models.CASCADE)
+    # term frequency in the content, boosted for tokens of the author's username
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        unique_together = ("term", "post")
+
+    def __str__(self):
+        return f"{self.term} -> {self.post_id}"
+
+
+# precomputed friend-of-friend suggestions, one row per (user, candidate)
+# mutual_count is how many of the accounts user follows already follow the
+# candidate; api/suggestions.py keeps it in step with every follow/unfollow
+class SuggestionCandidate(models.Model):
+    user = models.ForeignKey(CustomUser, related_name="suggestion_candidates", on_delete=models.CASCADE)
+    candidate = models.ForeignKey(CustomUser, related_name="+", on_delete=models.CASCADE)
+    mutual_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("user", "candidate")
+        indexes = [
+            models.Index(fields=["user", "-mutual_count", "-candidate"], name="suggestion_user_rank_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.candidate_id} for {self.user_id} ({self.mutual_count} mutual)"
+
+
+# /explore/ ranking, maintained by api/trending.py: score is the log of the
+# post's time-decayed like/comment weight, so the (score, post) index orders
+# posts by current trend without ever being rescaled
+class TrendingPost(models.Model):
+    post = models.OneToOneField(Post, primary_key=True, related_name="trending", on_delete=models.CASCADE)
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-score", "-post"], name="trending_rank_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id} trending at {self.score:.3f}"
+
+
+# a soft-deleted post or user whose rows api/deletion.py is still removing;
+# step and deleted_rows are saved with every batch so the reaper resumes where
+# it stopped, and finished_at is set once the target row itself is gone
+class Deletion(models.Model):
+    POST = "post"
+    USER = "user"
+    TARGET_CHOICES = [(POST, "Post"), (USER, "User")]
+
+    target = models.CharField(max_length=8, choices=TARGET_CHOICES)
+    target_id = models.BigIntegerField()
+    requested_at = models.DateTimeField(auto_now_add=True)
+    step = models.CharField(max_length=32, blank=True, default="")
+    deleted_rows = models.PositiveBigIntegerField(default=0)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        unique_together = ("target", "target_id")
+        indexes = [
+            # the reaper's queue, oldest pending first
+            models.Index(fields=["finished_at", "requested_at"], name="deletion_pending_idx"),
+        ]
+
+    def __str__(self):
+        state = "done" if self.finished_at else self.step or "queued"
+        return f"{self.target} {self.target_id}: {state}, {self.deleted_rows} rows deleted"
@@ -0,0 +1,137 @@
+import base64
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(value, pk):
+    """Opaque cursor for a (created_at, id) or (score, id) position"""
+    if isinstance(value, datetime):
+        raw = f"d{value.isoformat()}|{pk}"
+    else:
+        raw = f"n{value!r}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor, raises NotFound on anything we didn't issue"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        value, pk = raw.rsplit("|", 1)
+        kind, value = value[0], value[1:]
+        if kind == "d":
+            return datetime.fromisoformat(value), int(pk)
+        if kind == "n":
+            return (int(value) if value.lstrip("-").isdigit() else float(value)), int(pk)
+    except (TypeError, ValueError, IndexError, UnicodeError):
+        pass
+    raise NotFound("Invalid cursor")
+
+
+def before_cursor(value, pk, order_field="created_at", pk_field="id"):
+    """Rows strictly after the cursor in a descending (order_field, id) ordering"""
+    return Q(**{f"{order_field}__lt": value}) | Q(
+        **{order_field: value, f"{pk_field}__lt": pk}
+    )
+
+
+def use_page_numbers(request):
+    """Old OFFSET paging, kept for clients that still send ?page=N"""
+    return getattr(settings, "LEGACY_PAGE_PAGINATION", False) or "page" in request.query_params
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opaque-cursor pagination over a newest-first (created_at, id) ordering,
+    or any other descending (order_field, pk_field) pair.
+
+    Each page is a single indexed range scan: no COUNT(*) and no OFFSET, so
+    page 1000 costs the same as page 1. Requests carrying ?page=N (or every
+    request, with LEGACY_PAGE_PAGINATION on) fall back to PageNumberPagination.
+    """
+    cursor_query_param = "cursor"
+    order_field = "created_at"
+    pk_field = "id"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.legacy = None
+        if use_page_numbers(request):
+            self.legacy = PageNumberPagination()
+            self.legacy.page_size = api_settings.PAGE_SIZE
+            return self.legacy.paginate_queryset(queryset, request, view)
+
+        return self._trim(list(self._window(queryset, request.query_params.get(self.cursor_query_param))))
+
+    async def apaginate_queryset(self, queryset, request):
+        """paginate_queryset on the async ORM, cursor mode only"""
+        self.request = request
+        self.legacy = None
+        return self._trim([row async for row in self._window(queryset, request.query_params.get(self.cursor_query_param))])
+
+    def first_page(self, queryset):
+        """The first cursor page, whatever the request asks for (pages embedded in other responses)"""
+        self.legacy = None
+        return self._trim(list(self._window(queryset, None)))
+
+    def _window(self, queryset, cursor):
+        # one row past the page tells whether there is a next one
+        queryset = queryset.order_by(f"-{self.order_field}", f"-{self.pk_field}")
+        if cursor:
+            queryset = queryset.filter(
+                before_cursor(*decode_cursor(cursor), order_field=self.order_field, pk_field=self.pk_field)
+            )
+        return queryset[:api_settings.PAGE_SIZE + 1]
+
+    def _trim(self, rows):
+        page_size = api_settings.PAGE_SIZE
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.last = rows[-1] if rows else None
+        return rows
+
+    def next_cursor(self):
+        """Cursor of the page after this one, None on the last page"""
+        if not self.has_next:
+            return None
+        return encode_cursor(self._value(self.order_field), self._value(self.pk_field))
+
+    def get_next_link(self):
+        if self.legacy:
+            return self.legacy.get_next_link()
+        cursor = self.next_cursor()
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def _value(self, field):
+        # rows are model instances, or dicts when paging a .values() queryset
+        if isinstance(self.last, dict):
+            return self.last[field]
+        return getattr(self.last, field)
+
+    def get_link_header(self):
+        """Link header for views that return a bare list body"""
+        next_link = self.get_next_link()
+        return {"Link": f'<{next_link}>; rel="next"'} if next_link else {}
+
+    def get_paginated_response(self, data):
+        if self.legacy:
+            return self.legacy.get_paginated_response(data)
+        return Response({"next": self.get_next_link(), "previous": None, "results": data})
+
+
+class SearchPagination(KeysetPagination):
+    """Keyset over relevance-ranked {"post_id", "score"} rows from api.search"""
+    order_field = "score"
+    pk_field = "post_id"
+
+
+class TrendingPagination(SearchPagination):
+    """Keyset over {"post_id", "score"} rows from api.trending, trendiest first"""
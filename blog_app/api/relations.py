@@ -0,0 +1,127 @@
+"""
+Idempotent like/unlike and follow/unfollow.
+
+Likes and Follow are unique on their pair, so each write is a single
+conflict-tolerant statement: INSERT IGNORE / INSERT OR IGNORE / ON CONFLICT
+DO NOTHING to add, a plain DELETE to remove. The affected row count says
+whether anything changed, and only then do counters move. Two racing
+requests for the same pair can't raise IntegrityError or double count.
+Unlike also needs the like's created_at to take its term back out of the
+trending score, so it locks the row while reading it and then deletes it
+by primary key: a second unlike waits on the lock and finds nothing.
+
+These statements don't go through the ORM, so model signals don't fire;
+the side effects they would have triggered (feed backfill/prune, suggestion
+candidates, cache stamps, trending scores) are run here instead. The feed
+and suggestion updates of a follow touch up to thousands of rows, so they
+run after commit off the request (api/feed.py's follow_changed).
+"""
+from django.db import connections, router, transaction
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+
+from . import authentication, caching, counters, feed, trending
+from .models import Follow, Likes
+
+
+def _insert_ignore(model, **values):
+    """Insert one row unless it clashes with a unique constraint, True if inserted"""
+    connection = connections[router.db_for_write(model)]
+    ops = connection.ops
+    fields = [model._meta.get_field(name) for name in values]
+    params = [field.get_db_prep_save(values[field.name], connection) for field in fields]
+    sql = "%s %s (%s) VALUES (%s) %s" % (
+        ops.insert_statement(on_conflict=OnConflict.IGNORE),
+        ops.quote_name(model._meta.db_table),
+        ", ".join(ops.quote_name(field.column) for field in fields),
+        ", ".join(["%s"] * len(fields)),
+        ops.on_conflict_suffix_sql(fields, OnConflict.IGNORE, None, None),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount == 1
+
+
+def _delete(model, **values):
+    """Delete the row matching values in one statement, True if there was one"""
+    connection = connections[router.db_for_write(model)]
+    ops = connection.ops
+    fields = [model._meta.get_field(name) for name in values]
+    params = [field.get_db_prep_value(values[field.name], connection) for field in fields]
+    sql = "DELETE FROM %s WHERE %s" % (
+        ops.quote_name(model._meta.db_table),
+        " AND ".join(f"{ops.quote_name(field.column)} = %s" for field in fields),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount > 0
+
+
+def like(user_id, post_id):
+    """Like a post, False if it was already liked"""
+    with transaction.atomic(using=router.db_for_write(Likes)):
+        now = timezone.now()
+        created = _insert_ignore(Likes, user=user_id, post=post_id, created_at=now)
+        if created:
+            counters.like_added(post_id)
+            trending.like_added(post_id, now)
+            caching.touch_post(post_id)
+    return created
+
+
+def unlike(user_id, post_id):
+    """Remove a like, False if there was none"""
+    with transaction.atomic(using=router.db_for_write(Likes)):
+        # the trending score takes back what the like added when it was made
+        row = Likes.objects.select_for_update().filter(user=user_id, post=post_id).values_list("pk", "created_at").first()
+        deleted = row is not None and _delete(Likes, id=row[0])
+        if deleted:
+            counters.like_removed(post_id)
+            trending.like_removed(post_id, row[1])
+            caching.touch_post(post_id)
+    return deleted
+
+
+def toggle_like(user_id, post_id):
+    """Like if not liked, else unlike; returns the new liked state"""
+    if like(user_id, post_id):
+        return True
+    unlike(user_id, post_id)
+    return False
+
+
+def follow(follower_id, followed_id):
+    """Follow a user, False if already following"""
+    with transaction.atomic(using=router.db_for_write(Follow)):
+        created = _insert_ignore(
+            Follow, follower=follower_id, followed=followed_id, created_at=timezone.now().date()
+        )
+        if created:
+            counters.follow_added(follower_id, followed_id)
+            # the cached request.user would still show the old counts
+            authentication.touch_user(follower_id)
+            authentication.touch_user(followed_id)
+            feed.follow_changed(follower_id, followed_id, True)
+            caching.touch_author(followed_id)
+    return created
+
+
+def unfollow(follower_id, followed_id):
+    """Stop following a user, False if not following"""
+    with transaction.atomic(using=router.db_for_write(Follow)):
+        deleted = _delete(Follow, follower=follower_id, followed=followed_id)
+        if deleted:
+            counters.follow_removed(follower_id, followed_id)
+            authentication.touch_user(follower_id)
+            authentication.touch_user(followed_id)
+            feed.follow_changed(follower_id, followed_id, False)
+            caching.touch_author(followed_id)
+    return deleted
+
+
+def toggle_follow(follower_id, followed_id):
+    """Follow if not following, else unfollow; returns the new following state"""
+    if follow(follower_id, followed_id):
+        return True
+    unfollow(follower_id, followed_id)
+    return False
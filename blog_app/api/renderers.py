@@ -0,0 +1,41 @@
+"""
+JSON rendering for the hot list endpoints.
+
+FastJSONRenderer produces the exact bytes of DRF's JSONRenderer (compact
+separators, UTF-8 rather than \\u escapes, U+2028/U+2029 escaped) with
+orjson when it is installed; without it, it is JSONRenderer. Payloads from
+api/fastpath.py are plain dicts, lists, strings, ints and bools, which
+both encoders write identically. Anything orjson would write
+differently is handed back to JSONRenderer: indented output (the browsable
+API, ?indent=), datetimes, dataclasses and types it can't encode at all,
+and every payload when UNICODE_JSON or COMPACT_JSON is turned off. Floats
+are the one gap: orjson writes NaN as null where STRICT_JSON would refuse
+it, so keep them out of fast-path payloads.
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_ORJSON_OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS) if orjson else 0
+
+
+def _unsupported(obj):
+    raise TypeError(type(obj).__name__)
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if (orjson is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_unsupported, option=_ORJSON_OPTIONS)
+        except TypeError:
+            # DRF's encoder knows more types
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
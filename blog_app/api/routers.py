@@ -0,0 +1,204 @@
+"""
+Primary/replica database routing for settings.DATABASE_REPLICAS.
+
+Writes always go to the primary ("default"). Reads go to a replica only
+while ReplicaRoutingMiddleware is serving a safe (GET/HEAD/OPTIONS) request
+that nothing has pinned to the primary:
+
+- the request already wrote something, or is inside a transaction on the
+  primary;
+- the same client (JWT subject, else session cookie) wrote within the last
+  REPLICA_PIN_SECONDS, so they read their own writes despite replication
+  lag. Pins live in the default cache, which must be shared between worker
+  processes (Redis/Memcached) for them to hold across workers.
+
+Unsafe requests, management commands, signals and background threads never
+see a routing state and stay on the primary. One replica is picked per
+request so its reads are consistent with each other, and a replica whose
+connection check fails is skipped for REPLICA_RETRY_SECONDS.
+"""
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = "default"
+
+
+def replicas():
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+def pin_seconds():
+    return getattr(settings, "REPLICA_PIN_SECONDS", 5)
+
+
+def retry_seconds():
+    return getattr(settings, "REPLICA_RETRY_SECONDS", 30)
+
+
+def pin_key(request):
+    """Cache key identifying whoever sent request, None for anonymous clients"""
+    header = request.META.get(api_settings.AUTH_HEADER_NAME, "").split()
+    if len(header) == 2 and header[0] in api_settings.AUTH_HEADER_TYPES:
+        try:
+            return f"db-pin:user:{AccessToken(header[1])[api_settings.USER_ID_CLAIM]}"
+        except (TokenError, KeyError):
+            return None
+    session = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    return f"db-pin:session:{session}" if session else None
+
+
+def pin(key):
+    """Send key's reads to the primary for the next REPLICA_PIN_SECONDS"""
+    cache.set(key, 1, pin_seconds())
+
+
+async def apin(key):
+    await cache.aset(key, 1, pin_seconds())
+
+
+def is_pinned(key):
+    return cache.get(key) is not None
+
+
+# alias -> time.monotonic() after which a failed replica is tried again
+_down = {}
+_down_lock = threading.Lock()
+
+
+def healthy(alias):
+    """Whether alias accepts connections; failures are remembered for REPLICA_RETRY_SECONDS"""
+    with _down_lock:
+        until = _down.get(alias)
+    if until is not None and time.monotonic() < until:
+        return False
+    try:
+        # with CONN_HEALTH_CHECKS this also pings a reused connection once per request
+        connections[alias].ensure_connection()
+    except DatabaseError as exc:
+        logger.warning("replica %s unavailable, reading from the primary: %s", alias, exc)
+        with _down_lock:
+            _down[alias] = time.monotonic() + retry_seconds()
+        return False
+    with _down_lock:
+        _down.pop(alias, None)
+    return True
+
+
+class RoutingState:
+    """What the router knows about the request being served"""
+
+    def __init__(self, request):
+        self.request = request
+        self.read_only = request.method in SAFE_METHODS
+        self.wrote = False
+        # transactions already open around the request (a test case's) don't count
+        self.outer_atomics = len(connections[PRIMARY].atomic_blocks)
+        self._key = None
+        self._replica = None
+
+    @property
+    def key(self):
+        if self._key is None:
+            self._key = pin_key(self.request) or ""
+        return self._key
+
+    def replica(self):
+        """The replica this request reads from, or None for the primary"""
+        if not self.read_only or self.wrote or len(connections[PRIMARY].atomic_blocks) > self.outer_atomics:
+            return None
+        if self._replica is None:
+            candidates = []
+            if not (self.key and is_pinned(self.key)):
+                candidates = [alias for alias in replicas() if healthy(alias)]
+            # "" remembers that the primary was chosen
+            self._replica = random.choice(candidates) if candidates else ""
+        return self._replica or None
+
+
+_current = ContextVar("api_db_routing", default=None)
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary inside the block, for results that outlive the request (shared caches)"""
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _current.get()
+        if state is None or not replicas():
+            return PRIMARY
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            # related objects come from wherever the instance did
+            return instance._state.db
+        return state.replica() or PRIMARY
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state is not None:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {PRIMARY, *replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Opens the window in which PrimaryReplicaRouter may read from replicas"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState(request)
+        token = _current.set(state)
+        try:
+            return self.get_response(request)
+        finally:
+            _current.reset(token)
+            if self.should_pin(state):
+                pin(state.key)
+
+    async def __acall__(self, request):
+        state = RoutingState(request)
+        token = _current.set(state)
+        try:
+            return await self.get_response(request)
+        finally:
+            _current.reset(token)
+            if self.should_pin(state):
+                await apin(state.key)
+
+    @staticmethod
+    def should_pin(state):
+        return state.wrote and replicas() and state.key
@@ -0,0 +1,153 @@
+"""
+Post search.
+
+Two engines sit behind one interface:
+
+* "index": a tokenized inverted index (SearchTerm) over post content and
+  author usernames, kept up to date by signals on post create/update.
+  Works on every database, including SQLite in tests.
+* "fulltext": MySQL's native FULLTEXT index on api_post.content (added by
+  migration 0011 on MySQL only), with the author's username matched by prefix
+  on its unique index. The candidates are a UNION of posts whose content
+  matches every term and, for each term, posts whose author's username starts
+  with it and whose other terms match the content or the username.
+
+SEARCH_BACKEND picks one; "auto" uses fulltext on MySQL and the inverted
+index everywhere else. Both return rows of {"post_id", "score"} ordered by
+relevance, newest post first on ties, so results page with a keyset cursor.
+"""
+import re
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, Case, Count, F, FloatField, Func, IntegerField, Q, Sum, Value, When
+
+from .models import CustomUser, Post, SearchTerm
+
+TOKEN_RE = re.compile(r"\w+")
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = 8
+# shorter prefixes match too much of the index to be useful while typing
+MIN_PREFIX_LENGTH = 2
+MAX_TERM_FREQUENCY = 10
+AUTHOR_WEIGHT = 5
+EXACT_MATCH_BOOST = 2
+
+
+def backend():
+    choice = getattr(settings, "SEARCH_BACKEND", "auto")
+    if choice == "auto":
+        return "fulltext" if connection.vendor == "mysql" else "index"
+    return choice
+
+
+def tokenize(text):
+    return [token[:MAX_TERM_LENGTH] for token in TOKEN_RE.findall((text or "").lower())]
+
+
+def post_terms(post, username):
+    """term -> weight for one post"""
+    weights = Counter(tokenize(post.content))
+    terms = {term: min(count, MAX_TERM_FREQUENCY) for term, count in weights.items()}
+    for term in set(tokenize(username)) | {username.lower()[:MAX_TERM_LENGTH]}:
+        terms[term] = terms.get(term, 0) + AUTHOR_WEIGHT
+    return terms
+
+
+def index_post(post, username=None):
+    """(Re)build the postings for one post"""
+    if backend() != "index":
+        return
+    if username is None:
+        username = post.author.username
+    SearchTerm.objects.filter(post_id=post.id).delete()
+    SearchTerm.objects.bulk_create(
+        [SearchTerm(term=term, post_id=post.id, weight=weight) for term, weight in post_terms(post, username).items()]
+    )
+
+
+def index_author(user):
+    """An author was renamed: reindex every one of their posts"""
+    if backend() != "index":
+        return
+    for post in Post.objects.filter(author=user).only("id", "content").iterator(chunk_size=500):
+        index_post(post, user.username)
+
+
+def _match(term):
+    if len(term) >= MIN_PREFIX_LENGTH:
+        return Q(term__startswith=term)
+    return Q(term=term)
+
+
+def _index_search(terms):
+    matches = Q()
+    for term in terms:
+        matches |= _match(term)
+    rows = (
+        SearchTerm.objects.filter(matches)
+        .values("post_id")
+        .annotate(
+            score=Sum(
+                Case(
+                    When(term__in=terms, then=F("weight") * EXACT_MATCH_BOOST),
+                    default=F("weight"),
+                    output_field=IntegerField(),
+                )
+            ),
+            **{f"hits_{i}": Count("id", filter=_match(term)) for i, term in enumerate(terms)},
+        )
+    )
+    # every query term has to match something, like a search box user expects
+    return rows.filter(**{f"hits_{i}__gt": 0 for i in range(len(terms))}).values("post_id", "score")
+
+
+class _Match(Func):
+    """MATCH(column) AGAINST (query IN BOOLEAN MODE); relevance, or a filter with output_field=BooleanField()"""
+    output_field = FloatField()
+
+    def __init__(self, column, terms, **extra):
+        super().__init__(F(column), Value(" ".join(f"+{term}*" for term in terms)), **extra)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        (column, column_params), (query, query_params) = (
+            compiler.compile(expression) for expression in self.get_source_expressions()
+        )
+        return f"MATCH({column}) AGAINST ({query} IN BOOLEAN MODE)", (*column_params, *query_params)
+
+
+def _fulltext_search(terms):
+    def in_content(*subset):
+        # MATCH in WHERE is what lets MySQL use the FULLTEXT index
+        return _Match("content", subset, output_field=BooleanField())
+
+    def by_author(term):
+        return Q(author__username__startswith=term)
+
+    # every term has to match the content or the author, as with the index
+    candidates = [Post.objects.filter(in_content(*terms)).values("id")]
+    for term in terms:
+        others = [by_author(other) | Q(in_content(other)) for other in terms if other != term]
+        candidates.append(Post.objects.filter(by_author(term), *others).values("id"))
+    authors = CustomUser.objects.filter(reduce(or_, (Q(username__startswith=term) for term in terms))).values("id")
+    return (
+        Post.objects.filter(id__in=candidates[0].union(*candidates[1:]))
+        .annotate(
+            score=_Match("content", terms)
+            + Case(When(author_id__in=authors, then=Value(AUTHOR_WEIGHT)), default=Value(0)),
+            post_id=F("id"),
+        )
+        .values("post_id", "score")
+    )
+
+
+def search_posts(query):
+    """Rows of {"post_id", "score"}, best match first"""
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return SearchTerm.objects.none().values("post_id").annotate(score=Sum("weight"))
+    rows = _fulltext_search(terms) if backend() == "fulltext" else _index_search(terms)
+    return rows.order_by("-score", "-post_id")
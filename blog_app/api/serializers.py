@@ -1,6 +1,14 @@
+import logging
+
 from rest_framework import serializers
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
 from .models import Post, CustomUser, Comment, Likes,Follow
-import cloudinary.utils
+from .media import resource_url, video_url
+from . import comments, ingest
+from .viewer import viewer_state_for_posts
+
+logger = logging.getLogger(__name__)
 
 class PostCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating posts"""
@@ -15,10 +23,23 @@ class PostCreateSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if request and hasattr(request, 'user'):
             validated_data['author'] = request.user
+
+        # uploads happen in the background (api/ingest.py), only spool them here
+        uploads = {}
+        for field in ingest.MEDIA_FIELDS:
+            if isinstance(validated_data.get(field), UploadedFile):
+                uploads[field] = validated_data.pop(field)
+        if uploads:
+            validated_data['status'] = Post.PROCESSING
         
-        print(f"Creating post with validated_data: {validated_data}")
-        post = Post.objects.create(**validated_data)
-        print(f"Created post - Image: {post.image}, Video: {post.video}")
+        logger.debug("creating post with %s", validated_data)
+        with transaction.atomic():
+            post = Post.objects.create(**validated_data)
+            if uploads:
+                # staged under the post's id, so recover_media_ingest can find them after a restart
+                staged = {field: ingest.stage(upload, post.id, field) for field, upload in uploads.items()}
+                ingest.submit(post.id, staged)
+        logger.debug("created post %s, image %s, video %s", post.id, post.image, post.video)
         return post
 
 class PostSerializer(serializers.ModelSerializer):
@@ -29,39 +50,61 @@ class PostSerializer(serializers.ModelSerializer):
     author = serializers.StringRelatedField(read_only=True)
     image = serializers.SerializerMethodField()
     video = serializers.SerializerMethodField()
+    liked_by_me = serializers.SerializerMethodField()
+    author_followed_by_me = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
-        fields = ['id', 'content', 'author', 'created_at', 'updated_at', 'image', 'video',"profile_pic","author_username"]
+        fields = ['id', 'content', 'author', 'created_at', 'updated_at', 'image', 'video',"profile_pic","author_username",
+                  "like_count","comment_count","status","liked_by_me","author_followed_by_me"]
+        read_only_fields = ["like_count","comment_count","status"]
+
+    def viewer_state(self, obj):
+        """Viewer flags for the whole page, looked up on first use and shared via context"""
+        state = self.context.get("viewer_state")
+        if state is None:
+            request = self.context.get("request")
+            if isinstance(self.parent, serializers.ListSerializer):
+                posts = self.parent.instance
+            else:
+                posts = [obj]
+            state = viewer_state_for_posts(getattr(request, "user", None), posts)
+            self.context["viewer_state"] = state
+        return state
+
+    def comment_previews(self, obj):
+        """Latest comments for the whole page, fetched on first use like viewer_state"""
+        previews = self.context.get("comment_preview_rows")
+        if previews is None:
+            if isinstance(self.parent, serializers.ListSerializer):
+                posts = self.parent.instance
+            else:
+                posts = [obj]
+            previews = comments.latest_for_posts([post.id for post in posts], self.context["comment_previews"])
+            self.context["comment_preview_rows"] = previews
+        return previews
+
+    def to_representation(self, obj):
+        data = super().to_representation(obj)
+        # opt in with ?comments=N, feed cards show the newest few under each post
+        if self.context.get("comment_previews"):
+            data["latest_comments"] = CommentSerializer(self.comment_previews(obj).get(obj.id, []), many=True).data
+        return data
+
+    def get_liked_by_me(self, obj):
+        return self.viewer_state(obj).liked(obj.id)
+
+    def get_author_followed_by_me(self, obj):
+        return self.viewer_state(obj).follows(obj.author_id)
 
     def get_image(self, obj):
-        if obj.image:
-            return str(obj.image.url)
-        return None
+        return resource_url(obj.image)
     def get_author_username(self,obj):
         return obj.author.username
     def get_video(self, obj):
-        if obj.video:
-            # Get the video URL and convert to mp4 for better browser compatibility
-            video_url = str(obj.video.url)
-            
-            # If the video is not already mp4, transform it
-            if not video_url.endswith('.mp4'):
-                # Use Cloudinary's transformation to convert to mp4
-                public_id = obj.video.public_id
-                video_url = cloudinary.utils.cloudinary_url(
-                    public_id,
-                    resource_type='video',
-                    format='mp4',
-                    quality='auto'
-                )[0]
-            
-            return video_url
-        return None
+        return video_url(obj.video)
     def get_profile_pic(self,obj):
-        if obj.author.profile_pic:
-            return str(obj.author.profile_pic.url)
-        return None
+        return resource_url(obj.author.profile_pic)
         
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -80,6 +123,18 @@ class CommentSerializer(serializers.ModelSerializer):
     
     # **validated data is just destructuring of pythons dictionary into orms attributes
     
+class ThreadCommentSerializer(CommentSerializer):
+    """A comment with its author's username and avatar, for the post page"""
+    username = serializers.CharField(source="user.username", read_only=True)
+    profile_pic = serializers.SerializerMethodField()
+
+    class Meta(CommentSerializer.Meta):
+        fields = CommentSerializer.Meta.fields + ["username", "profile_pic"]
+
+    def get_profile_pic(self, obj):
+        return resource_url(obj.user.profile_pic)
+
+
 class LikesSerializer(serializers.ModelSerializer):
     post=serializers.StringRelatedField(read_only=True)
     user=serializers.StringRelatedField(read_only=True)
@@ -93,7 +148,8 @@ class UserSerializers(serializers.ModelSerializer):
     
     class Meta:
         model=CustomUser
-        fields=( "id","username","email","password","confirmPassword")
+        fields=( "id","username","email","password","confirmPassword","follower_count","following_count")
+        read_only_fields=("follower_count","following_count")
         extra_kwargs={
             
             "password":{"write_only":True}
@@ -118,4 +174,60 @@ class FollowSerializer(serializers.ModelSerializer):
     
     class Meta:
         model=Follow
-        fields=("id","follower","followed")
\ No newline at end of file
+        fields=("id","follower","followed")
+
+
+class PostStatusSerializer(serializers.ModelSerializer):
+    """What clients poll while a new post's media is being ingested"""
+    image = serializers.SerializerMethodField()
+    video = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Post
+        fields = ["id", "status", "media_error", "image", "video"]
+
+    def get_image(self, obj):
+        return resource_url(obj.image)
+
+    def get_video(self, obj):
+        # the same URL PostSerializer gives the client for this video
+        return video_url(obj.video)
+
+
+
+class LikeStateSerializer(serializers.ModelSerializer):
+    """Like state for one post, served by the bulk postlikes/state/ endpoint"""
+    liked_by_me = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Post
+        fields = ["id", "like_count", "liked_by_me"]
+
+    def get_liked_by_me(self, obj):
+        return self.context["viewer_state"].liked(obj.id)
+
+
+class SuggestedUserSerializer(serializers.ModelSerializer):
+    """A suggested account, mutual_count is set by api.suggestions.ranked"""
+    profile_pic = serializers.SerializerMethodField()
+    mutual_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = CustomUser
+        fields = ["id", "username", "profile_pic", "follower_count", "mutual_count"]
+
+    def get_profile_pic(self, obj):
+        return resource_url(obj.profile_pic)
+
+
+class UserDirectorySerializer(serializers.ModelSerializer):
+    """Read-only directory row, none of the UserSerializers password handling"""
+    profile_pic = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CustomUser
+        fields = ["id", "username", "profile_pic", "follower_count"]
+        read_only_fields = fields
+
+    def get_profile_pic(self, obj):
+        return resource_url(obj.profile_pic)
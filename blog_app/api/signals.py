@@ -0,0 +1,131 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import authentication, caching, feed, search, suggestions, trending
+from .models import Comment, CustomUser, Follow, Likes, Post
+
+
+@receiver(post_save, sender=Post)
+def push_post_to_timelines(sender, instance, created, **kwargs):
+    if created:
+        # followers' timelines are filled after commit, off the request
+        feed.push_post(instance)
+
+
+@receiver(post_save, sender=Post)
+def record_author_activity(sender, instance, created, **kwargs):
+    if created:
+        CustomUser.objects.filter(pk=instance.author_id).update(last_posted_at=instance.created_at)
+
+
+@receiver(pre_save, sender=Post)
+def remember_indexed_content(sender, instance, update_fields=None, **kwargs):
+    if not instance.pk or search.backend() != "index":
+        return
+    if update_fields is None or {"content", "author"} & set(update_fields):
+        instance._indexed = Post.all_objects.filter(pk=instance.pk).values_list("content", "author_id").first()
+
+
+@receiver(post_save, sender=Post)
+def index_post_for_search(sender, instance, created, **kwargs):
+    # saves that leave the indexed text alone (counters, media status) skip the rebuild
+    indexed = instance.__dict__.pop("_indexed", None)
+    if created or (indexed is not None and indexed != (instance.content, instance.author_id)):
+        search.index_post(instance)
+
+
+@receiver(pre_save, sender=CustomUser)
+def remember_username(sender, instance, update_fields=None, **kwargs):
+    if not instance.pk or search.backend() != "index":
+        return
+    if update_fields is None or "username" in update_fields:
+        instance._indexed_username = (
+            CustomUser.objects.filter(pk=instance.pk).values_list("username", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=CustomUser)
+def reindex_renamed_author(sender, instance, **kwargs):
+    previous = getattr(instance, "_indexed_username", None)
+    if previous is not None and previous != instance.username:
+        search.index_author(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        feed.backfill(instance.follower_id, instance.followed_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    feed.prune(instance.follower_id, instance.followed_id)
+
+
+@receiver(post_save, sender=Follow)
+def add_suggestion_candidates(sender, instance, created, **kwargs):
+    if created:
+        suggestions.follow_added(instance.follower_id, instance.followed_id)
+
+
+@receiver(post_delete, sender=Follow)
+def remove_suggestion_candidates(sender, instance, **kwargs):
+    suggestions.follow_removed(instance.follower_id, instance.followed_id)
+
+
+@receiver(post_save, sender=Likes)
+@receiver(post_delete, sender=Likes)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_post_detail(sender, instance, **kwargs):
+    caching.touch_post(instance.post_id)
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_author_posts(sender, instance, **kwargs):
+    caching.touch_author(instance.pk)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_followed_author_posts(sender, instance, **kwargs):
+    # author_followed_by_me changed for this viewer
+    caching.touch_author(instance.followed_id)
+
+
+def _author_username(post):
+    if Post.author.is_cached(post):
+        return post.author.username
+    return CustomUser.objects.filter(pk=post.author_id).values_list("username", flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def invalidate_post_lists(sender, instance, created, **kwargs):
+    if created:
+        caching.touch_post_list(_author_username(instance))
+    else:
+        # edits keep the lists' versions, the entries holding this post go stale
+        caching.touch_post(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def drop_deleted_post_from_lists(sender, instance, **kwargs):
+    caching.touch_post_list(_author_username(instance))
+
+
+@receiver(post_save, sender=Comment)
+def add_comment_to_trending(sender, instance, created, **kwargs):
+    if created:
+        trending.comment_added(instance.post_id, instance.created_at)
+
+
+@receiver(post_delete, sender=Comment)
+def remove_comment_from_trending(sender, instance, **kwargs):
+    trending.comment_removed(instance.post_id, instance.created_at)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # password, is_active and profile changes all go through save()
+    authentication.touch_user(instance.pk)
@@ -0,0 +1,43 @@
+"""
+Pluggable media storage used by the ingestion pipeline (api/ingest.py).
+
+A backend takes a staged local file and returns the value to store in a
+CloudinaryField ("<resource_type>/<type>/v<version>/<public_id>.<format>").
+MEDIA_STORAGE_BACKEND names the class to use.
+"""
+import os
+import shutil
+import uuid
+
+import cloudinary.uploader
+from cloudinary import CloudinaryResource
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class CloudinaryStorage:
+    """Uploads to Cloudinary, same options CloudinaryField.pre_save used"""
+
+    def upload(self, path, resource_type):
+        resource = cloudinary.uploader.upload_resource(path, type="upload", resource_type=resource_type)
+        return resource.get_prep_value()
+
+
+class LocalStorage:
+    """Filesystem stand-in for tests and offline development"""
+
+    def __init__(self, root=None):
+        self.root = root or getattr(settings, "MEDIA_LOCAL_ROOT", None) or os.path.join(settings.BASE_DIR, "media")
+
+    def upload(self, path, resource_type):
+        extension = os.path.splitext(path)[1].lstrip(".") or "bin"
+        name = uuid.uuid4().hex
+        directory = os.path.join(self.root, resource_type, "local")
+        os.makedirs(directory, exist_ok=True)
+        shutil.copyfile(path, os.path.join(directory, f"{name}.{extension}"))
+        resource = CloudinaryResource(f"local/{name}", format=extension, type="upload", resource_type=resource_type)
+        return resource.get_prep_value()
+
+
+def get_storage():
+    return import_string(getattr(settings, "MEDIA_STORAGE_BACKEND", "api.storage.CloudinaryStorage"))()
@@ -0,0 +1,158 @@
+"""
+Friend-of-friend "suggested users" from the Follow graph.
+
+If A follows B and B follows C, C is a candidate for A with one mutual.
+Rather than a two-hop Follow self-join per request, SuggestionCandidate keeps
+the per-user counts and every follow adjusts them:
+
+    A follows B:  +1 on (A, C) for every C that B follows
+                  +1 on (F, B) for every F that follows A
+
+An unfollow applies the same edges with -1 and drops rows that reach zero.
+Like feed fan-out, accounts past SUGGESTION_FANOUT_LIMIT on the iterated side
+are skipped at write time; rebuild_suggestions recomputes from scratch.
+
+Reads take the user's top SUGGESTION_WINDOW rows by mutual count straight off
+the (user, mutual_count) index, blend in how recently each candidate posted,
+and page through that window. Users with too few candidates (new accounts)
+are topped up with the most followed accounts.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import CustomUser, Follow, SuggestionCandidate
+
+BATCH_SIZE = 1000
+# posting today is worth one extra mutual, halving every ACTIVITY_HALF_LIFE
+ACTIVITY_HALF_LIFE = timedelta(days=7)
+# what SuggestedUserSerializer and the ranking read
+USER_FIELDS = ("id", "username", "profile_pic", "follower_count", "last_posted_at")
+
+
+def fanout_limit():
+    return getattr(settings, "SUGGESTION_FANOUT_LIMIT", 5000)
+
+
+def window_size():
+    return getattr(settings, "SUGGESTION_WINDOW", 200)
+
+
+def _chunks(ids):
+    chunk = []
+    for pk in ids:
+        chunk.append(pk)
+        if len(chunk) >= BATCH_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _adjust(fixed, fixed_id, other, other_ids, delta):
+    """Add delta to the mutual count of every (fixed=fixed_id, other in other_ids) row"""
+    for chunk in _chunks(other_ids):
+        rows = SuggestionCandidate.objects.filter(**{fixed: fixed_id, f"{other}__in": chunk})
+        if delta > 0:
+            # create missing rows at zero first so racing follows only ever increment
+            SuggestionCandidate.objects.bulk_create(
+                [SuggestionCandidate(**{f"{fixed}_id": fixed_id, f"{other}_id": pk}) for pk in chunk],
+                ignore_conflicts=True,
+            )
+            rows.update(mutual_count=F("mutual_count") + delta)
+        else:
+            rows.filter(mutual_count__lte=-delta).delete()
+            rows.update(mutual_count=F("mutual_count") + delta)
+
+
+def _apply(follower_id, followed_id, delta):
+    users = {
+        pk: (follower_count, following_count)
+        for pk, follower_count, following_count in CustomUser.objects.filter(
+            pk__in=[follower_id, followed_id]
+        ).values_list("id", "follower_count", "following_count")
+    }
+    limit = fanout_limit()
+    if users.get(followed_id, (0, 0))[1] <= limit:
+        # everyone the followed account follows is one more mutual away for the follower
+        candidates = (
+            Follow.objects.filter(follower_id=followed_id)
+            .exclude(followed_id=follower_id)
+            .values_list("followed_id", flat=True)
+        )
+        _adjust("user", follower_id, "candidate", candidates.iterator(chunk_size=BATCH_SIZE), delta)
+    if users.get(follower_id, (0, 0))[0] <= limit:
+        # and the followed account is one more mutual away for the follower's followers
+        readers = (
+            Follow.objects.filter(followed_id=follower_id)
+            .exclude(follower_id=followed_id)
+            .values_list("follower_id", flat=True)
+        )
+        _adjust("candidate", followed_id, "user", readers.iterator(chunk_size=BATCH_SIZE), delta)
+
+
+def follow_added(follower_id, followed_id):
+    _apply(follower_id, followed_id, 1)
+
+
+def follow_removed(follower_id, followed_id):
+    _apply(follower_id, followed_id, -1)
+
+
+def rebuild(user_id):
+    """Recompute one user's candidates with the two-hop join"""
+    following = Follow.objects.filter(follower_id=user_id).values("followed_id")
+    rows = (
+        Follow.objects.filter(follower_id__in=following)
+        .exclude(followed_id=user_id)
+        .values("followed_id")
+        .annotate(mutual=Count("id"))
+    )
+    with transaction.atomic():
+        SuggestionCandidate.objects.filter(user_id=user_id).delete()
+        SuggestionCandidate.objects.bulk_create(
+            (SuggestionCandidate(user_id=user_id, candidate_id=row["followed_id"], mutual_count=row["mutual"])
+             for row in rows.iterator(chunk_size=BATCH_SIZE)),
+            batch_size=BATCH_SIZE,
+        )
+
+
+def _activity(user, now):
+    if user.last_posted_at is None:
+        return 0.0
+    return 0.5 ** (max(now - user.last_posted_at, timedelta(0)) / ACTIVITY_HALF_LIFE)
+
+
+def ranked(user):
+    """The user's suggestion window, best first; each candidate carries mutual_count"""
+    following = Follow.objects.filter(follower=user).values("followed_id")
+    window = window_size()
+    rows = (
+        SuggestionCandidate.objects.filter(user=user, candidate__deleted_at__isnull=True)
+        .exclude(candidate_id__in=following)
+        .select_related("candidate")
+        .only("mutual_count", "candidate", *(f"candidate__{field}" for field in USER_FIELDS))
+        .order_by("-mutual_count", "-candidate_id")[:window]
+    )
+    now = timezone.now()
+    candidates = []
+    for row in rows:
+        row.candidate.mutual_count = row.mutual_count
+        candidates.append(row.candidate)
+    candidates.sort(key=lambda c: (c.mutual_count + _activity(c, now), c.pk), reverse=True)
+    if len(candidates) < window:
+        popular = (
+            CustomUser.objects.only(*USER_FIELDS)
+            .filter(deleted_at__isnull=True)
+            .exclude(pk=user.pk)
+            .exclude(pk__in=following)
+            .exclude(pk__in=[candidate.pk for candidate in candidates])
+            .order_by("-follower_count", "-id")[:window - len(candidates)]
+        )
+        for candidate in popular:
+            candidate.mutual_count = 0
+            candidates.append(candidate)
+    return candidates
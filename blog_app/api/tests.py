@@ -1,3 +1,2036 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.core.management import CommandError, call_command
+from cloudinary import CloudinaryResource
+from cloudinary.utils import cloudinary_url
+from django.db import OperationalError, connection, connections
+from django.db.models.signals import post_delete
+from django.test import (
+    AsyncClient, LiveServerTestCase, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import (
+    authentication, caching, comments, counters, deletion, export, fastpath, feed, ingest, media, metrics, relations,
+    renderers, routers, search, trending,
+)
+from .authentication import CachedJWTAuthentication
+from .management.commands._bench import seed_dataset
+from .management.commands.explain_queries import endpoint_urls, explain_endpoint
+from .management.commands.loadtest import SCENARIOS, route_patterns
+from .models import (
+    Comment, CustomUser, Deletion, Follow, Likes, Post, SearchTerm, SuggestionCandidate, TimelineEntry, TrendingPost,
+)
+from .pagination import KeysetPagination, encode_cursor
+from .renderers import FastJSONRenderer
+from .serializers import CommentSerializer, LikesSerializer, PostSerializer
+from .viewer import viewer_state_for_rows
+
+
+# background pools would write to the test database behind the test's back
+@override_settings(FEED_FANOUT_EAGER=True)
+class ApiTestCase(TestCase):
+    def setUp(self):
+        # cached representations would otherwise leak between tests
+        cache.clear()
+
+
+class StubExecutor:
+    """Stands in for a background pool: records submissions, runs them when told"""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, fn, *args):
+        self.jobs.append((fn, args))
+
+    def run(self):
+        for fn, args in self.jobs:
+            fn(*args)
+
+
+def sqlite_match(self, compiler, connection, **extra_context):
+    """MATCH ... AGAINST stand-in for SQLite: 1 when every +term* starts a word of the column"""
+    column, query = self.get_source_expressions()
+    sql, params = compiler.compile(column)
+    terms = [word.strip("+*") for word in query.value.split()]
+    checks = " AND ".join([f"(' ' || LOWER({sql})) LIKE %s"] * len(terms))
+    return f"({checks})", [param for term in terms for param in (*params, f"% {term}%")]
+
+
+def make_user(username):
+    return CustomUser.objects.create_user(username=username, email=f"{username}@example.com", password="pass12345")
+
+
+class FeedTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.reader = make_user("reader")
+        self.author = make_user("author")
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def feed_ids(self, url="/feed/"):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [post["id"] for post in response.data["results"]], response.data["next"]
+
+    def test_new_post_is_pushed_to_followers(self):
+        Follow.objects.create(follower=self.reader, followed=self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(author=self.author, content="hello")
+        self.assertTrue(TimelineEntry.objects.filter(user=self.reader, post=post).exists())
+        self.assertEqual(self.feed_ids()[0], [post.id])
+
+    @override_settings(FEED_FANOUT_EAGER=False)
+    def test_followers_are_fanned_out_after_commit_off_the_request(self):
+        Follow.objects.create(follower=self.reader, followed=self.author)
+        executor = StubExecutor()
+        with mock.patch.object(feed, "_pool", return_value=executor), self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(author=self.author, content="hello")
+            # the author sees their own post at once, the followers' rows wait for the commit
+            self.assertTrue(TimelineEntry.objects.filter(user=self.author, post=post).exists())
+            self.assertEqual(executor.jobs, [])
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader, post=post).exists())
+        self.assertEqual(executor.jobs, [(feed._run_in_worker, (post.id,))])
+        # the worker closes its thread's connections, which here is the test's own
+        with mock.patch.object(feed.connections, "close_all") as close_all:
+            executor.run()
+        close_all.assert_called_once()
+        self.assertTrue(TimelineEntry.objects.filter(user=self.reader, post=post).exists())
+
+    @override_settings(FEED_FANOUT_EAGER=False)
+    def test_failed_fan_out_is_logged(self):
+        executor = StubExecutor()
+        with mock.patch.object(feed, "_pool", return_value=executor), self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(author=self.author, content="hello")
+        with mock.patch.object(feed, "fan_out_followers", side_effect=OperationalError("locked")), \
+                mock.patch.object(feed.connections, "close_all"), self.assertLogs("api.feed", "ERROR"):
+            executor.run()
+
+    @override_settings(FEED_FANOUT_EAGER=False)
+    def test_follow_side_effects_run_after_commit_off_the_request(self):
+        older = Post.objects.create(author=self.author, content="before the follow")
+        Follow.objects.create(follower=self.author, followed=make_user("friend"))
+        executor = StubExecutor()
+        with mock.patch.object(feed, "_follows_pool", return_value=executor), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.put(f"/follow/{self.author.id}/")
+            self.client.delete(f"/follow/{self.author.id}/")
+            self.client.put(f"/follow/{self.author.id}/")
+            self.assertEqual(executor.jobs, [])
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader).exists())
+        self.assertFalse(SuggestionCandidate.objects.filter(user=self.reader).exists())
+        # queued in commit order, so the last follow wins
+        self.assertEqual([args[2] for _, args in executor.jobs], [True, False, True])
+        with mock.patch.object(feed.connections, "close_all"):
+            executor.run()
+        self.assertEqual(self.feed_ids()[0], [older.id])
+        self.assertEqual(
+            list(SuggestionCandidate.objects.filter(user=self.reader).values_list("candidate__username", "mutual_count")),
+            [("friend", 1)],
+        )
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        older = Post.objects.create(author=self.author, content="before the follow")
+        follow = Follow.objects.create(follower=self.reader, followed=self.author)
+        self.assertEqual(self.feed_ids()[0], [older.id])
+        follow.delete()
+        self.assertEqual(self.feed_ids()[0], [])
+
+    def test_feed_does_not_leak_unfollowed_authors(self):
+        Post.objects.create(author=make_user("stranger"), content="not for you")
+        self.assertEqual(self.feed_ids()[0], [])
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_high_follower_authors_are_pulled_at_read_time(self):
+        self.client.post("/follow/", {"following": self.author.id})
+        other = APIClient()
+        other.force_authenticate(make_user("other"))
+        other.post("/follow/", {"following": self.author.id})
+        post = Post.objects.create(author=self.author, content="big account")
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader, post=post).exists())
+        self.assertEqual(self.feed_ids()[0], [post.id])
+
+    @override_settings(REST_FRAMEWORK={"PAGE_SIZE": 2})
+    def test_cursor_walks_every_page_once(self):
+        Follow.objects.create(follower=self.reader, followed=self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            posts = [Post.objects.create(author=self.author, content=str(i)) for i in range(5)]
+        seen, url = [], "/feed/"
+        while url:
+            ids, url = self.feed_ids(url)
+            seen += ids
+        self.assertEqual(seen, [post.id for post in reversed(posts)])
+
+    def test_invalid_cursor_is_404(self):
+        self.assertEqual(self.client.get("/feed/?cursor=garbage").status_code, 404)
+
+    def test_feed_requires_authentication(self):
+        self.assertEqual(APIClient().get("/feed/").status_code, 401)
+
+
+@override_settings(REST_FRAMEWORK={"PAGE_SIZE": 2})
+class KeysetPaginationTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user("author")
+        self.posts = [Post.objects.create(author=self.author, content=f"sunset {i}") for i in range(5)]
+        self.newest_first = [post.id for post in reversed(self.posts)]
+        self.client = APIClient()
+
+    def test_post_list_follows_link_header(self):
+        seen, url = [], "/posts/"
+        while url:
+            response = self.client.get(url)
+            seen += [post["id"] for post in response.data]
+            url = response.get("Link", "").partition("<")[2].partition(">")[0]
+        self.assertEqual(seen, self.newest_first)
+
+    def test_page_param_keeps_page_number_mode(self):
+        response = self.client.get("/posts/?page=2")
+        self.assertEqual([post["id"] for post in response.data], self.newest_first[2:4])
+        self.assertIn("page=3", response["Link"])
+
+    def test_search_returns_cursor_page(self):
+        response = self.client.get("/posts/search/?q=sunset")
+        self.assertEqual([post["id"] for post in response.data["results"]], self.newest_first[:2])
+        self.assertNotIn("count", response.data)
+        response = self.client.get(response.data["next"])
+        self.assertEqual([post["id"] for post in response.data["results"]], self.newest_first[2:4])
+
+    def test_comments_use_cursor(self):
+        post = self.posts[0]
+        comments = [Comment.objects.create(user=self.author, post=post, message=str(i)) for i in range(3)]
+        response = self.client.get(f"/comments/?post={post.id}")
+        self.assertEqual([c["id"] for c in response.data], [comments[2].id, comments[1].id])
+        self.assertIn('rel="next"', response["Link"])
+
+
+class QueryBudgetTests(ApiTestCase):
+    """
+    Every read endpoint must run a fixed number of queries however many rows
+    the page holds. Each row below has its own author so a missing
+    select_related shows up as one extra query per row.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.viewer = make_user("viewer")
+        self.post = None
+        for i in range(10):
+            author = make_user(f"author{i}")
+            author.profile_pic = f"avatars/author{i}.jpg"
+            author.save()
+            post = Post.objects.create(author=author, content=f"sunset {i}", image=f"posts/{i}.jpg")
+            self.post = self.post or post
+            Follow.objects.create(follower=self.viewer, followed=author)
+        for i in range(10):
+            commenter = make_user(f"commenter{i}")
+            Comment.objects.create(user=commenter, post=self.post, message=f"nice {i}")
+            Likes.objects.create(user=commenter, post=self.post)
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def assertBudget(self, budget, url):
+        with self.assertNumQueries(budget):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_post_list(self):
+        # a cache miss: the page's ids (read before its stamps), the page, one batched viewer-state lookup
+        response = self.assertBudget(3, "/posts/")
+        self.assertEqual(len(response.data), 10)
+
+    def test_post_list_page_number_mode(self):
+        self.assertBudget(3, "/posts/?page=1")
+
+    def test_post_list_by_author(self):
+        self.assertBudget(3, "/posts/?author=author3")
+
+    def test_post_detail(self):
+        self.assertBudget(3, f"/post/{self.post.id}/")
+        # warm: validators row and viewer state, the body comes from the cache
+        self.assertBudget(2, f"/post/{self.post.id}/")
+
+    def test_search(self):
+        response = self.assertBudget(3, "/posts/search/?q=sunset")
+        self.assertEqual(len(response.data["results"]), 10)
+
+    def test_comments(self):
+        response = self.assertBudget(1, f"/comments/?post={self.post.id}")
+        self.assertEqual(len(response.data), 10)
+
+    def test_post_likes(self):
+        response = self.assertBudget(2, f"/postlikes/{self.post.id}/")
+        self.assertEqual(len(response.data), 10)
+
+    def test_feed(self):
+        response = self.assertBudget(4, "/feed/")
+        self.assertEqual(len(response.data["results"]), 10)
+
+    def test_comment_previews(self):
+        # one windowed query for the whole page
+        response = self.assertBudget(4, "/posts/?comments=3")
+        self.assertEqual(len(response.data[-1]["latest_comments"]), 3)
+        self.assertBudget(5, "/feed/?comments=3")
+
+    def test_post_comments(self):
+        response = self.assertBudget(1, f"/post/{self.post.id}/comments/")
+        self.assertEqual(len(response.data["results"]), 10)
+
+    def test_anonymous_post_list_skips_viewer_state(self):
+        self.client.force_authenticate(None)
+        self.assertBudget(2, "/posts/")
+
+    def test_like_state(self):
+        ids = ",".join(str(post.id) for post in Post.objects.all())
+        self.assertBudget(2, f"/postlikes/state/?ids={ids}")
+
+    def test_users(self):
+        self.assertBudget(2, "/users/")
+
+    def test_user_directory(self):
+        response = self.assertBudget(1, "/users/directory/?q=comm")
+        self.assertEqual(len(response.data["results"]), 10)
+
+    def test_suggested_users(self):
+        # candidate window, then the popular-accounts top up
+        response = self.assertBudget(2, "/users/suggested/")
+        self.assertEqual(len(response.data["results"]), 10)
+
+    def test_current_user(self):
+        self.assertBudget(0, "/user/")
+
+
+class MetricsTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        self.viewer = make_user("viewer")
+        author = make_user("author")
+        for i in range(3):
+            Post.objects.create(author=author, content=f"post {i}")
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def test_records_route_queries_and_timings(self):
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get("/posts/")
+        labels = ("GET", "posts/")
+        self.assertEqual(metrics.REQUESTS.value(labels + ("200",)), 1)
+        self.assertEqual(metrics.DURATION.count(labels), 1)
+        self.assertEqual(metrics.QUERIES.total(labels), len(captured))
+        self.assertGreater(metrics.DB_TIME.total(labels), 0)
+        self.assertGreater(metrics.SERIALIZE_TIME.total(labels), 0)
+        self.assertLess(metrics.SERIALIZE_TIME.total(labels), metrics.DURATION.total(labels))
+
+    def test_route_label_is_the_pattern(self):
+        post = Post.objects.first()
+        self.client.get(f"/post/{post.id}/")
+        self.client.get("/no/such/page/")
+        self.assertEqual(metrics.DURATION.count(("GET", "post/<int:pk>/")), 1)
+        self.assertEqual(metrics.REQUESTS.value(("GET", metrics.UNMATCHED, "404")), 1)
+
+    def test_prometheus_text(self):
+        self.client.get("/posts/")
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+        body = response.content.decode()
+        self.assertIn("# TYPE api_request_duration_seconds histogram", body)
+        self.assertIn('api_request_duration_seconds_bucket{method="GET",route="posts/",le="+Inf"} 1', body)
+        self.assertIn('api_request_duration_seconds_count{method="GET",route="posts/"} 1', body)
+        # the scrape itself isn't recorded
+        self.assertNotIn('route="metrics"', body)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram("h", "help", ("route",), (1, 5))
+        for value in (0, 1, 3, 9):
+            histogram.observe(("x",), value)
+        self.assertEqual(list(histogram.samples()), [
+            'h_bucket{route="x",le="1"} 2',
+            'h_bucket{route="x",le="5"} 3',
+            'h_bucket{route="x",le="+Inf"} 4',
+            'h_sum{route="x"} 13.0',
+            'h_count{route="x"} 4',
+        ])
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s3cret", REMOTE_ADDR="203.0.113.7")
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_TOKEN=None, INTERNAL_IPS=["10.0.0.5"])
+    def test_without_a_token_only_internal_ips_may_scrape(self):
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="203.0.113.7").status_code, 403)
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="10.0.0.5").status_code, 200)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="203.0.113.7").status_code, 200)
+
+    @override_settings(METRICS_SLOW_QUERY_MS=0)
+    def test_slow_query_log_names_the_serializer_field(self):
+        with self.assertLogs("api.metrics", "WARNING") as logs:
+            # search still renders with PostSerializer (posts/ goes through api/fastpath.py)
+            self.client.get("/posts/search/?q=post")
+        # the viewer-state lookup runs while liked_by_me is being rendered
+        self.assertTrue(any("field=PostSerializer.liked_by_me" in line for line in logs.output))
+        self.assertEqual(metrics.SLOW_QUERIES.value(("posts/search/", "PostSerializer.liked_by_me")), 1)
+
+    def test_slow_query_log_is_off_by_default(self):
+        with self.assertNoLogs("api.metrics", "WARNING"):
+            self.client.get("/posts/")
+
+
+@override_settings(ROOT_URLCONF="blog_app.urls_async")
+class AsyncReadTests(ApiTestCase):
+    """The async handlers must answer exactly like the sync views they stand in for"""
+
+    def setUp(self):
+        super().setUp()
+        self.viewer = make_user("viewer")
+        author = make_user("author")
+        Follow.objects.create(follower=self.viewer, followed=author)
+        self.posts = [Post.objects.create(author=author, content=f"post {i}") for i in range(12)]
+        self.post = self.posts[-1]
+        for i in range(3):
+            Comment.objects.create(user=self.viewer, post=self.post, message=f"c{i}")
+        Likes.objects.create(user=self.viewer, post=self.post)
+        self.token = str(AccessToken.for_user(self.viewer))
+        self.sync_client = APIClient()
+        self.async_client = AsyncClient()
+        self.stamp_keys = (
+            [caching._post_stamp_key(post.id) for post in self.posts]
+            + [caching._author_stamp_key(user.id) for user in (self.viewer, author)]
+            + [caching._list_version_key(scope) for scope in ("all", "author:author")]
+        )
+
+    async def compare(self, url, token=None):
+        token = self.token if token is None else token
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        await cache.aclear()
+        with override_settings(ROOT_URLCONF="blog_app.urls"):
+            expected = await sync_to_async(self.sync_client.get)(url, headers=headers)
+        # stamps are seeded on first read; carry them over so both sides hash the same values
+        stamps = await cache.aget_many(self.stamp_keys)
+        await cache.aclear()
+        await cache.aset_many(stamps, None)
+        response = await self.async_client.get(url, headers=headers)
+        self.assertEqual(response.status_code, expected.status_code, url)
+        self.assertEqual(response.content, expected.content, url)
+        for header in ("Content-Type", "Link", "Allow", "Vary", "ETag", "WWW-Authenticate"):
+            self.assertEqual(response.get(header), expected.get(header), f"{header} of {url}")
+        return response
+
+    async def test_same_responses(self):
+        self.assertTrue(iscoroutinefunction(resolve("/posts/").func))
+        cursor = KeysetPagination()
+        await cursor.apaginate_queryset(Post.objects.all(), Request(RequestFactory().get("/posts/")))
+        next_page = "/posts/?cursor=" + encode_cursor(cursor.last.created_at, cursor.last.id)
+        for url in [
+            "/posts/", "/posts/?author=author", "/posts/?comments=2", next_page,
+            f"/post/{self.post.id}/", f"/post/{self.post.id}/comments/", f"/comments/?post={self.post.id}",
+            f"/postlikes/{self.post.id}/", "/feed/", "/feed/?comments=3",
+        ]:
+            await self.compare(url)
+
+    async def test_same_errors(self):
+        await self.compare("/post/999999/")
+        await self.compare("/postlikes/999999/")
+        await self.compare("/post/999999/comments/")
+        await self.compare("/posts/?cursor=bogus")
+        await self.compare("/feed/", token="")
+        await self.compare("/feed/", token="not-a-jwt")
+
+    async def test_anonymous(self):
+        await self.compare("/posts/", token="")
+        await self.compare(f"/post/{self.post.id}/", token="")
+
+    async def test_other_methods_fall_back_to_the_sync_view(self):
+        await self.compare("/posts/?page=2")
+        response = await self.async_client.post(
+            "/posts/", {"content": "from asgi"}, content_type="application/json",
+            headers={"Authorization": f"Bearer {self.token}"},
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(await Post.objects.filter(content="from asgi").aexists())
+
+    async def test_records_metrics(self):
+        metrics.reset()
+        await self.async_client.get("/posts/", headers={"Authorization": f"Bearer {self.token}"})
+        labels = ("GET", "posts/")
+        self.assertEqual(metrics.REQUESTS.value(labels + ("200",)), 1)
+        # the user, the page's ids, the page and the viewer state
+        self.assertEqual(metrics.QUERIES.total(labels), 4)
+        self.assertGreater(metrics.SERIALIZE_TIME.total(labels), 0)
+
+
+class CounterTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("user")
+        self.author = make_user("author")
+        self.post = Post.objects.create(author=self.author, content="count me")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def refresh(self):
+        self.post.refresh_from_db()
+        self.author.refresh_from_db()
+        self.user.refresh_from_db()
+
+    def test_like_toggle_updates_like_count(self):
+        self.client.post(f"/postlikes/{self.post.id}/")
+        self.refresh()
+        self.assertEqual(self.post.like_count, 1)
+        self.client.post(f"/postlikes/{self.post.id}/")
+        self.refresh()
+        self.assertEqual(self.post.like_count, 0)
+
+    def test_comment_create_and_delete_update_comment_count(self):
+        response = self.client.post("/comments/", {"post": self.post.id, "message": "hi"})
+        self.refresh()
+        self.assertEqual(self.post.comment_count, 1)
+        self.client.delete(f"/comment/{response.data['id']}")
+        self.refresh()
+        self.assertEqual(self.post.comment_count, 0)
+
+    def test_follow_toggle_updates_both_users(self):
+        self.client.post("/follow/", {"following": self.author.id})
+        self.refresh()
+        self.assertEqual((self.author.follower_count, self.user.following_count), (1, 1))
+        self.client.post("/follow/", {"following": self.author.id})
+        self.refresh()
+        self.assertEqual((self.author.follower_count, self.user.following_count), (0, 0))
+
+    def test_counts_are_serialized(self):
+        self.client.post(f"/postlikes/{self.post.id}/")
+        response = self.client.get(f"/post/{self.post.id}/")
+        self.assertEqual((response.data["like_count"], response.data["comment_count"]), (1, 0))
+        self.assertIn("follower_count", self.client.get("/user/").data)
+
+    def test_reconcile_counters_repairs_drift(self):
+        Likes.objects.create(user=self.user, post=self.post)
+        Comment.objects.create(user=self.user, post=self.post, message="behind the views' back")
+        Follow.objects.create(follower=self.user, followed=self.author)
+        Post.objects.filter(pk=self.post.pk).update(comment_count=7)
+        call_command("reconcile_counters", chunk_size=1, stdout=StringIO())
+        self.refresh()
+        self.assertEqual((self.post.like_count, self.post.comment_count), (1, 1))
+        self.assertEqual((self.author.follower_count, self.user.following_count), (1, 1))
+
+
+class IdempotentRelationTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("tapper")
+        self.author = make_user("tapped")
+        self.post = Post.objects.create(author=self.author, content="double tap me")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_put_and_delete_like_are_idempotent(self):
+        self.assertEqual(self.client.put(f"/postlikes/{self.post.id}/").status_code, 201)
+        self.assertEqual(self.client.put(f"/postlikes/{self.post.id}/").status_code, 200)
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.likes.count()), (1, 1))
+        self.assertEqual(self.client.delete(f"/postlikes/{self.post.id}/").status_code, 204)
+        self.assertEqual(self.client.delete(f"/postlikes/{self.post.id}/").status_code, 204)
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.likes.count()), (0, 0))
+
+    def test_like_is_a_single_write(self):
+        relations.like(self.user.id, self.post.id)
+        with self.assertNumQueries(3):
+            # savepoint, conflicting insert, release; no counter update
+            self.assertFalse(relations.like(self.user.id, self.post.id))
+
+    def test_unlike_deletes_the_row_it_read(self):
+        relations.like(self.user.id, self.post.id)
+        delete = relations._delete
+
+        def relike_first(model, **values):
+            # another request unlikes and likes again between the read and the delete
+            Likes.objects.filter(user=self.user, post=self.post).delete()
+            Likes.objects.create(user=self.user, post=self.post)
+            return delete(model, **values)
+
+        with mock.patch.object(relations, "_delete", side_effect=relike_first):
+            self.assertFalse(relations.unlike(self.user.id, self.post.id))
+        self.assertTrue(Likes.objects.filter(user=self.user, post=self.post).exists())
+
+    def test_put_and_delete_follow_are_idempotent(self):
+        older = Post.objects.create(author=self.author, content="backfilled")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.put(f"/follow/{self.author.id}/").status_code, 201)
+        self.assertEqual(self.client.put(f"/follow/{self.author.id}/").status_code, 200)
+        self.assertTrue(TimelineEntry.objects.filter(user=self.user, post=older).exists())
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.follower_count, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f"/follow/{self.author.id}/").status_code, 204)
+        self.assertEqual(self.client.delete(f"/follow/{self.author.id}/").status_code, 204)
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user, author=self.author).exists())
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.follower_count, 0)
+
+    def test_follow_rejects_self_and_unknown_users(self):
+        self.assertEqual(self.client.put(f"/follow/{self.user.id}/").status_code, 400)
+        self.assertEqual(self.client.put("/follow/999999/").status_code, 404)
+        self.assertEqual(self.client.post("/follow/", {"following": 999999}).status_code, 404)
+
+
+@override_settings(FEED_FANOUT_EAGER=True)
+class RelationRaceTests(TransactionTestCase):
+    """Many threads hammering the same (user, post) and (follower, followed) pairs"""
+    threads = 8
+    rounds = 25
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user("hammer")
+        self.author = make_user("anvil")
+        self.post = Post.objects.create(author=self.author, content="contended")
+
+    def hammer(self, operations):
+        errors = []
+        barrier = threading.Barrier(self.threads)
+
+        def run(operation):
+            while True:
+                try:
+                    return operation()
+                except OperationalError as exc:
+                    # SQLite's shared in-memory test database refuses concurrent
+                    # writers instead of waiting for them; that isn't the race under test
+                    if connection.vendor != "sqlite" or "locked" not in str(exc):
+                        raise
+
+        def worker(index):
+            try:
+                barrier.wait()
+                for round_ in range(self.rounds):
+                    run(operations[(index + round_) % len(operations)])
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent_likes_keep_count_consistent(self):
+        self.hammer([
+            lambda: relations.like(self.user.id, self.post.id),
+            lambda: relations.unlike(self.user.id, self.post.id),
+            lambda: relations.toggle_like(self.user.id, self.post.id),
+        ])
+        self.post.refresh_from_db()
+        self.assertIn(self.post.likes.count(), (0, 1))
+        self.assertEqual(self.post.like_count, self.post.likes.count())
+
+    def test_concurrent_follows_keep_counts_consistent(self):
+        self.hammer([
+            lambda: relations.follow(self.user.id, self.author.id),
+            lambda: relations.unfollow(self.user.id, self.author.id),
+            lambda: relations.toggle_follow(self.user.id, self.author.id),
+        ])
+        rows = Follow.objects.filter(follower=self.user, followed=self.author).count()
+        self.author.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertIn(rows, (0, 1))
+        self.assertEqual((self.author.follower_count, self.user.following_count), (rows, rows))
+
+
+class CommentThreadTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("commenter")
+        self.post = Post.objects.create(author=self.user, content="talk to me")
+        self.other = Post.objects.create(author=self.user, content="quiet one")
+        self.comments = [Comment.objects.create(user=self.user, post=self.post, message=str(i)) for i in range(4)]
+        self.client = APIClient()
+
+    @override_settings(REST_FRAMEWORK={"PAGE_SIZE": 3})
+    def test_thread_pages_with_cursor(self):
+        first = self.client.get(f"/post/{self.post.id}/comments/")
+        self.assertEqual([c["id"] for c in first.data["results"]], [c.id for c in self.comments[:0:-1]])
+        second = self.client.get(first.data["next"])
+        self.assertEqual([c["id"] for c in second.data["results"]], [self.comments[0].id])
+        self.assertIsNone(second.data["next"])
+
+    def test_thread_of_missing_post_is_404(self):
+        self.assertEqual(self.client.get(f"/post/{self.other.id}/comments/").data["results"], [])
+        self.assertEqual(self.client.get("/post/999999/comments/").status_code, 404)
+
+    def test_post_to_thread_bumps_count(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(f"/post/{self.other.id}/comments/", {"message": "first"})
+        self.assertEqual((response.status_code, response.data["post"]), (201, self.other.id))
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.comment_count, 1)
+
+    @override_settings(REST_FRAMEWORK={"PAGE_SIZE": 3})
+    def test_unfiltered_listing_pages_every_comment(self):
+        newest = Comment.objects.create(user=self.user, post=self.other, message="elsewhere")
+        first = self.client.get("/comments/")
+        self.assertEqual([c["id"] for c in first.data], [newest.id, self.comments[3].id, self.comments[2].id])
+        second = self.client.get(first["Link"].split(">")[0].lstrip("<"))
+        self.assertEqual([c["id"] for c in second.data], [self.comments[1].id, self.comments[0].id])
+
+    def test_previews_hold_latest_n_per_post(self):
+        rows = {post["id"]: post for post in self.client.get("/posts/?comments=2").data}
+        self.assertEqual([c["message"] for c in rows[self.post.id]["latest_comments"]], ["3", "2"])
+        self.assertEqual(rows[self.other.id]["latest_comments"], [])
+        self.assertNotIn("latest_comments", self.client.get("/posts/").data[0])
+
+    def test_previews_read_a_limited_slice_per_post(self):
+        with CaptureQueriesContext(connection) as captured:
+            previews = comments.latest_for_posts([self.post.id, self.other.id], 2)
+        self.assertEqual([c.message for c in previews[self.post.id]], ["3", "2"])
+        sql = captured.captured_queries[0]["sql"]
+        # never a window over whole threads
+        self.assertEqual(sql.count("LIMIT 2"), 2)
+        self.assertIn("UNION ALL", sql)
+        self.assertNotIn("ROW_NUMBER", sql)
+
+
+class QueryPlanTests(ApiTestCase):
+    """Every read endpoint's queries must stay on an index (see explain_queries)"""
+
+    def setUp(self):
+        super().setUp()
+        seed_dataset(users=30, posts_per_user=5, follows_per_user=5)
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.order_by("-following_count").first())
+
+    def test_no_unexpected_scans_or_sorts(self):
+        flagged = {}
+        for name, url, allowed in endpoint_urls():
+            report = explain_endpoint(self.client, url, repeat=1, allowed=allowed)
+            self.assertEqual(report["status"], 200, url)
+            for query in report["queries"]:
+                if query["warnings"]:
+                    flagged[name] = (query["warnings"], query["sql"], query["plan"])
+        self.assertEqual(flagged, {})
+
+
+class SeedDataTests(ApiTestCase):
+    def test_seed_data_builds_a_consistent_graph(self):
+        call_command("seed_data", users=40, posts_per_user=2, follows_per_user=5, stdout=StringIO())
+        self.assertEqual(CustomUser.objects.count(), 40)
+        self.assertEqual(Post.objects.count(), 80)
+        self.assertTrue(Follow.objects.exists() and Likes.objects.exists() and Comment.objects.exists())
+        # counters and timelines were rebuilt after the bulk inserts
+        popular = CustomUser.objects.order_by("-follower_count").first()
+        self.assertEqual(popular.follower_count, Follow.objects.filter(followed=popular).count())
+        self.assertTrue(TimelineEntry.objects.exists())
+        self.assertTrue(self.client.login(email="user0@example.com", password="seed-password"))
+
+    def test_refuses_to_reuse_a_prefix(self):
+        make_user("user_existing")
+        with self.assertRaises(CommandError):
+            call_command("seed_data", users=1, stdout=StringIO())
+
+
+@override_settings(FEED_FANOUT_EAGER=True)
+class LoadTestTests(LiveServerTestCase):
+    def test_every_route_has_a_scenario(self):
+        self.assertEqual(set(route_patterns()) - {scenario[1] for scenario in SCENARIOS}, set())
+
+    def test_run_writes_a_baseline(self):
+        cache.clear()
+        seed_dataset(users=5, posts_per_user=2, follows_per_user=2)
+        fd, path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        # one worker: the in-memory test database can't take concurrent writers
+        call_command("loadtest", base_url=self.live_server_url, requests=2, concurrency=1,
+                     output=path, stdout=StringIO(), stderr=StringIO())
+        with open(path) as fh:
+            report = json.load(fh)
+        self.assertEqual(report["uncovered_routes"], [])
+        failed = {row["name"]: row.get("first_error") for row in report["scenarios"] if row["errors"]}
+        self.assertEqual(failed, {})
+        self.assertTrue(all({"p50", "p95", "p99", "throughput_rps"} <= set(row) for row in report["scenarios"]))
+
+
+class UserDirectoryTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        for name in ("alice", "alicia", "alina", "bob", "Alfred"):
+            make_user(name)
+        self.client = APIClient()
+
+    def names(self, url):
+        return [row["username"] for row in self.client.get(url).data["results"]]
+
+    def test_prefix_match_is_alphabetical_and_case_insensitive(self):
+        self.assertEqual(self.names("/users/directory/?q=ALI"), ["alice", "alicia", "alina"])
+
+    def test_mention_sigil_is_ignored(self):
+        self.assertEqual(self.names("/users/directory/?q=@bo"), ["bob"])
+
+    def test_email_prefix(self):
+        self.client.force_authenticate(CustomUser.objects.get(username="bob"))
+        self.assertEqual(self.names("/users/directory/?q=alfred@ex"), ["Alfred"])
+
+    def test_anonymous_queries_never_match_emails(self):
+        self.assertEqual(self.names("/users/directory/?q=alfred@example.com"), [])
+        self.assertEqual(self.names("/users/directory/?q=alf"), ["Alfred"])
+
+    def test_pages_seek_past_the_last_username(self):
+        first = self.client.get("/users/directory/?q=al&limit=2")
+        self.assertEqual([row["username"] for row in first.data["results"]], ["Alfred", "alice"])
+        self.assertEqual(self.names(first.data["next"]), ["alicia", "alina"])
+
+    def test_case_variants_across_a_page_boundary(self):
+        for name in ("Bobby", "bobby", "BOBBY"):
+            make_user(name)
+        seen, url = [], "/users/directory/?q=bobb&limit=1"
+        while url:
+            response = self.client.get(url)
+            seen += [row["username"] for row in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(sorted(seen), ["BOBBY", "Bobby", "bobby"])
+
+    def test_invalid_after_is_404(self):
+        self.assertEqual(self.client.get("/users/directory/?q=al&after=garbage").status_code, 404)
+
+    def test_rows_are_lightweight(self):
+        row = self.client.get("/users/directory/?q=bob").data["results"][0]
+        self.assertEqual(set(row), {"id", "username", "profile_pic", "follower_count"})
+
+    def test_new_users_are_found_immediately(self):
+        self.client.post("/register/", {
+            "username": "alinka", "email": "alinka@example.com",
+            "password": "pass12345", "confirmPassword": "pass12345",
+        })
+        self.assertIn("alinka", self.names("/users/directory/?q=alin"))
+
+    def test_empty_query(self):
+        self.assertEqual(self.names("/users/directory/?q=@"), [])
+
+
+class SuggestionTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.reader = make_user("reader")
+        self.friend, self.other_friend = make_user("friend"), make_user("other_friend")
+        self.popular, self.quiet, self.stranger = make_user("popular"), make_user("quiet"), make_user("stranger")
+        # both friends follow popular, only one follows quiet
+        with self.captureOnCommitCallbacks(execute=True):
+            for friend in (self.friend, self.other_friend):
+                relations.follow(friend.id, self.popular.id)
+            relations.follow(self.friend.id, self.quiet.id)
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def request(self, method, path, data=None):
+        # the candidates are updated after commit
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, method)(path, data)
+
+    def candidates(self, user):
+        return dict(SuggestionCandidate.objects.filter(user=user).values_list("candidate__username", "mutual_count"))
+
+    def suggested(self):
+        return [(row["username"], row["mutual_count"]) for row in self.client.get("/users/suggested/").data["results"]]
+
+    def test_follow_adds_friends_of_friends(self):
+        self.request("put", f"/follow/{self.friend.id}/")
+        self.request("put", f"/follow/{self.other_friend.id}/")
+        self.assertEqual(self.candidates(self.reader), {"popular": 2, "quiet": 1})
+        self.assertEqual(self.suggested()[:2], [("popular", 2), ("quiet", 1)])
+
+    def test_new_follows_reach_existing_followers(self):
+        self.request("put", f"/follow/{self.friend.id}/")
+        Follow.objects.create(follower=self.friend, followed=self.stranger)
+        self.assertEqual(self.candidates(self.reader)["stranger"], 1)
+
+    def test_unfollow_decrements_and_drops(self):
+        self.request("put", f"/follow/{self.friend.id}/")
+        self.request("put", f"/follow/{self.other_friend.id}/")
+        self.request("delete", f"/follow/{self.friend.id}/")
+        self.assertEqual(self.candidates(self.reader), {"popular": 1})
+
+    def test_incremental_matches_rebuild(self):
+        self.request("put", f"/follow/{self.friend.id}/")
+        self.request("post", "/follow/", {"following": self.other_friend.id})
+        Follow.objects.create(follower=self.other_friend, followed=self.stranger)
+        Follow.objects.filter(follower=self.friend, followed=self.quiet).delete()
+        incremental = {user.id: self.candidates(user) for user in CustomUser.objects.all()}
+        call_command("rebuild_suggestions", stdout=StringIO())
+        self.assertEqual({user.id: self.candidates(user) for user in CustomUser.objects.all()}, incremental)
+
+    def test_followed_accounts_are_not_suggested(self):
+        self.request("put", f"/follow/{self.friend.id}/")
+        self.request("put", f"/follow/{self.popular.id}/")
+        self.assertNotIn("popular", dict(self.suggested()))
+
+    def test_recent_activity_breaks_ties(self):
+        Follow.objects.create(follower=self.other_friend, followed=self.stranger)
+        self.request("put", f"/follow/{self.friend.id}/")
+        self.request("put", f"/follow/{self.other_friend.id}/")
+        Post.objects.create(author=self.stranger, content="still around")
+        self.assertEqual([name for name, _ in self.suggested()[:3]], ["popular", "stranger", "quiet"])
+
+    def test_new_users_get_popular_accounts(self):
+        names = [name for name, mutual in self.suggested()]
+        self.assertEqual(names[0], "popular")
+        self.assertNotIn("reader", names)
+
+    @override_settings(SUGGESTION_WINDOW=3, REST_FRAMEWORK={"PAGE_SIZE": 2})
+    def test_pages_walk_the_window(self):
+        first = self.client.get("/users/suggested/")
+        self.assertEqual(len(first.data["results"]), 2)
+        second = self.client.get(first.data["next"])
+        self.assertEqual(len(second.data["results"]), 1)
+        self.assertIsNone(second.data["next"])
+
+
+class SearchTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user("golden_hour")
+        self.client = APIClient()
+
+    def search(self, query):
+        response = self.client.get("/posts/search/", {"q": query})
+        self.assertEqual(response.status_code, 200)
+        return [post["id"] for post in response.data["results"]]
+
+    def test_prefix_and_all_terms_must_match(self):
+        beach = Post.objects.create(author=self.author, content="Sunset over the beach")
+        Post.objects.create(author=self.author, content="Sunrise in the mountains")
+        self.assertEqual(self.search("sunset bea"), [beach.id])
+        self.assertEqual(len(self.search("sun")), 2)
+
+    def test_more_occurrences_rank_higher(self):
+        once = Post.objects.create(author=make_user("other"), content="coffee")
+        thrice = Post.objects.create(author=make_user("another"), content="coffee coffee coffee")
+        self.assertEqual(self.search("coffee"), [thrice.id, once.id])
+
+    def test_username_matches(self):
+        post = Post.objects.create(author=self.author, content="no keywords here")
+        self.assertEqual(self.search("golden"), [post.id])
+
+    def test_every_term_matches_the_content_or_the_author(self):
+        post = Post.objects.create(author=self.author, content="Sunset over the beach")
+        self.assertEqual(self.search("golden sunset"), [post.id])
+        self.assertEqual(self.search("golden mountains"), [])
+
+    @override_settings(SEARCH_BACKEND="fulltext")
+    def test_fulltext_matches_every_term_in_the_content_or_the_author(self):
+        both = Post.objects.create(author=make_user("someone"), content="Golden sunset over the sea")
+        split = Post.objects.create(author=self.author, content="sunset pics")
+        Post.objects.create(author=self.author, content="nothing to see")
+        Post.objects.create(author=make_user("other"), content="sunset again")
+        with mock.patch.object(search._Match, "as_sqlite", sqlite_match, create=True), self.assertNumQueries(1):
+            rows = list(search.search_posts("golden sunset"))
+        self.assertEqual({row["post_id"] for row in rows}, {both.id, split.id})
+        # the author bonus puts the username hit first
+        self.assertEqual(rows[0]["post_id"], split.id)
+
+    def test_update_and_delete_keep_index_in_step(self):
+        post = Post.objects.create(author=self.author, content="draft")
+        post.content = "published"
+        post.save()
+        self.assertEqual(self.search("draft"), [])
+        self.assertEqual(self.search("published"), [post.id])
+        post.delete()
+        self.assertFalse(SearchTerm.objects.exists())
+
+    def test_saves_that_keep_the_text_skip_reindexing(self):
+        post = Post.objects.create(author=self.author, content="draft")
+        with mock.patch.object(search, "index_post") as index_post:
+            post.save()
+            post.status = Post.FAILED
+            post.save(update_fields=["status"])
+            post.content = "published"
+            post.save(update_fields=["content"])
+        index_post.assert_called_once_with(post)
+
+    def test_author_rename_reindexes_posts(self):
+        post = Post.objects.create(author=self.author, content="hello")
+        self.author.username = "blue_hour"
+        self.author.save()
+        self.assertEqual(self.search("golden"), [])
+        self.assertEqual(self.search("blue"), [post.id])
+
+    @override_settings(REST_FRAMEWORK={"PAGE_SIZE": 2})
+    def test_cursor_pages_through_ranked_results(self):
+        posts = [Post.objects.create(author=self.author, content="tea " * (i + 1)) for i in range(5)]
+        response = self.client.get("/posts/search/", {"q": "tea"})
+        seen = [post["id"] for post in response.data["results"]]
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            seen += [post["id"] for post in response.data["results"]]
+        self.assertEqual(seen, [post.id for post in reversed(posts)])
+
+    def test_rebuild_command_backfills(self):
+        post = Post.objects.create(author=self.author, content="backfill me")
+        SearchTerm.objects.all().delete()
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(self.search("backfill"), [post.id])
+
+    def test_empty_query_returns_nothing(self):
+        Post.objects.create(author=self.author, content="anything")
+        self.assertEqual(self.search(""), [])
+
+
+class PostDetailCacheTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user("author")
+        self.post = Post.objects.create(author=self.author, content="viral")
+        self.url = f"/post/{self.post.id}/"
+        self.client = APIClient()
+
+    def test_matching_etag_gets_304(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_if_modified_since_gets_304(self):
+        last_modified = self.client.get(self.url)["Last-Modified"]
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_edit_changes_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.post.content = "edited"
+        self.post.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["content"], "edited")
+
+    def test_like_invalidates_cached_body(self):
+        etag = self.client.get(self.url)["ETag"]
+        liker = APIClient()
+        liker.force_authenticate(make_user("liker"))
+        with self.captureOnCommitCallbacks(execute=True):
+            liker.post(f"/postlikes/{self.post.id}/")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["like_count"], 1)
+
+    def test_comment_changes_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(user=self.author, post=self.post, message="first")
+        self.assertNotEqual(self.client.get(self.url)["ETag"], etag)
+
+    def test_stamps_move_only_after_commit(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            Comment.objects.create(user=self.author, post=self.post, message="first")
+            # a read before the commit must not store its body under the new key
+            self.assertEqual(self.client.get(self.url)["ETag"], etag)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(self.client.get(self.url)["ETag"], etag)
+
+    def test_profile_picture_change_invalidates(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.profile_pic = "avatars/new.jpg"
+            self.author.save()
+        self.assertIn("avatars/new", self.client.get(self.url).data["profile_pic"])
+
+    def test_missing_post_is_404(self):
+        self.assertEqual(self.client.get("/post/999999/").status_code, 404)
+
+
+class PostPageTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.viewer = make_user("viewer")
+        self.author = make_user("author")
+        self.post = Post.objects.create(author=self.author, content="hello")
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def test_post_comments_and_viewer_state(self):
+        relations.like(self.viewer.id, self.post.id)
+        relations.follow(self.viewer.id, self.author.id)
+        Comment.objects.create(user=self.author, post=self.post, message="first")
+        with self.assertNumQueries(3):  # post, comments, viewer state
+            response = self.client.get(f"/post/{self.post.id}/page/")
+        self.assertEqual(response.status_code, 200)
+        post = response.data["post"]
+        self.assertEqual((post["like_count"], post["liked_by_me"], post["author_followed_by_me"]), (1, True, True))
+        [comment] = response.data["comments"]["results"]
+        self.assertEqual((comment["message"], comment["username"]), ("first", "author"))
+        self.assertIsNone(response.data["comments"]["next"])
+
+    def test_matches_the_separate_endpoints(self):
+        for n in range(api_settings.PAGE_SIZE + 3):
+            Comment.objects.create(user=self.author, post=self.post, message=str(n))
+        page = self.client.get(f"/post/{self.post.id}/page/").data
+        thread = self.client.get(f"/post/{self.post.id}/comments/").data
+        self.assertEqual(page["post"], self.client.get(f"/post/{self.post.id}/").data)
+        self.assertEqual([c["id"] for c in page["comments"]["results"]], [c["id"] for c in thread["results"]])
+        self.assertEqual(page["comments"]["next"], thread["next"])
+        rest = self.client.get(page["comments"]["next"]).data
+        self.assertEqual(len(rest["results"]), 3)
+
+    def test_anonymous_and_missing(self):
+        self.client.force_authenticate(None)
+        with self.assertNumQueries(2):
+            self.assertFalse(self.client.get(f"/post/{self.post.id}/page/").data["post"]["liked_by_me"])
+        self.assertEqual(self.client.get("/post/999999/page/").status_code, 404)
+
+
+class PostListCacheTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user("author")
+        self.other = make_user("other")
+        self.post = Post.objects.create(author=self.author, content="first")
+        Post.objects.create(author=self.other, content="elsewhere")
+        self.client = APIClient()
+
+    def contents(self, url="/posts/"):
+        return [post["content"] for post in self.client.get(url).data]
+
+    def test_hit_matches_miss_without_queries(self):
+        for n in range(api_settings.PAGE_SIZE):
+            Post.objects.create(author=self.author, content=f"post {n}")
+        miss = self.client.get("/posts/?comments=2")
+        with self.assertNumQueries(0):
+            hit = self.client.get("/posts/?comments=2")
+        self.assertEqual(hit.content, miss.content)
+        self.assertEqual(hit["Link"], miss["Link"])
+
+    def test_web_client_first_page_is_served_from_the_cache(self):
+        # getPosts always sends ?page=1, for the home page and for profiles
+        for n in range(api_settings.PAGE_SIZE):
+            Post.objects.create(author=self.author, content=f"post {n}")
+        keyset = self.client.get("/posts/?author=author")
+        with self.assertNumQueries(0):
+            paged = self.client.get("/posts/?page=1&author=author")
+        self.assertEqual(paged.content, keyset.content)
+        self.assertIn("page=2", paged["Link"])
+        self.assertIn("page=2", self.client.get("/posts/?page=1")["Link"])
+        with self.assertNumQueries(0):
+            self.client.get("/posts/")
+        self.assertNotEqual(self.contents("/posts/?page=2"), self.contents("/posts/?page=1"))
+
+    def test_evicted_version_does_not_bring_back_an_old_entry(self):
+        self.assertEqual(self.contents(), ["elsewhere", "first"])
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(author=self.author, content="second")
+        self.assertEqual(self.contents()[0], "second")
+        # a culling cache dropped the version, while the first entry is still there
+        cache.delete(caching._list_version_key("all"))
+        self.assertEqual(self.contents()[0], "second")
+
+    def test_viewer_flags_are_per_viewer(self):
+        liker = make_user("liker")
+        Likes.objects.create(user=liker, post=self.post)
+        self.client.get("/posts/")
+        self.client.force_authenticate(liker)
+        # one lookup of the viewer's likes/follows on the page, the posts come from the cache
+        with self.assertNumQueries(1):
+            posts = {post["id"]: post for post in self.client.get("/posts/").data}
+        self.assertTrue(posts[self.post.id]["liked_by_me"])
+        self.client.force_authenticate(self.other)
+        self.assertFalse({post["id"]: post for post in self.client.get("/posts/").data}[self.post.id]["liked_by_me"])
+
+    def test_new_post_invalidates_only_its_author(self):
+        self.contents()
+        self.contents("/posts/?author=other")
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(author=self.author, content="second")
+        self.assertEqual(self.contents(), ["second", "elsewhere", "first"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.contents("/posts/?author=other"), ["elsewhere"])
+
+    def test_delete_invalidates(self):
+        self.contents("/posts/?author=author")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.delete()
+        self.assertEqual(self.contents("/posts/?author=author"), [])
+
+    def test_edits_and_likes_invalidate(self):
+        self.client.get("/posts/")
+        liker = APIClient()
+        liker.force_authenticate(self.other)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.content = "edited"
+            self.post.save()
+            liker.post(f"/postlikes/{self.post.id}/")
+        post = next(post for post in self.client.get("/posts/").data if post["id"] == self.post.id)
+        self.assertEqual((post["content"], post["like_count"]), ("edited", 1))
+
+    def test_like_committed_during_a_fill_is_not_cached_as_fresh(self):
+        trim = KeysetPagination._trim
+
+        def read_rows_then_like(paginator, rows):
+            rows = trim(paginator, rows)
+            if rows and "like_count" in rows[0] and not Likes.objects.exists():
+                # the page's rows are read, a like commits before the entry is stored
+                with self.captureOnCommitCallbacks(execute=True):
+                    relations.like(self.other.id, self.post.id)
+            return rows
+
+        with mock.patch.object(KeysetPagination, "_trim", autospec=True, side_effect=read_rows_then_like):
+            self.client.get("/posts/")
+        post = next(post for post in self.client.get("/posts/").data if post["id"] == self.post.id)
+        self.assertEqual(post["like_count"], 1)
+
+    def test_file_backend(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        backend = {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": location}
+        with override_settings(CACHES={"default": backend}):
+            self.contents()
+            with self.assertNumQueries(0):
+                self.assertEqual(self.contents(), ["elsewhere", "first"])
+
+
+class SingleFlightTests(ApiTestCase):
+    def slow_compute(self, calls):
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return "value"
+        return compute
+
+    def test_concurrent_misses_compute_once(self):
+        calls, results = [], []
+        compute = self.slow_compute(calls)
+        threads = [threading.Thread(target=lambda: results.append(caching.single_flight("k", compute, 60)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["value"] * 8)
+
+    async def test_concurrent_async_misses_compute_once(self):
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "value"
+
+        results = await asyncio.gather(*(caching.asingle_flight("k", compute, 60) for _ in range(8)))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["value"] * 8)
+
+    def test_waits_for_another_process_holding_the_lock(self):
+        cache.add("fill-lock:k", 1)
+        threading.Timer(0.1, lambda: cache.set("k", "theirs")).start()
+        calls = []
+        self.assertEqual(caching.single_flight("k", self.slow_compute(calls), 60), "theirs")
+        self.assertEqual(calls, [])
+
+    def test_stale_value_is_recomputed(self):
+        cache.set("k", "old")
+        self.assertEqual(caching.single_flight("k", lambda: "new", 60, fresh=lambda value: value != "old"), "new")
+
+
+class TrendingTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user("author")
+        self.fan = make_user("fan")
+        self.client = APIClient()
+        self.client.force_authenticate(self.fan)
+
+    def explore(self, url="/explore/"):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def ranking(self):
+        return [post["id"] for post in self.explore()["results"]]
+
+    def test_ranked_by_weighted_activity(self):
+        liked, commented, quiet = (Post.objects.create(author=self.author, content=c) for c in ("a", "b", "c"))
+        self.client.put(f"/postlikes/{liked.id}/")
+        self.client.put(f"/postlikes/{commented.id}/")
+        self.client.post(f"/post/{commented.id}/comments/", {"message": "wow"})
+        self.assertEqual(self.ranking(), [commented.id, liked.id])
+
+    def test_older_activity_decays(self):
+        old, new = Post.objects.create(author=self.author, content="old"), Post.objects.create(author=self.author)
+        now = timezone.now()
+        for _ in range(3):
+            # three likes two half-lives ago are worth 0.75 of a like now
+            trending.like_added(old.id, now - 2 * trending.HALF_LIFE)
+        trending.like_added(new.id, now)
+        self.assertEqual(self.ranking(), [new.id, old.id])
+
+    def test_unlike_and_comment_delete_take_the_activity_back(self):
+        post = Post.objects.create(author=self.author, content="a")
+        self.client.put(f"/postlikes/{post.id}/")
+        comment = Comment.objects.create(user=self.fan, post=post, message="hi")
+        self.client.delete(f"/postlikes/{post.id}/")
+        comment.delete()
+        self.assertFalse(TrendingPost.objects.filter(post=post).exists())
+        self.assertEqual(self.ranking(), [])
+
+    def test_incremental_scores_match_rebuild(self):
+        posts = [Post.objects.create(author=self.author, content=str(n)) for n in range(3)]
+        for n, post in enumerate(posts):
+            for user in [make_user(f"liker{n}{m}") for m in range(n + 1)]:
+                relations.like(user.id, post.id)
+            Comment.objects.create(user=self.fan, post=post, message="hi")
+        relations.unlike(CustomUser.objects.get(username="liker20").id, posts[2].id)
+        incremental = dict(TrendingPost.objects.values_list("post_id", "score"))
+        call_command("rebuild_trending", stdout=StringIO())
+        rebuilt = dict(TrendingPost.objects.values_list("post_id", "score"))
+        self.assertEqual(incremental.keys(), rebuilt.keys())
+        for post_id, score in rebuilt.items():
+            self.assertAlmostEqual(incremental[post_id], score, places=6)
+
+    def test_read_cost_does_not_grow_with_likes(self):
+        post = Post.objects.create(author=self.author, content="viral")
+        trending.like_added(post.id, timezone.now())
+        self.client.logout()
+        with self.assertNumQueries(2) as few:  # the ranked page, then its posts
+            self.explore()
+        for _ in range(200):
+            trending.like_added(post.id, timezone.now())
+        with self.assertNumQueries(len(few.captured_queries)):
+            self.explore()
+
+    def test_pages(self):
+        now = timezone.now()
+        for n in range(api_settings.PAGE_SIZE + 2):
+            trending.like_added(Post.objects.create(author=self.author, content=str(n)).id, now)
+        first = self.explore()
+        second = self.explore(first["next"])
+        ids = [post["id"] for post in first["results"] + second["results"]]
+        self.assertEqual(len(ids), api_settings.PAGE_SIZE + 2)
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertIsNone(second["next"])
+
+    def test_prune_drops_decayed_posts(self):
+        stale, fresh = Post.objects.create(author=self.author), Post.objects.create(author=self.author)
+        now = timezone.now()
+        trending.like_added(stale.id, now - timedelta(days=30))
+        trending.like_added(fresh.id, now)
+        self.assertEqual(self.ranking(), [fresh.id])
+        call_command("rebuild_trending", "--prune", stdout=StringIO())
+        self.assertEqual(list(TrendingPost.objects.values_list("post_id", flat=True)), [fresh.id])
+
+
+class CachedAuthenticationTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("reader")
+        self.post = Post.objects.create(author=make_user("author"), content="hello")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+    def queries(self, method, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url)
+        self.assertLess(response.status_code, 300)
+        return len(queries)
+
+    def test_user_lookup_is_cached(self):
+        first = self.queries("put", f"/postlikes/{self.post.id}/")
+        self.client.delete(f"/postlikes/{self.post.id}/")
+        self.assertEqual(self.queries("put", f"/postlikes/{self.post.id}/"), first - 1)
+
+    def test_deactivation_takes_effect_at_once(self):
+        self.client.get("/user/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get("/user/").status_code, 401)
+
+    def test_profile_and_follow_counts_are_fresh(self):
+        self.client.get("/user/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.username = "renamed"
+            self.user.save()
+        self.assertEqual(self.client.get("/user/").data["username"], "renamed")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/follow/", {"following": self.post.author_id})
+        self.assertEqual(self.client.get("/user/").data["following_count"], 1)
+
+    def test_evicted_stamp_does_not_revive_an_old_entry(self):
+        self.client.get("/user/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.username = "renamed"
+            self.user.save()
+        self.assertEqual(self.client.get("/user/").data["username"], "renamed")
+        # an entry filled before any bump (stamp 0 before seeding) is still there, and the cache culled the stamp
+        stale = CustomUser.objects.get(pk=self.user.id)
+        stale.username = "reader"
+        cache.set(f"auth-user:{self.user.id}", authentication._entry(stale, 0))
+        cache.delete(f"auth-user-stamp:{self.user.id}")
+        self.assertEqual(self.client.get("/user/").data["username"], "renamed")
+
+    def test_deleted_user_is_rejected(self):
+        self.client.get("/user/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertEqual(self.client.get("/user/").status_code, 401)
+
+    def test_cache_holds_no_password_hash(self):
+        self.assertEqual(self.client.get("/user/").status_code, 200)
+        entry = cache.get(f"auth-user:{self.user.id}")
+        self.assertNotIn(self.user.password, repr(entry))
+        # a hit rebuilds the user from the cached fields without a query
+        with self.assertNumQueries(0):
+            user = CachedJWTAuthentication().get_user(AccessToken.for_user(self.user))
+        self.assertEqual((user.pk, user.username, user.is_active), (self.user.pk, "reader", True))
+        self.assertEqual(self.client.get("/user/").data["username"], "reader")
+
+    def test_password_change_revokes_cached_tokens(self):
+        # simplejwt reads its settings off one shared object
+        self.enterContext(mock.patch.object(authentication.api_settings, "CHECK_REVOKE_TOKEN", True))
+        token = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(self.client.get("/user/").status_code, 200)
+        self.assertEqual(self.client.get("/user/").status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password("changed12345")
+            self.user.save()
+        self.assertEqual(self.client.get("/user/").status_code, 401)
+
+    async def test_async_path_shares_the_cache(self):
+        token = AccessToken.for_user(self.user)
+        auth = CachedJWTAuthentication()
+        await sync_to_async(auth.get_user)(token)
+        with mock.patch.object(CustomUser.objects, "filter", side_effect=AssertionError("not cached")):
+            self.assertEqual((await auth.aget_user(token)).pk, self.user.pk)
+
+
+class MediaUrlTests(SimpleTestCase):
+    def setUp(self):
+        media.clear_url_cache()
+
+    def test_matches_cloudinary_resource_url(self):
+        image = CloudinaryResource("posts/beach", format="jpg", version="1700000000")
+        video = CloudinaryResource("clips/wave", format="mov", resource_type="video")
+        self.assertEqual(media.resource_url(image), image.url)
+        self.assertEqual(media.resource_url(video), video.url)
+        self.assertIsNone(media.resource_url(None))
+
+    def test_transformations_are_part_of_the_key(self):
+        mp4 = media.build_url("clips/wave", resource_type="video", format="mp4", quality="auto")
+        self.assertEqual(mp4, cloudinary_url("clips/wave", resource_type="video", format="mp4", quality="auto")[0])
+        self.assertNotEqual(mp4, media.build_url("clips/wave", resource_type="video", format="webm", quality="auto"))
+
+    def test_repeat_lookups_hit(self):
+        avatar = CloudinaryResource("avatars/me", format="png")
+        media.resource_url(avatar)
+        media.resource_url(avatar)
+        self.assertEqual(media.url_cache_stats()["misses"], 1)
+        self.assertEqual(media.url_cache_stats()["hits"], 1)
+
+
+class FastPathTests(ApiTestCase):
+    """api/fastpath.py and FastJSONRenderer must write exactly what the serializers and JSONRenderer did"""
+
+    def setUp(self):
+        super().setUp()
+        self.viewer = make_user("viewer")
+        author = make_user("author")
+        author.profile_pic = CloudinaryResource("avatars/author", format="png", version="1700000000")
+        author.save()
+        Follow.objects.create(follower=self.viewer, followed=author)
+        contents = ["plain", "emoji \U0001f305 and \u00e9", "line\u2028sep\u2029para", 'quote " back\\ tab\t nul\x00', ""]
+        for i, content in enumerate(contents):
+            Post.objects.create(
+                author=author if i % 2 else self.viewer, content=content,
+                image=CloudinaryResource(f"posts/{i}", format="jpg", version="1700000000") if i % 2 else None,
+                video=CloudinaryResource(f"clips/{i}", format="mov" if i < 3 else "mp4", resource_type="video")
+                if i % 3 == 0 else None,
+            )
+        self.posts = list(Post.objects.select_related("author").order_by("-created_at", "-id"))
+        for post in self.posts[:3]:
+            Comment.objects.create(user=self.viewer, post=post, message=f"on {post.id} \u2028")
+            Likes.objects.create(user=self.viewer, post=post)
+
+    def assertSameBytes(self, serializer_data, fast_data):
+        self.assertEqual(FastJSONRenderer().render(fast_data), JSONRenderer().render(serializer_data))
+
+    def test_posts(self):
+        rows = list(fastpath.post_rows(Post.objects.order_by("-created_at", "-id")))
+        viewer = viewer_state_for_rows(self.viewer, rows)
+        for count in (0, 2):
+            previews = fastpath.preview_rows(rows, count)
+            context = {"viewer_state": viewer, "comment_previews": count, "comment_preview_rows": previews}
+            self.assertSameBytes(PostSerializer(self.posts, many=True, context=context).data,
+                                 fastpath.post_data(rows, viewer, previews))
+
+    def test_comments_and_likes(self):
+        post = self.posts[0]
+        thread = comments.thread(post.id).order_by("-created_at", "-id")
+        self.assertSameBytes(CommentSerializer(thread, many=True).data,
+                             fastpath.comment_data(fastpath.comment_rows(thread)))
+        with timezone.override("America/New_York"):
+            self.assertSameBytes(CommentSerializer(thread, many=True).data,
+                                 fastpath.comment_data(fastpath.comment_rows(thread)))
+        likes = post.likes.select_related("user", "post__author").order_by("-id")
+        self.assertSameBytes(LikesSerializer(likes, many=True).data,
+                             fastpath.like_data(fastpath.like_rows(likes), post))
+
+    def test_views_render_through_the_fast_path(self):
+        client = APIClient()
+        client.force_authenticate(self.viewer)
+        response = client.get("/posts/?comments=1")
+        viewer = viewer_state_for_rows(self.viewer, fastpath.post_rows(Post.objects.all()))
+        serializer = PostSerializer(self.posts, many=True, context={"viewer_state": viewer, "comment_previews": 1})
+        self.assertEqual(response.content, JSONRenderer().render(serializer.data))
+        # the browsable API still gets indented JSON
+        self.assertIn(b"&quot;id&quot;: ", client.get("/posts/", HTTP_ACCEPT="text/html").content)
+
+    def test_renderer_falls_back_to_json_renderer(self):
+        data = {"when": timezone.now(), "big": 2 ** 70, "text": "\u2028"}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render({"a": [1]}, "application/json; indent=2"),
+                         JSONRenderer().render({"a": [1]}, "application/json; indent=2"))
+        self.assertEqual(FastJSONRenderer().render(None), b"")
+        with mock.patch.object(renderers, "orjson", None):
+            self.assertEqual(FastJSONRenderer().render({"a": "\u2029"}), b'{"a":"\\u2029"}')
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class ExportTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("exporter")
+        other = make_user("other")
+        posts = [Post.objects.create(author=self.user, content=f"mine {i}") for i in range(3)]
+        theirs = Post.objects.create(author=other, content="theirs")
+        for post in posts[:2] + [theirs]:
+            Comment.objects.create(user=self.user, post=post, message="hi")
+            Likes.objects.create(user=self.user, post=post)
+        Comment.objects.create(user=other, post=posts[0], message="not mine")
+        Follow.objects.create(follower=self.user, followed=other)
+        Follow.objects.create(follower=other, followed=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def lines(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+    def records(self, lines):
+        return [line for line in lines if line["type"] not in ("checkpoint", "done")]
+
+    def test_streams_every_record_in_chunks(self):
+        with CaptureQueriesContext(connection) as captured:
+            lines = self.lines(self.client.get("/user/export/"))
+        records = self.records(lines)
+        self.assertEqual([record["type"] for record in records],
+                         ["post"] * 3 + ["comment"] * 3 + ["like"] * 3 + ["following", "follower"])
+        self.assertEqual(records[3]["message"], "hi")
+        self.assertEqual(records[-1]["username"], "other")
+        self.assertEqual(lines[-1], {"type": "done"})
+        # a checkpoint behind every chunk of at most two records
+        self.assertEqual(sum(line["type"] == "checkpoint" for line in lines), 8)
+        self.assertTrue(all("LIMIT 2" in query["sql"] for query in captured.captured_queries))
+
+    @override_settings(EXPORT_RECORDS_PER_RESPONSE=3)
+    def test_resumes_from_checkpoints(self):
+        expected = self.records([json.loads(line) for line in b"".join(export.ndjson(self.user.id)).splitlines()])
+        records, after, requests = [], None, 0
+        while True:
+            lines = self.lines(self.client.get("/user/export/", {"after": after} if after else {}))
+            requests += 1
+            self.assertLessEqual(len(self.records(lines)), 4)
+            records += self.records(lines)
+            if lines[-1]["type"] == "done":
+                break
+            after = lines[-1]["after"]
+        self.assertEqual(records, expected)
+        self.assertGreater(requests, 2)
+
+    def test_zip(self):
+        response = self.client.get("/user/export/?output=zip")
+        self.assertEqual(response["Content-Type"], "application/zip")
+        self.assertIn('filename="export-', response["Content-Disposition"])
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(archive.namelist(),
+                         ["posts.ndjson", "comments.ndjson", "likes.ndjson", "following.ndjson", "followers.ndjson",
+                          "status.json"])
+        self.assertEqual(json.loads(archive.read("status.json")), {"type": "done"})
+        self.assertEqual(archive.read("likes.ndjson").count(b'"type":"like"'), 3)
+
+    def test_errors(self):
+        self.assertEqual(self.client.get("/user/export/?after=bogus").status_code, 404)
+        self.assertEqual(APIClient().get("/user/export/").status_code, 401)
+
+    async def test_streams_asynchronously_under_asgi(self):
+        token = await sync_to_async(AccessToken.for_user)(self.user)
+        response = await AsyncClient().get("/user/export/", headers={"Authorization": f"Bearer {token}"})
+        self.assertTrue(response.is_async)
+        body = b"".join([block async for block in response.streaming_content])
+        self.assertEqual(json.loads(body.splitlines()[-1]), {"type": "done"})
+
+    def test_command_resumes_a_cut_off_file(self):
+        path = os.path.join(tempfile.mkdtemp(), "export.ndjson")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        call_command("export_user_data", "exporter", path, stdout=StringIO())
+        with open(path, "rb") as fh:
+            complete = fh.read()
+        with open(path, "wb") as fh:
+            # cut off in the middle of a record after a few checkpoints
+            fh.write(complete[:complete.index(b'"type":"like"') + 5])
+        call_command("export_user_data", "exporter@example.com", path, "--resume", stdout=StringIO())
+        with open(path, "rb") as fh:
+            self.assertEqual(fh.read(), complete)
+        out = StringIO()
+        call_command("export_user_data", "exporter", path, "--resume", stdout=out)
+        self.assertIn("already complete", out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command("export_user_data", "exporter", path, "--zip", "--resume")
+
+
+class DeletionTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_user("author")
+        self.fan = make_user("fan")
+        self.bystander = make_user("bystander")
+        relations.follow(self.fan.id, self.author.id)
+        relations.follow(self.author.id, self.bystander.id)
+        self.post = Post.objects.create(author=self.author, content="going away soon")
+        self.other = Post.objects.create(author=self.bystander, content="staying")
+        for user in (self.fan, self.bystander):
+            relations.like(user.id, self.post.id)
+            Comment.objects.create(user=user, post=self.post, message="nice")
+            counters.comment_added(self.post.id)
+        relations.like(self.author.id, self.other.id)
+        Comment.objects.create(user=self.author, post=self.other, message="by the author")
+        counters.comment_added(self.other.id)
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def test_deleted_post_is_hidden_at_once_and_reaped_later(self):
+        self.assertEqual(len(self.client.get("/posts/").data), 2)
+        with mock.patch.object(deletion, "_pool") as pool, self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f"/post/{self.post.id}/").status_code, 204)
+        pool.return_value.submit.assert_called_once()
+        # the reaper hasn't run: the rows are still there, but nothing lists them
+        self.assertEqual(Likes.objects.filter(post_id=self.post.id).count(), 2)
+        self.assertEqual([row["id"] for row in self.client.get("/posts/").data], [self.other.id])
+        self.assertEqual(self.client.get(f"/post/{self.post.id}/").status_code, 404)
+        self.assertEqual(self.client.get(f"/post/{self.post.id}/comments/").status_code, 404)
+        self.assertEqual(self.client.get(f"/comments/?post={self.post.id}").data, [])
+        self.assertEqual(self.client.get(f"/postlikes/{self.post.id}/").status_code, 404)
+        self.assertEqual(self.client.delete(f"/post/{self.post.id}/").status_code, 404)
+
+        job = Deletion.objects.get(target=Deletion.POST, target_id=self.post.id)
+        self.assertIsNone(job.finished_at)
+        dependents = sum(
+            model.objects.filter(post_id=self.post.id).count() for model in (TimelineEntry, SearchTerm, Likes, Comment)
+        )
+        deletion.reap(size=1)
+        job.refresh_from_db()
+        self.assertIsNotNone(job.finished_at)
+        self.assertFalse(Post.all_objects.filter(pk=self.post.id).exists())
+        self.assertFalse(Likes.objects.filter(post_id=self.post.id).exists())
+        self.assertFalse(Comment.objects.filter(post_id=self.post.id).exists())
+        self.assertFalse(TimelineEntry.objects.filter(post_id=self.post.id).exists())
+        self.assertEqual(job.deleted_rows, dependents + 1)
+
+    def test_reaper_saves_progress_after_every_batch(self):
+        deletion.delete_post(self.post)
+        job = Deletion.objects.get()
+        plan = [label for label, *_ in deletion.POST_STEPS]
+        for _ in range(3):
+            self.assertTrue(deletion._batch(job.id, 1))
+        job.refresh_from_db()
+        self.assertIn(job.step, plan)
+        self.assertGreaterEqual(plan.index(job.step), plan.index("search"))
+        done = job.deleted_rows
+        self.assertGreater(done, 0)
+        # a new reaper (e.g. after a restart) carries on from the saved step
+        deletion.reap(size=1)
+        job.refresh_from_db()
+        self.assertEqual(job.step, "post")
+        self.assertGreater(job.deleted_rows, done)
+        self.assertFalse(Post.all_objects.filter(pk=self.post.id).exists())
+
+    def test_reaper_deletes_a_batch_with_one_statement_and_one_stamp(self):
+        deletion.delete_post(self.post)
+        job = Deletion.objects.get()
+        Deletion.objects.filter(pk=job.pk).update(step="likes")
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks() as callbacks:
+            deletion._batch(job.id, 10)
+        deletes = [query["sql"] for query in queries if query["sql"].startswith("DELETE")]
+        self.assertEqual(len(deletes), 1)
+        self.assertIn("api_likes", deletes[0])
+        # one touch_posts for the batch instead of a touch_post per like
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(Likes.objects.filter(post_id=self.post.id).exists())
+
+    def test_reaper_batches_are_one_statement_without_delete_signals(self):
+        # timeline rows have no receivers, so delete() fast-deletes them; likes do, and go through the
+        # private QuerySet._raw_delete so their receivers don't run on top of the batch callback
+        deletion.delete_post(self.post)
+        job = Deletion.objects.get()
+        receiver = mock.Mock()
+        post_delete.connect(receiver, sender=Likes, weak=False)
+        self.addCleanup(post_delete.disconnect, receiver, sender=Likes)
+        for step, model in (("timeline", TimelineEntry), ("likes", Likes)):
+            Deletion.objects.filter(pk=job.pk).update(step=step)
+            self.assertTrue(model.objects.filter(post_id=self.post.id).exists())
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks():
+                deletion._batch(job.id, 10)
+            self.assertEqual(len([query for query in queries if query["sql"].startswith("DELETE")]), 1)
+            self.assertFalse(model.objects.filter(post_id=self.post.id).exists())
+        receiver.assert_not_called()
+
+    @override_settings(DELETION_REAPER_EAGER=True)
+    def test_deleted_user_disappears_and_counters_follow(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.assertTrue(deletion.delete_user(self.author))
+        viewer = APIClient()
+        viewer.force_authenticate(self.fan)
+        self.assertEqual(viewer.get(f"/post/{self.post.id}/").status_code, 404)
+        self.assertEqual(viewer.get(f"/post/{self.other.id}/comments/").data["results"], [])
+        self.assertEqual(viewer.get(f"/postlikes/{self.other.id}/").data, [])
+        self.assertEqual(viewer.get("/users/directory/?q=auth").data["results"], [])
+        self.assertNotIn(self.author.id, [user["id"] for user in viewer.get("/users/").data["results"]])
+        self.assertEqual(viewer.put(f"/follow/{self.author.id}/").status_code, 404)
+        self.assertFalse(CustomUser.objects.get(pk=self.author.id).is_active)
+        fan_token = AccessToken.for_user(self.fan)
+        self.assertEqual(CachedJWTAuthentication().get_user(fan_token).following_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for callback in callbacks:
+                callback()
+        # the reaper moved the fan's count, their cached request.user follows
+        self.assertEqual(CachedJWTAuthentication().get_user(fan_token).following_count, 0)
+        self.assertIsNotNone(Deletion.objects.get(target=Deletion.USER).finished_at)
+        self.assertFalse(CustomUser.objects.filter(pk=self.author.id).exists())
+        self.assertFalse(Post.all_objects.filter(author_id=self.author.id).exists())
+        self.other.refresh_from_db()
+        self.assertEqual((self.other.like_count, self.other.comment_count), (0, 0))
+        # the author's like and comment were the post's only activity
+        self.assertFalse(TrendingPost.objects.filter(post=self.other).exists())
+        self.fan.refresh_from_db()
+        self.bystander.refresh_from_db()
+        self.assertEqual(self.fan.following_count, 0)
+        self.assertEqual(self.bystander.follower_count, 0)
+        self.assertFalse(Comment.objects.filter(post=self.other).exists())
+        self.assertFalse(deletion.delete_user(self.author))
+
+    def test_admin_deletes_softly(self):
+        admin = CustomUser.objects.create_superuser(username="root", email="root@example.com", password="pass12345")
+        self.client.force_login(admin)
+        response = self.client.post(f"/admin/api/post/{self.post.id}/delete/", {"post": "yes"})
+        self.assertEqual(response.status_code, 302)
+        self.assertIsNotNone(Post.all_objects.get(pk=self.post.id).deleted_at)
+        self.assertTrue(Likes.objects.filter(post_id=self.post.id).exists())
+        self.client.post(f"/admin/api/customuser/{self.fan.id}/delete/", {"post": "yes"})
+        self.assertIsNotNone(CustomUser.objects.get(pk=self.fan.id).deleted_at)
+
+    def test_command(self):
+        deletion.delete_post(self.post)
+        out = StringIO()
+        call_command("reap_deletions", "--status", stdout=out)
+        self.assertIn(f"post {self.post.id}: queued", out.getvalue())
+        out = StringIO()
+        call_command("reap_deletions", "--batch-size", "1", stdout=out)
+        self.assertIn("1 of 1 pending deletions finished", out.getvalue())
+
+
+class FlakyStorage:
+    """Fails the first upload, then behaves like LocalStorage"""
+    calls = 0
+
+    def upload(self, path, resource_type):
+        FlakyStorage.calls += 1
+        if FlakyStorage.calls == 1:
+            raise ConnectionError("upstream timeout")
+        return f"{resource_type}/upload/local/flaky.jpg"
+
+
+class BrokenStorage:
+    def upload(self, path, resource_type):
+        raise ConnectionError("upstream down")
+
+
+class MediaIngestTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.settings_override = override_settings(
+            MEDIA_STORAGE_BACKEND="api.storage.LocalStorage",
+            MEDIA_LOCAL_ROOT=self.media_root,
+            MEDIA_INGEST_STAGING_DIR=self.media_root + "/staging",
+            MEDIA_INGEST_EAGER=True,
+            MEDIA_INGEST_RETRY_DELAY=0,
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(make_user("author"))
+
+    def create(self, **files):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = self.client.post("/posts/", {"content": "with media", **files}, format="multipart")
+        return response, callbacks
+
+    def test_upload_is_accepted_then_processed_in_background(self):
+        image = SimpleUploadedFile("beach.jpg", b"not really a jpeg", content_type="image/jpeg")
+        response, callbacks = self.create(image=image)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["status"], Post.PROCESSING)
+        status_url = f"/post/{response.data['id']}/status/"
+        self.assertEqual(self.client.get(status_url).data["status"], Post.PROCESSING)
+
+        for callback in callbacks:
+            callback()
+        data = self.client.get(status_url).data
+        self.assertEqual(data["status"], Post.READY)
+        self.assertIn("local/", data["image"])
+        self.assertTrue(data["image"].endswith(".jpg"))
+
+    def test_post_without_media_is_created_ready(self):
+        with mock.patch("api.ingest.submit") as submit:
+            response, _ = self.create()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["status"], Post.READY)
+        submit.assert_not_called()
+
+    @override_settings(MEDIA_STORAGE_BACKEND="api.tests.FlakyStorage")
+    def test_transient_failures_are_retried(self):
+        FlakyStorage.calls = 0
+        response, callbacks = self.create(image=SimpleUploadedFile("a.jpg", b"x"))
+        for callback in callbacks:
+            callback()
+        self.assertEqual(Post.objects.get(pk=response.data["id"]).status, Post.READY)
+        self.assertEqual(FlakyStorage.calls, 2)
+
+    @override_settings(MEDIA_STORAGE_BACKEND="api.tests.BrokenStorage", MEDIA_INGEST_RETRIES=2)
+    def test_permanent_failure_is_reported(self):
+        response, callbacks = self.create(video=SimpleUploadedFile("clip.mov", b"x"))
+        for callback in callbacks:
+            callback()
+        data = self.client.get(f"/post/{response.data['id']}/status/").data
+        self.assertEqual(data["status"], Post.FAILED)
+        self.assertIn("upstream down", data["media_error"])
+
+    def test_status_gives_the_same_video_url_as_the_post(self):
+        response, callbacks = self.create(video=SimpleUploadedFile("clip.mov", b"x"))
+        for callback in callbacks:
+            callback()
+        status_video = self.client.get(f"/post/{response.data['id']}/status/").data["video"]
+        self.assertEqual(status_video, self.client.get(f"/post/{response.data['id']}/").data["video"])
+        self.assertTrue(status_video.endswith(".mp4"))
+
+    def test_worker_errors_are_logged_and_fail_the_post(self):
+        response, _ = self.create(image=SimpleUploadedFile("a.jpg", b"x"))
+        with mock.patch.object(ingest, "process", side_effect=OperationalError("gone away")), \
+                mock.patch.object(ingest.connections, "close_all"), self.assertLogs("api.ingest", "ERROR"):
+            ingest._run_in_worker(response.data["id"], {})
+        post = Post.objects.get(pk=response.data["id"])
+        self.assertEqual((post.status, post.media_error), (Post.FAILED, "gone away"))
+
+    def test_upload_already_on_disk_is_moved_not_copied(self):
+        upload = TemporaryUploadedFile("clip.mov", "video/quicktime", 5, None)
+        upload.write(b"video")
+        upload.seek(0)
+        temporary = upload.temporary_file_path()
+        path = ingest.stage(upload, 7, "video")
+        upload.close()
+        self.assertFalse(os.path.exists(temporary))
+        self.assertEqual(os.path.basename(path), "7-video.mov")
+        with open(path, "rb") as staged:
+            self.assertEqual(staged.read(), b"video")
+
+    def test_recovery_resumes_staged_jobs_and_fails_lost_ones(self):
+        # both requests returned, then the process died before its pool ran the jobs
+        kept, _ = self.create(image=SimpleUploadedFile("a.jpg", b"x"))
+        lost, _ = self.create(video=SimpleUploadedFile("b.mov", b"y"))
+        os.remove(ingest.staged_files()[lost.data["id"]]["video"])
+        out = StringIO()
+        call_command("recover_media_ingest", stdout=out)
+        self.assertIn("1 resumed, 1 failed", out.getvalue())
+        self.assertEqual(Post.objects.get(pk=kept.data["id"]).status, Post.READY)
+        self.assertEqual(Post.objects.get(pk=lost.data["id"]).status, Post.FAILED)
+        self.assertEqual(ingest.staged_files(), {})
+
+
+class ViewerStateTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.viewer = make_user("viewer")
+        self.author = make_user("author")
+        self.liked = Post.objects.create(author=self.author, content="liked")
+        self.other = Post.objects.create(author=make_user("stranger"), content="not liked")
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+        self.client.post(f"/postlikes/{self.liked.id}/")
+        self.client.post("/follow/", {"following": self.author.id})
+
+    def test_post_list_flags(self):
+        rows = {row["id"]: row for row in self.client.get("/posts/").data}
+        self.assertEqual(
+            (rows[self.liked.id]["liked_by_me"], rows[self.liked.id]["author_followed_by_me"]), (True, True)
+        )
+        self.assertEqual(
+            (rows[self.other.id]["liked_by_me"], rows[self.other.id]["author_followed_by_me"]), (False, False)
+        )
+        self.assertEqual(rows[self.liked.id]["like_count"], 1)
+
+    def test_detail_flags_are_per_viewer(self):
+        url = f"/post/{self.liked.id}/"
+        self.assertTrue(self.client.get(url).data["liked_by_me"])
+        # same cached body, different viewer
+        self.assertFalse(APIClient().get(url).data["liked_by_me"])
+
+    def test_detail_etag_changes_when_viewer_unlikes(self):
+        url = f"/post/{self.liked.id}/"
+        etag = self.client.get(url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/postlikes/{self.liked.id}/")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data["liked_by_me"])
+
+    def test_bulk_like_state(self):
+        response = self.client.get(f"/postlikes/state/?ids={self.liked.id},{self.other.id}")
+        self.assertEqual(
+            response.data[str(self.liked.id)], {"id": self.liked.id, "like_count": 1, "liked_by_me": True}
+        )
+        self.assertFalse(response.data[str(self.other.id)]["liked_by_me"])
+
+    def test_bulk_like_state_validates_ids(self):
+        self.assertEqual(self.client.get("/postlikes/state/?ids=1,abc").status_code, 400)
+        too_many = ",".join(str(i) for i in range(101))
+        self.assertEqual(self.client.get(f"/postlikes/state/?ids={too_many}").status_code, 400)
+
+
+class PinKeyTests(SimpleTestCase):
+    def test_bearer_token_identifies_the_user(self):
+        token = AccessToken()
+        token["user_id"] = 42
+        request = RequestFactory().get("/posts/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(routers.pin_key(request), "db-pin:user:42")
+
+    def test_invalid_token_is_anonymous(self):
+        request = RequestFactory().get("/posts/", HTTP_AUTHORIZATION="Bearer garbage")
+        self.assertIsNone(routers.pin_key(request))
+
+    def test_session_cookie_without_token(self):
+        request = RequestFactory().get("/posts/")
+        self.assertIsNone(routers.pin_key(request))
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = "abc"
+        self.assertEqual(routers.pin_key(request), "db-pin:session:abc")
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTests(ApiTestCase):
+    """The replica is a separate in-memory database here, its rows say where a read went"""
+
+    @classmethod
+    def setUpClass(cls):
+        # registered here rather than in the settings, so the test runner and
+        # the shipped DATABASES never need a 'replica' alias
+        connections.settings["replica"] = connections.configure_settings({
+            "default": connections.settings["default"],
+            "replica": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"},
+        })["replica"]
+        call_command("migrate", database="replica", verbosity=0)
+        cls.databases = {"default", "replica"}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections["replica"].close()
+        del connections["replica"]
+        del connections.settings["replica"]
+
+    def setUp(self):
+        super().setUp()
+        routers._down.clear()
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.post = Post.objects.create(author=self.alice, content="primary")
+        CustomUser.objects.using("replica").bulk_create([self.copy(self.alice), self.copy(self.bob)])
+        Post.objects.using("replica").bulk_create([Post(id=self.post.id, author_id=self.alice.id, content="replica")])
+
+    @staticmethod
+    def copy(instance):
+        return type(instance)(**{field.attname: getattr(instance, field.attname)
+                                 for field in instance._meta.concrete_fields})
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+        return client
+
+    def read(self, user, url=None):
+        # a cursor skips the list cache; this one is past every post
+        url = url or "/posts/?cursor=" + encode_cursor(timezone.now() + timedelta(days=1), 0)
+        response = self.client_for(user).get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data[0]["content"]
+
+    def test_get_reads_from_replica(self):
+        self.assertEqual(self.read(self.alice), "replica")
+
+    def test_writer_reads_own_writes_from_primary(self):
+        response = self.client_for(self.alice).post("/follow/", {"following": self.bob.id})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.read(self.alice), "primary")
+        self.assertEqual(self.read(self.bob), "replica")
+
+    @override_settings(REPLICA_PIN_SECONDS=0)
+    def test_pin_expires(self):
+        self.client_for(self.alice).post("/follow/", {"following": self.bob.id})
+        self.assertEqual(self.read(self.alice), "replica")
+
+    def test_shared_caches_are_filled_from_primary(self):
+        self.assertEqual(self.read(self.alice, "/posts/"), "primary")
+
+    def test_outside_requests_use_primary(self):
+        self.assertEqual(Post.objects.get(pk=self.post.id).content, "primary")
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        with mock.patch.object(connections["replica"], "ensure_connection", side_effect=OperationalError("down")):
+            with self.assertLogs("api.routers", "WARNING"):
+                self.assertEqual(self.read(self.alice), "primary")
+            # skipped without another connection attempt until REPLICA_RETRY_SECONDS pass
+            self.assertEqual(self.read(self.alice), "primary")
+            self.assertEqual(connections["replica"].ensure_connection.call_count, 1)
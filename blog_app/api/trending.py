@@ -0,0 +1,146 @@
+"""
+Trending posts for /explore/, from exponentially decayed like/comment activity.
+
+A post's trend is the sum of its events' weights, each halving every
+HALF_LIFE. Stored as is, every score would have to be decayed on every
+tick. Instead TrendingPost.score holds
+
+    ln( sum of weight * 2 ** ((event time - EPOCH) / HALF_LIFE) )
+
+Decay multiplies every post's sum by the same factor, so ranking by this
+column ranks by current trend at any moment, and an event only adds its own
+term: score = logaddexp(score, ln(weight) + (t - EPOCH) / HALF_LIFE * ln 2),
+one UPDATE on one row. Working in logs keeps the growing exponent from ever
+overflowing. Removing a like or comment subtracts its term again.
+
+/explore/ pages through the (score, post) index with keyset cursors, so a
+page costs the same whether posts have ten likes or ten million. Posts whose
+trend decays below MIN_WEIGHT drop off the endpoint, and
+`rebuild_trending --prune` deletes their rows so the table only holds posts
+with recent activity.
+"""
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.utils import timezone
+
+from .models import Comment, Likes, TrendingPost
+
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+HALF_LIFE = timedelta(hours=12)
+LIKE_WEIGHT = 1.0
+COMMENT_WEIGHT = 3.0
+# trend below which a post drops off /explore/ (about a week after a single like)
+MIN_WEIGHT = 2.0 ** -14
+# score of a row with nothing left in it; logaddexp(FLOOR, x) == x
+FLOOR = -1e9
+# a removal leaving less than about this fraction of the row's trend empties
+# it, rather than taking the log of a rounding error (or of a negative number)
+_EMPTY = 1e-9
+# events this many half-lives old are worth 2 ** -64 of a fresh one, so even
+# 10 ** 15 of them stay under MIN_WEIGHT; rebuild reads nothing older
+REBUILD_HALF_LIVES = 64
+
+
+def term(weight, at):
+    """An event's contribution to score, in the log space described above"""
+    return math.log(weight) + (at - EPOCH) / HALF_LIFE * math.log(2)
+
+
+def _logaddexp(a, b):
+    return max(a, b) + math.log1p(math.exp(-abs(a - b)))
+
+
+def threshold(now=None):
+    """Score equivalent to a trend of MIN_WEIGHT at now"""
+    return term(MIN_WEIGHT, now or timezone.now())
+
+
+def _add(post_id, x):
+    # the row starts out empty, so racing events only ever add to it
+    TrendingPost.objects.bulk_create([TrendingPost(post_id=post_id, score=FLOOR)], ignore_conflicts=True)
+    score = F("score")
+    TrendingPost.objects.filter(post_id=post_id).update(
+        score=Greatest(score, Value(x)) + Ln(1 + Exp(-Abs(score - Value(x))))
+    )
+
+
+def _remove(post_id, x):
+    score = F("score")
+    rows = TrendingPost.objects.filter(post_id=post_id)
+    rows.update(score=Case(
+        When(score__gt=x + _EMPTY, then=score + Ln(1 - Exp(Value(x) - score))),
+        default=Value(FLOOR),
+    ))
+    rows.filter(score__lte=FLOOR).delete()
+
+
+def like_added(post_id, at):
+    _add(post_id, term(LIKE_WEIGHT, at))
+
+
+def like_removed(post_id, at):
+    """at is when the like was made, its term is taken back out"""
+    _remove(post_id, term(LIKE_WEIGHT, at))
+
+
+def _remove_all(weight, events):
+    # the terms of one post add up in log space, so each post takes one UPDATE
+    sums = {}
+    for post_id, at in events:
+        x = term(weight, at)
+        sums[post_id] = x if post_id not in sums else _logaddexp(sums[post_id], x)
+    for post_id, x in sums.items():
+        _remove(post_id, x)
+
+
+def likes_removed(events):
+    """like_removed for many (post_id, at) pairs"""
+    _remove_all(LIKE_WEIGHT, events)
+
+
+def comment_added(post_id, at):
+    _add(post_id, term(COMMENT_WEIGHT, at))
+
+
+def comment_removed(post_id, at):
+    _remove(post_id, term(COMMENT_WEIGHT, at))
+
+
+def comments_removed(events):
+    """comment_removed for many (post_id, at) pairs"""
+    _remove_all(COMMENT_WEIGHT, events)
+
+
+def ranked():
+    """{"post_id", "score"} rows, trendiest first, for SearchPagination-style keyset paging"""
+    return TrendingPost.objects.filter(score__gt=threshold()).values("post_id", "score")
+
+
+def prune(now=None):
+    """Delete rows that decayed below MIN_WEIGHT, the number deleted"""
+    deleted, _ = TrendingPost.objects.filter(score__lte=threshold(now)).delete()
+    return deleted
+
+
+def rebuild(now=None, batch_size=1000):
+    """Recompute every score from the recent likes and comments, the number of posts kept"""
+    now = now or timezone.now()
+    since = now - HALF_LIFE * REBUILD_HALF_LIVES
+    sums = {}
+    for model, weight in ((Likes, LIKE_WEIGHT), (Comment, COMMENT_WEIGHT)):
+        rows = model.objects.filter(created_at__gte=since, post__deleted_at__isnull=True).values_list(
+            "post_id", "created_at"
+        )
+        for post_id, at in rows.iterator(chunk_size=batch_size):
+            x = term(weight, at)
+            sums[post_id] = x if post_id not in sums else _logaddexp(sums[post_id], x)
+    cutoff = threshold(now)
+    kept = [TrendingPost(post_id=post_id, score=score) for post_id, score in sums.items() if score > cutoff]
+    with transaction.atomic():
+        TrendingPost.objects.all().delete()
+        TrendingPost.objects.bulk_create(kept, batch_size=batch_size)
+    return len(kept)
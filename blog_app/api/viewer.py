@@ -0,0 +1,80 @@
+"""
+Per-viewer flags for post lists (liked_by_me, author_followed_by_me).
+
+Looked up once per page: a single UNION query over the viewer's Likes for
+the page's posts and Follows for the page's authors, instead of one query per
+post card.
+"""
+from django.db.models import Value
+
+from .models import Follow, Likes
+
+
+class ViewerState:
+    def __init__(self, liked_post_ids=(), followed_author_ids=()):
+        self.liked_post_ids = set(liked_post_ids)
+        self.followed_author_ids = set(followed_author_ids)
+
+    def liked(self, post_id):
+        return post_id in self.liked_post_ids
+
+    def follows(self, author_id):
+        return author_id in self.followed_author_ids
+
+
+def _state_rows(user, post_ids, author_ids):
+    likes = (
+        Likes.objects.filter(user=user, post_id__in=post_ids)
+        .annotate(kind=Value("like"))
+        .values_list("kind", "post_id")
+    )
+    follows = (
+        Follow.objects.filter(follower=user, followed_id__in=author_ids)
+        .annotate(kind=Value("follow"))
+        .values_list("kind", "followed_id")
+    )
+    return likes.union(follows, all=True)
+
+
+def _add(state, kind, pk):
+    if kind == "like":
+        state.liked_post_ids.add(pk)
+    else:
+        state.followed_author_ids.add(pk)
+
+
+def viewer_state(user, post_ids, author_ids):
+    state = ViewerState()
+    if not post_ids or user is None or not user.is_authenticated:
+        return state
+    for kind, pk in _state_rows(user, post_ids, author_ids):
+        _add(state, kind, pk)
+    return state
+
+
+async def aviewer_state(user, post_ids, author_ids):
+    """viewer_state on the async ORM"""
+    state = ViewerState()
+    if not post_ids or user is None or not user.is_authenticated:
+        return state
+    async for kind, pk in _state_rows(user, post_ids, author_ids):
+        _add(state, kind, pk)
+    return state
+
+
+def viewer_state_for_posts(user, posts):
+    posts = list(posts)
+    return viewer_state(user, [post.id for post in posts], {post.author_id for post in posts})
+
+
+async def aviewer_state_for_posts(user, posts):
+    return await aviewer_state(user, [post.id for post in posts], {post.author_id for post in posts})
+
+
+def viewer_state_for_rows(user, rows):
+    """viewer_state for a page of {"id", "author_id", ...} post rows (api/fastpath.py)"""
+    return viewer_state(user, [row["id"] for row in rows], {row["author_id"] for row in rows})
+
+
+async def aviewer_state_for_rows(user, rows):
+    return await aviewer_state(user, [row["id"] for row in rows], {row["author_id"] for row in rows})
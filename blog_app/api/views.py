@@ -1,26 +1,56 @@
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
-from .serializers import FollowSerializer, PostSerializer,CommentSerializer,LikesSerializer,UserSerializers,PostCreateSerializer
+from .serializers import PostSerializer,CommentSerializer,UserSerializers,PostCreateSerializer,PostStatusSerializer,LikeStateSerializer,ThreadCommentSerializer,SuggestedUserSerializer,UserDirectorySerializer
 from rest_framework.views import  APIView
 from rest_framework.viewsets import ModelViewSet
-from .models import Post,Comment,Likes,CustomUser,Follow
+from .models import Post,Comment,CustomUser
 from rest_framework import status
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from rest_framework import generics
 from rest_framework.permissions import (AllowAny,IsAdminUser,IsAuthenticated)
-from rest_framework.pagination import PageNumberPagination
-from django.db.models import Q
+from django.db import router, transaction
 from rest_framework import viewsets
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+from . import comments, counters, deletion, directory, export, fastpath, feed, relations, search, suggestions, trending
+from .caching import PostListCache, PostValidators
+from .renderers import FastJSONRenderer
+from .viewer import ViewerState, viewer_state, viewer_state_for_rows
+from .pagination import KeysetPagination, SearchPagination, TrendingPagination, decode_cursor, encode_cursor
 
 class PostApiView(APIView):
+    # list pages are built by api/fastpath.py, written out by orjson when available
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
     def get(self, request):
-        posts = Post.objects.all().order_by('-created_at')
+        posts = fastpath.post_rows(Post.objects.order_by('-created_at', '-id'))
         author = request.query_params.get('author')
         if author:
             posts = posts.filter(author__username=author)
-        paginator = PageNumberPagination()
-        result_page = paginator.paginate_queryset(posts, request)
-        serializer = PostSerializer(result_page, many=True, context={'request': request})
-        return Response(serializer.data)
+        previews = comments.preview_count(request)
+        paginator = KeysetPagination()
+        if not PostListCache.cacheable(request):
+            rows = paginator.paginate_queryset(posts, request)
+            data = fastpath.post_data(rows, viewer_state_for_rows(request.user, rows),
+                                      fastpath.preview_rows(rows, previews))
+            return Response(data, headers=paginator.get_link_header())
+        listing = PostListCache(author, previews)
+
+        def render():
+            # rendered for nobody like the detail cache, viewer flags go on top;
+            # the page's stamps are read before its rows (see PostListCache.stamp)
+            # first_page: ?page=1 is the same page as no cursor
+            stamps = listing.stamp(KeysetPagination().first_page(posts.values("id", "author_id")))
+            rows = paginator.first_page(posts)
+            data = fastpath.post_data(rows, ViewerState(), fastpath.preview_rows(rows, previews))
+            return listing.entry(rows, data, paginator, stamps)
+
+        entry = listing.get_or_render(render)
+        viewer = viewer_state(request.user, [post['id'] for post in entry['data']], entry['authors'])
+        return Response(listing.with_viewer(entry, viewer), headers=listing.link_header(entry, request))
     
     def post(self, request):
         # Debug: Print what we're receiving from frontend
@@ -34,6 +64,9 @@ class PostApiView(APIView):
          
             # Use PostSerializer     for response
             response_serializer = PostSerializer(new_post, context={'request': request})
+            # media still uploading: accepted, poll post/<pk>/status/
+            if new_post.status == Post.PROCESSING:
+                return Response(response_serializer.data, status=status.HTTP_202_ACCEPTED)
            
             return Response(response_serializer.data, status=status.HTTP_201_CREATED)
         else:
@@ -47,12 +80,29 @@ class PostApiView(APIView):
 
 class PostDetailApi(APIView):
     def get(self,request,pk):
-        post=get_object_or_404(Post,pk=pk)
-        serializers=PostSerializer(post,context={"request":request})
-        return Response(serializers.data,status=status.HTTP_200_OK)
+        # validators come from the narrow (author_id, updated_at) row, the full
+        # post is only loaded and serialized on a cache miss
+        meta=Post.objects.filter(pk=pk).values("author_id","updated_at").first()
+        if meta is None:
+            raise Http404
+        validators=PostValidators(pk,meta["author_id"],meta["updated_at"],request.user.id)
+        not_modified=validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+
+        def render():
+            # rendered for nobody, so the cached copy can be shared between viewers
+            post=get_object_or_404(Post.objects.select_related("author"),pk=pk)
+            return PostSerializer(post,context={"viewer_state":ViewerState()}).data
+
+        data=dict(validators.get_or_render(render))
+        viewer=viewer_state(request.user,[pk],[meta["author_id"]])
+        data["liked_by_me"]=viewer.liked(pk)
+        data["author_followed_by_me"]=viewer.follows(meta["author_id"])
+        return validators.add_headers(Response(data,status=status.HTTP_200_OK))
     def put(self,request,pk):
-        post = get_object_or_404(Post,pk=pk)
-        if post.author!=request.user:
+        post = get_object_or_404(Post.objects.select_related("author"),pk=pk)
+        if post.author_id!=request.user.id:
             return Response({"error":"You don't have permissions to edit this post"},
                             status=status.HTTP_403_FORBIDDEN)
         serializer=PostSerializer(post,data=request.data,partial=True,context={"request":request})
@@ -61,58 +111,131 @@ class PostDetailApi(APIView):
             return Response(serializer.data,status=status.HTTP_200_OK)
         return Response(serializer.errors,status=status.HTTP_400_BAD_REQUEST)
     def delete(self,request,pk):
-        post=get_object_or_404(Post,pk=pk)
-        if post.author!=request.user:
+        post=get_object_or_404(Post.objects.only("id","author_id"),pk=pk)
+        if post.author_id!=request.user.id:
            return Response({"error":"You don't have permissions to delete  this post"},
                             status=status.HTTP_403_FORBIDDEN)            
-        post.delete()
+        # hidden now, its likes and comments are removed in the background
+        deletion.delete_post(post)
         return Response(status=status.HTTP_204_NO_CONTENT)        
 
 
 
+class PostPageView(APIView):
+    """
+    What the post page shows in one response: the post with the viewer's
+    like/follow flags, and the first page of its comments with their authors'
+    usernames and avatars. The next page continues at post/<pk>/comments/.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, pk):
+        # one transaction, so on MySQL (REPEATABLE READ) all three reads see one
+        # snapshot; nothing is written, so there is nothing to roll back to
+        with transaction.atomic(using=router.db_for_read(Post), savepoint=False):
+            post = get_object_or_404(Post.objects.select_related("author"), pk=pk)
+            paginator = KeysetPagination()
+            thread = paginator.first_page(comments.thread(pk))
+            viewer = viewer_state(request.user, [post.id], [post.author_id])
+        next_link = None
+        cursor = paginator.next_cursor()
+        if cursor is not None:
+            next_link = replace_query_param(request.build_absolute_uri(reverse("post-comments", args=[pk])), "cursor", cursor)
+        return Response({
+            "post": PostSerializer(post, context={"viewer_state": viewer}).data,
+            "comments": {"next": next_link, "results": ThreadCommentSerializer(thread, many=True).data},
+        })
+
+
+class PostStatusView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self,request,pk):
+        post=get_object_or_404(Post.objects.only("id","status","media_error","image","video"),pk=pk)
+        return Response(PostStatusSerializer(post).data)
+
+
 class PostSearchView(generics.ListAPIView):
     serializer_class = PostSerializer
     permission_classes = [AllowAny]
-    pagination_class = PageNumberPagination
+    pagination_class = SearchPagination
+
+    def get_queryset(self):
+        # relevance-ranked {"post_id", "score"} rows, see api/search.py
+        return search.search_posts(self.request.query_params.get('q', ''))
+
+    def list(self, request, *args, **kwargs):
+        rows = self.paginate_queryset(self.get_queryset())
+        posts = Post.objects.select_related('author').in_bulk([row["post_id"] for row in rows])
+        posts = [posts[row["post_id"]] for row in rows if row["post_id"] in posts]
+        serializer = self.get_serializer(posts, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class ExploreView(PostSearchView):
+    """Trending posts, ranked by time-decayed like/comment activity (api/trending.py)"""
+    pagination_class = TrendingPagination
 
     def get_queryset(self):
-        query = self.request.query_params.get('q', '')
-        if query:
-            return Post.objects.filter(
-                Q(content__icontains=query) | 
-                Q(author__username__icontains=query)
-            ).order_by('-created_at')
-        return Post.objects.none()
+        return trending.ranked()
 
 
 class CommentsApiView(APIView):
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
     def get_permissions(self):
         self.permission_classes=[AllowAny]
         if self.request.method=="POST":
             self.permission_classes=[IsAuthenticated]
         return super().get_permissions()
     def get(self,request):
-        data=Comment.objects.all().order_by("-created_at")
         # getting the post id from the url 
         post_id=request.query_params.get("post")
-        if post_id:
-            data=data.filter(post_id=post_id)
-        data=data.order_by("-created_at")
-        paginator=PageNumberPagination()
-        result_page=paginator.paginate_queryset(data,request)
-        serializer=CommentSerializer(result_page,many=True)
-        return Response(serializer.data)
+        data=comments.thread(post_id) if post_id else comments.recent()
+        paginator=KeysetPagination()
+        rows=paginator.paginate_queryset(fastpath.comment_rows(data),request)
+        return Response(fastpath.comment_data(rows),headers=paginator.get_link_header())
     def post(self,request):
         serializer=CommentSerializer(data=request.data,context={"request":request})
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                comment=serializer.save()
+                counters.comment_added(comment.post_id)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
        
 
+class PostCommentsView(APIView):
+    """One post's comment thread, newest first with cursor paging, and replies to it"""
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get_permissions(self):
+        self.permission_classes = [AllowAny]
+        if self.request.method == "POST":
+            self.permission_classes = [IsAuthenticated]
+        return super().get_permissions()
+
+    def get(self, request, pk):
+        paginator = KeysetPagination()
+        rows = paginator.paginate_queryset(fastpath.comment_rows(comments.thread(pk)), request)
+        # an empty first page is the only case that needs to know whether the post exists
+        if not rows and not request.query_params.get("cursor") and not Post.objects.filter(pk=pk).exists():
+            raise Http404
+        return paginator.get_paginated_response(fastpath.comment_data(rows))
+
+    def post(self, request, pk):
+        serializer = CommentSerializer(data={"post": pk, "message": request.data.get("message")},
+                                       context={"request": request})
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            comment = serializer.save()
+            counters.comment_added(comment.post_id)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
 class CommentUpdateDestroyApiView(APIView):
     def put(self,request,pk):
-        data=get_object_or_404(Comment,pk=pk)
+        data=get_object_or_404(Comment.objects.select_related("user"),pk=pk)
         serializer=CommentSerializer(instance=data,data=request.data,partial=True,context={"request":request})
         if serializer.is_valid():
             serializer.save()
@@ -121,36 +244,71 @@ class CommentUpdateDestroyApiView(APIView):
     
     def delete(self,request,pk):
         comment=get_object_or_404(Comment,pk=pk)
-        if comment.user!=request.user:
+        if comment.user_id!=request.user.id:
             return Response({"error":"You dont have permissions to delete this comment "})
         else:
-            comment.delete()
+            with transaction.atomic():
+                comment.delete()
+                counters.comment_removed(comment.post_id)
             return Response({"message":"comment deleted successfully"},status=status.HTTP_200_OK)
 
        
 class PostLikeListView(APIView):
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
     def get(self,request,pk):
-        post=get_object_or_404(Post,pk=pk)
-        likes=post.likes.all()
-        serializer=LikesSerializer(likes,many=True,context={"request":request})
-        return Response(serializer.data)
+        # every like renders str(post), which reads post.author
+        post=get_object_or_404(Post.objects.select_related("author").only("id","content","author__username"),pk=pk)
+        likes=fastpath.like_rows(post.likes.filter(user__deleted_at__isnull=True).order_by("-created_at","-id"))
+        return Response(fastpath.like_data(likes,post))
     def post(self, request, pk):
         """Toggle like for a post"""
         if not request.user.is_authenticated:
             return Response({"error": "Authentication required"}, status=status.HTTP_401_UNAUTHORIZED)
         
-        post = get_object_or_404(Post, pk=pk)
-        like, created = Likes.objects.get_or_create(user=request.user, post=post)
-        
-        if not created:
-            # Unlike if already liked
-            like.delete()
-            return Response({"message": "Post unliked"}, status=status.HTTP_200_OK)
-        
-        return Response({"message": "Post liked"}, status=status.HTTP_201_CREATED)
+        post = get_object_or_404(Post.objects.only("id"), pk=pk)
+        if relations.toggle_like(request.user.id, post.id):
+            return Response({"message": "Post liked"}, status=status.HTTP_201_CREATED)
+        return Response({"message": "Post unliked"}, status=status.HTTP_200_OK)
+
+    def put(self, request, pk):
+        """Like a post, a no-op if it is already liked"""
+        if not request.user.is_authenticated:
+            return Response({"error": "Authentication required"}, status=status.HTTP_401_UNAUTHORIZED)
+        post = get_object_or_404(Post.objects.only("id"), pk=pk)
+        if relations.like(request.user.id, post.id):
+            return Response({"message": "Post liked"}, status=status.HTTP_201_CREATED)
+        return Response({"message": "Post already liked"}, status=status.HTTP_200_OK)
+
+    def delete(self, request, pk):
+        """Unlike a post, a no-op if it isn't liked"""
+        if not request.user.is_authenticated:
+            return Response({"error": "Authentication required"}, status=status.HTTP_401_UNAUTHORIZED)
+        relations.unlike(request.user.id, pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)
         
         
         
+class PostLikeStateView(APIView):
+    """Like state for many posts at once: postlikes/state/?ids=1,2,3"""
+    permission_classes = [AllowAny]
+    max_ids = 100
+
+    def get(self, request):
+        try:
+            ids = [int(pk) for pk in request.query_params.get("ids", "").split(",") if pk.strip()]
+        except ValueError:
+            return Response({"error": "ids must be a comma separated list of post ids"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > self.max_ids:
+            return Response({"error": f"at most {self.max_ids} ids per request"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        posts = Post.objects.filter(id__in=ids).only("id", "author_id", "like_count")
+        state = viewer_state(request.user, ids, [])
+        serializer = LikeStateSerializer(posts, many=True, context={"viewer_state": state})
+        return Response({str(row["id"]): row for row in serializer.data})
+
+
 class RegisterView(generics.CreateAPIView):
     queryset=CustomUser.objects.all()
     serializer_class =UserSerializers
@@ -158,17 +316,82 @@ class RegisterView(generics.CreateAPIView):
 
 
 class UserListView(generics.ListAPIView):
-    queryset = CustomUser.objects.all()
+    # ordered so LimitOffsetPagination pages are stable; use users/directory/ to find someone
+    queryset = CustomUser.objects.filter(deleted_at__isnull=True).order_by("id")
     serializer_class = UserSerializers
     permission_classes = [AllowAny]
 
 
+class UserDirectoryView(APIView):
+    """Prefix lookup for @-mention autocomplete and profile search: ?q=&after=&limit="""
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        parsed = directory.parse_query(request.query_params.get("q"), emails=request.user.is_authenticated)
+        if parsed is None:
+            return Response({"next": None, "results": []})
+        field, query = parsed
+        try:
+            limit = min(max(int(request.query_params.get("limit", api_settings.PAGE_SIZE)), 1), directory.MAX_LIMIT)
+        except ValueError:
+            return Response({"error": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+        after = request.query_params.get("after") if field == "username" else None
+        users = directory.lookup(field, query, directory.decode_after(after) if after else None, limit + 1)
+        next_url = None
+        if len(users) > limit and field == "username":
+            last = users[limit - 1]
+            next_url = replace_query_param(request.build_absolute_uri(), "after", directory.encode_after(last.key, last.id))
+        serializer = UserDirectorySerializer(users[:limit], many=True)
+        return Response({"next": next_url, "results": serializer.data})
+
+
+class SuggestedUsersView(APIView):
+    """Friends of friends ranked by mutual follows and recent activity, ?page=N"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            page = max(int(request.query_params.get("page", 1)), 1)
+        except ValueError:
+            return Response({"error": "page must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+        page_size = api_settings.PAGE_SIZE
+        candidates = suggestions.ranked(request.user)
+        start = (page - 1) * page_size
+        next_url = None
+        if len(candidates) > start + page_size:
+            next_url = replace_query_param(request.build_absolute_uri(), "page", page + 1)
+        serializer = SuggestedUserSerializer(candidates[start:start + page_size], many=True)
+        return Response({"next": next_url, "results": serializer.data})
+
+
 class CurrentUserView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
         serializer = UserSerializers(request.user)
         return Response(serializer.data)
+
+
+class ExportView(APIView):
+    """The current user's posts, comments, likes and follows, streamed in resumable pieces (api/export.py)"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        after = request.query_params.get("after")
+        if after:
+            # fail here with a 404, not halfway through a 200
+            export.decode_checkpoint(after)
+        as_zip = request.query_params.get("output") == "zip"
+        write = export.zip_archive if as_zip else export.ndjson
+        blocks = write(request.user.id, after, export.records_per_response())
+        if isinstance(request._request, ASGIRequest):
+            # a sync iterator would be read to the end into memory before sending
+            blocks = export.aiterate(blocks)
+        response = StreamingHttpResponse(blocks, content_type="application/zip" if as_zip else "application/x-ndjson")
+        filename = f"export-{request.user.id}.{'zip' if as_zip else 'ndjson'}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        response["Cache-Control"] = "private, no-store"
+        return response
     
 class FollowToggleView(APIView):
     def post(self,request):
@@ -185,10 +408,44 @@ class FollowToggleView(APIView):
         if follower.id == int(followed_id):
             return Response({"error": "you cant follow yourself"}, status=status.HTTP_400_BAD_REQUEST)
 
-        follow=Follow.objects.filter(follower=follower,followed_id=followed_id).first()
-        if follow:
-            follow.delete()
-            return Response({"message":"Unfollowed Successfully"},status=status.HTTP_200_OK)
-        
-        follow = Follow.objects.create(follower=follower, followed_id=followed_id)
-        return Response(FollowSerializer(follow).data, status=201)
+        if not CustomUser.objects.filter(pk=followed_id, deleted_at__isnull=True).exists():
+            return Response({"error": "user not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        if relations.toggle_follow(follower.id, followed_id):
+            return Response({"message": "Followed Successfully"}, status=status.HTTP_201_CREATED)
+        return Response({"message":"Unfollowed Successfully"},status=status.HTTP_200_OK)
+
+
+class FollowView(APIView):
+    """Idempotent follow (PUT) and unfollow (DELETE) of follow/<user_id>/"""
+    permission_classes = [IsAuthenticated]
+
+    def put(self, request, user_id):
+        if request.user.id == user_id:
+            return Response({"error": "you cant follow yourself"}, status=status.HTTP_400_BAD_REQUEST)
+        get_object_or_404(CustomUser.objects.only("id"), pk=user_id, deleted_at__isnull=True)
+        if relations.follow(request.user.id, user_id):
+            return Response({"message": "Followed Successfully"}, status=status.HTTP_201_CREATED)
+        return Response({"message": "Already following"}, status=status.HTTP_200_OK)
+
+    def delete(self, request, user_id):
+        relations.unfollow(request.user.id, user_id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+
+class FeedView(APIView):
+    """Posts from the people the current user follows, newest first"""
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request):
+        cursor = request.query_params.get("cursor")
+        cursor = decode_cursor(cursor) if cursor else None
+        rows, last, has_more = feed.read_feed(request.user, cursor, api_settings.PAGE_SIZE, fastpath.post_rows)
+        next_url = None
+        if has_more:
+            next_url = replace_query_param(request.build_absolute_uri(), "cursor", encode_cursor(*last))
+        data = fastpath.post_data(rows, viewer_state_for_rows(request.user, rows),
+                                  fastpath.preview_rows(rows, comments.preview_count(request)))
+        return Response({"next": next_url, "results": data})
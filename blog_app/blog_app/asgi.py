@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'blog_app.settings')
+# hot read endpoints as native async views (api/async_views.py)
+os.environ.setdefault('ROOT_URLCONF', 'blog_app.urls_async')
+# every request runs in its own thread, persistent connections would never be reused
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
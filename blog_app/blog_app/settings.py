@@ -1,4 +1,4 @@
-from decouple import config
+from decouple import Csv, config
 from pathlib import Path
 from datetime import timedelta  # Import timedelta
 
@@ -31,6 +31,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so its latency covers every other middleware
+    'api.metrics.MetricsMiddleware',
+    'api.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -41,7 +44,8 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'blog_app.urls'
+# asgi.py switches to blog_app.urls_async, which serves the hot reads natively async
+ROOT_URLCONF = config('ROOT_URLCONF', default='blog_app.urls')
 
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
@@ -76,7 +80,39 @@ DATABASES = {
         'PORT': '3306',
         'OPTIONS': {
             'sql_mode': 'traditional',
-        }
+        },
+        # keep connections open between requests, pinging a reused one before
+        # its first query; asgi.py turns this off (connections are per thread)
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+# read replicas (api/routers.py): GET requests read from one of these unless
+# the client wrote in the last REPLICA_PIN_SECONDS; tests use the primary
+DATABASE_REPLICAS = []
+for number, host in enumerate(config('DB_REPLICA_HOSTS', default='', cast=Csv()), 1):
+    DATABASES[f'replica{number}'] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['api.routers.PrimaryReplicaRouter']
+REPLICA_PIN_SECONDS = 5
+REPLICA_RETRY_SECONDS = 30
+
+# Cache for rendered posts, stamps and replica pins (api/caching.py,
+# api/routers.py). CACHE_BACKEND is "locmem" (per process), "file" (shared
+# by the workers of one host, under CACHE_LOCATION), "redis"/"memcached"
+# with CACHE_LOCATION as the server URL, or any dotted backend path
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem')
+CACHES = {
+    'default': {
+        'BACKEND': {
+            'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+            'file': 'django.core.cache.backends.filebased.FileBasedCache',
+            'redis': 'django.core.cache.backends.redis.RedisCache',
+            'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        }.get(CACHE_BACKEND, CACHE_BACKEND),
+        'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / 'cache') if CACHE_BACKEND == 'file' else ''),
+        # stamps never expire, keep them from being culled with the entries
+        'OPTIONS': {'MAX_ENTRIES': 100000} if CACHE_BACKEND in ('locmem', 'file') else {},
     }
 }
 
@@ -142,7 +178,8 @@ AUTH_USER_MODEL = "api.CustomUser"
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # simplejwt's JWTAuthentication with the user row cached (api/authentication.py)
+        'api.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
@@ -151,3 +188,57 @@ REST_FRAMEWORK = {
 
 }
 
+# Home feed: authors with more followers than this are pulled at read time
+# instead of being fanned out into every follower's timeline on write
+FEED_FANOUT_LIMIT = 5000
+# how many recent posts get copied into a timeline when you follow someone
+FEED_BACKFILL_SIZE = 50
+# new posts reach followers' timelines from a background pool after commit,
+# and follows/unfollows update timelines and suggestions from a single
+# background thread; EAGER runs both inline on commit instead (tests)
+FEED_FANOUT_WORKERS = 2
+FEED_FANOUT_EAGER = False
+# post/comment/search listings use keyset cursors; flip this to serve the
+# old ?page=N mode to every client (sending ?page=N also opts in per request)
+LEGACY_PAGE_PAGINATION = False
+# post search engine: "index" (portable inverted index), "fulltext" (MySQL
+# FULLTEXT) or "auto" to use fulltext on MySQL and the index elsewhere
+SEARCH_BACKEND = "auto"
+# entries in the in-process LRU of built Cloudinary URLs (api/media.py)
+MEDIA_URL_CACHE_SIZE = 50000
+# Post media ingestion (api/ingest.py): uploads run on a background pool
+# through a pluggable storage backend; api.storage.LocalStorage keeps files
+# under MEDIA_LOCAL_ROOT instead of sending them to Cloudinary
+MEDIA_STORAGE_BACKEND = "api.storage.CloudinaryStorage"
+MEDIA_INGEST_WORKERS = 4
+MEDIA_INGEST_RETRIES = 3
+MEDIA_INGEST_RETRY_DELAY = 1.0
+MEDIA_INGEST_EAGER = False
+# friend-of-friend suggestions (api/suggestions.py): accounts following or
+# followed by more than this are skipped when candidate counts are updated,
+# and each request ranks the top SUGGESTION_WINDOW candidates
+SUGGESTION_FANOUT_LIMIT = 5000
+SUGGESTION_WINDOW = 200
+# per-route latency/query histograms served at /metrics (api/metrics.py);
+# statements slower than METRICS_SLOW_QUERY_MS are logged with the serializer
+# field that ran them (None turns the log off). The scrape requires
+# "Authorization: Bearer <METRICS_TOKEN>"; with no token only INTERNAL_IPS
+# may read it (matched against REMOTE_ADDR, the proxy's address behind a
+# reverse proxy), and anyone may under DEBUG
+METRICS_ENABLED = True
+METRICS_SLOW_QUERY_MS = None
+METRICS_TOKEN = None
+INTERNAL_IPS = ["127.0.0.1", "::1"]
+# how long CachedJWTAuthentication keeps a user row; edits to the user take
+# effect at once regardless, through its version stamp
+AUTH_USER_CACHE_SECONDS = 60
+# account exports (api/export.py): rows read per query, and records per
+# response before it ends at a checkpoint the client resumes from
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_RECORDS_PER_RESPONSE = 100000
+# soft deletes (api/deletion.py): rows the background reaper removes per
+# transaction, seconds it sleeps between batches, and EAGER to reap inline on
+# commit (tests); reap_deletions finishes what a restart left pending
+DELETION_BATCH_SIZE = 1000
+DELETION_BATCH_PAUSE = 0.0
+DELETION_REAPER_EAGER = False
@@ -11,6 +11,7 @@ from rest_framework_simplejwt.views import (
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from api.metrics import metrics_view
 
 
 
@@ -28,16 +29,27 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path("posts/",PostApiView.as_view()),
     path("posts/search/",PostSearchView.as_view()),
+    path("explore/",ExploreView.as_view()),
+    path("feed/",FeedView.as_view()),
     path("post/<int:pk>/",PostDetailApi.as_view()),
+    path("post/<int:pk>/status/",PostStatusView.as_view()),
+    path("post/<int:pk>/page/",PostPageView.as_view()),
+    path("post/<int:pk>/comments/",PostCommentsView.as_view(),name="post-comments"),
     path("comments/",CommentsApiView.as_view()),
     path("comment/<int:pk>",CommentUpdateDestroyApiView.as_view()),
     path("postlikes/<int:pk>/",PostLikeListView.as_view()),
+    path("postlikes/state/",PostLikeStateView.as_view()),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path("register/",RegisterView.as_view()),
     path("users/", UserListView.as_view()),
+    path("users/suggested/", SuggestedUsersView.as_view()),
+    path("users/directory/", UserDirectoryView.as_view()),
     path("user/", CurrentUserView.as_view()),
+    path("user/export/", ExportView.as_view()),
     path("follow/",FollowToggleView.as_view()),
+    path("follow/<int:user_id>/",FollowView.as_view()),
+    path("metrics",metrics_view),
     re_path(r'^swagger/$', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     re_path(r'^redoc/$', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
 ]
@@ -0,0 +1,31 @@
+"""
+URLconf for the ASGI entry point (asgi.py selects it through ROOT_URLCONF).
+
+Same routes as blog_app/urls.py, except that the hot read endpoints answer
+GET with the native async handlers in api/async_views.py; every other
+method still reaches the DRF view.
+"""
+from django.urls import URLPattern, path
+
+from api import async_views
+
+from .urls import urlpatterns as sync_urlpatterns
+
+ASYNC_READS = {
+    "posts/": async_views.post_list,
+    "post/<int:pk>/": async_views.post_detail,
+    "post/<int:pk>/comments/": async_views.post_comments,
+    "comments/": async_views.comment_list,
+    "postlikes/<int:pk>/": async_views.post_likes,
+    "feed/": async_views.home_feed,
+}
+
+
+def _async_reads(pattern):
+    handler = ASYNC_READS.get(str(pattern.pattern)) if isinstance(pattern, URLPattern) else None
+    if handler is None:
+        return pattern
+    return path(str(pattern.pattern), async_views.read_view(pattern.callback, handler), name=pattern.name)
+
+
+urlpatterns = [_async_reads(pattern) for pattern in sync_urlpatterns]